@@ -7,13 +7,12 @@ import itertools
 import logging
 import mimetypes
 import os
-import re
 import textwrap
 from collections import OrderedDict, defaultdict
 
 import markdown
 
-from multiqc.utils import config, report, software_versions, util_functions
+from multiqc.utils import config, parse_cache, report, sample_names, software_versions, util_functions
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +22,9 @@ class ModuleNoSamplesFound(Exception):
 
 
 class BaseMultiqcModule(object):
+    # Set to True in modules that must run in the main MultiQC process (see --module-workers)
+    serial_only = False
+
     def __init__(
         self,
         name="base",
@@ -100,14 +102,16 @@ class BaseMultiqcModule(object):
 
         self.sections = list()
 
-    def find_log_files(self, sp_key, filecontents=True, filehandles=False):
+    def find_log_files(self, sp_key, filecontents=True, filehandles=False, lines=False):
         """
         Return matches log files of interest.
         :param sp_key: Search pattern key specified in config
         :param filehandles: Set to true to return a file handle instead of slurped file contents
+        :param lines: Set to true to return an iterator over the file lines (without line endings)
+                      instead of slurped file contents. Only one line is held in memory at a time.
         :return: Yields a dict with filename (fn), root directory (root), cleaned sample name
-                 generated from the filename (s_name) and either the file contents or file handle
-                 for the current matched file (f).
+                 generated from the filename (s_name) and either the file contents, file handle
+                 or line iterator for the current matched file (f).
                  As yield is used, the results can be iterated over without loading all files at once
         """
 
@@ -182,29 +186,71 @@ class BaseMultiqcModule(object):
             # Make a sample name from the filename
             f["sp_key"] = sp_key
             f["s_name"] = self.clean_s_name(f["fn"], f)
-            if filehandles or filecontents:
-                try:
-                    # Custom content module can now handle image files
-                    (ftype, encoding) = mimetypes.guess_type(os.path.join(f["root"], f["fn"]))
-                    if ftype is not None and ftype.startswith("image"):
-                        with io.open(os.path.join(f["root"], f["fn"]), "rb") as fh:
-                            # always return file handles
+            yield from self._read_log_file(f, filecontents, filehandles, lines)
+
+    def _read_log_file(self, f, filecontents=True, filehandles=False, lines=False):
+        """
+        Open a file found by find_log_files() and yield it with the file contents,
+        file handle or line iterator in f["f"]. Yields nothing if the file can't be read.
+        """
+        if filehandles or filecontents or lines:
+            try:
+                # Custom content module can now handle image files
+                (ftype, encoding) = mimetypes.guess_type(os.path.join(f["root"], f["fn"]))
+                if ftype is not None and ftype.startswith("image"):
+                    with io.open(os.path.join(f["root"], f["fn"]), "rb") as fh:
+                        # always return file handles
+                        f["f"] = fh
+                        yield f
+                elif lines and not filehandles:
+                    # Text files, decoded line by line
+                    with io.open(os.path.join(f["root"], f["fn"]), "rb") as fh:
+                        f["f"] = util_functions.iter_lines(fh)
+                        yield f
+                else:
+                    # Everything else - should be all text files
+                    with io.open(os.path.join(f["root"], f["fn"]), "r", encoding="utf-8") as fh:
+                        if filehandles:
                             f["f"] = fh
                             yield f
-                    else:
-                        # Everything else - should be all text files
-                        with io.open(os.path.join(f["root"], f["fn"]), "r", encoding="utf-8") as fh:
-                            if filehandles:
-                                f["f"] = fh
-                                yield f
-                            elif filecontents:
-                                f["f"] = fh.read()
-                                yield f
-                except (IOError, OSError, ValueError, UnicodeDecodeError) as e:
-                    logger.debug("Couldn't open filehandle when returning file: {}\n{}".format(f["fn"], e))
-                    f["f"] = None
-            else:
-                yield f
+                        elif filecontents:
+                            f["f"] = fh.read()
+                            yield f
+            except (IOError, OSError, ValueError, UnicodeDecodeError) as e:
+                logger.debug("Couldn't open filehandle when returning file: {}\n{}".format(f["fn"], e))
+                f["f"] = None
+        else:
+            yield f
+
+    def parse_log_files(self, sp_key, parse_file, filehandles=False, lines=False):
+        """
+        Find log files and parse each one with a function that takes a single file
+        (as yielded by find_log_files()) and returns a JSON-serialisable result.
+        With config.incremental, files that haven't changed since the previous run
+        with the same output directory are not read again and the previous result is used.
+        Results should not depend on the sample name, which can change with the config.
+        :param sp_key: Search pattern key specified in config
+        :param parse_file: Function to parse one file, eg. self.parse_mymod_log
+        :param filehandles: Set to true to pass parse_file a file handle instead of file contents
+        :param lines: Set to true to pass parse_file an iterator over the file lines
+        :return: Yields a tuple of the found file dict and the parse result for each file
+        """
+        group = "{}/{}/{}.{}".format(self.anchor, sp_key, parse_file.__module__, parse_file.__qualname__)
+        for f in self.find_log_files(sp_key, filecontents=False):
+            if config.incremental:
+                result, found = parse_cache.get(group, f)
+                if found:
+                    yield f, result
+                    continue
+            parsed = False
+            for f in self._read_log_file(f, True, filehandles, lines):
+                result = parse_file(f)
+                parsed = True
+            if not parsed:
+                continue
+            if config.incremental:
+                result = parse_cache.add(group, f, result)
+            yield f, result
 
     def add_section(
         self,
@@ -321,97 +367,8 @@ class BaseMultiqcModule(object):
         if root is None:
             root = ""
 
-        # if s_name comes from file contents, it may have a file path
-        # For consistency with other modules, we keep just the basename
-        s_name = os.path.basename(s_name)
-
-        # Prepend sample name with directory
-        if config.prepend_dirs:
-            sep = config.prepend_dirs_sep
-            root = root.lstrip(".{}".format(os.sep))
-            dirs = [d.strip() for d in root.split(os.sep) if d.strip() != ""]
-            if config.prepend_dirs_depth != 0:
-                d_idx = config.prepend_dirs_depth * -1
-                if config.prepend_dirs_depth > 0:
-                    dirs = dirs[d_idx:]
-                else:
-                    dirs = dirs[:d_idx]
-            if len(dirs) > 0:
-                s_name = "{}{}{}".format(sep.join(dirs), sep, s_name)
-
-        if config.fn_clean_sample_names:
-            # Split then take first section to remove everything after these matches
-            for ext in config.fn_clean_exts:
-                # Check if this config is limited to a module
-                if "module" in ext:
-                    if type(ext["module"]) is str:
-                        ext["module"] = [ext["module"]]
-                    if not any([m == self.anchor for m in ext["module"]]):
-                        continue
-
-                # Go through different filter types
-                if type(ext) is str:
-                    ext = {"type": "truncate", "pattern": ext}
-                if ext.get("type") == "truncate":
-                    s_name = s_name.split(ext["pattern"], 1)[0]
-                elif ext.get("type") in ("remove", "replace"):
-                    if ext["type"] == "replace":
-                        logger.warning(
-                            "use 'config.fn_clean_sample_names.remove' instead "
-                            "of 'config.fn_clean_sample_names.replace' [deprecated]"
-                        )
-                    s_name = s_name.replace(ext["pattern"], "")
-                elif ext.get("type") == "regex":
-                    s_name = re.sub(ext["pattern"], "", s_name)
-                elif ext.get("type") == "regex_keep":
-                    match = re.search(ext["pattern"], s_name)
-                    s_name = match.group() if match else s_name
-                elif ext.get("type") is None:
-                    logger.error('config.fn_clean_exts config was missing "type" key: {}'.format(ext))
-                else:
-                    logger.error("Unrecognised config.fn_clean_exts type: {}".format(ext.get("type")))
-            # Trim off characters at the end of names
-            for chrs in config.fn_clean_trim:
-                if s_name.endswith(chrs):
-                    s_name = s_name[: -len(chrs)]
-                if s_name.startswith(chrs):
-                    s_name = s_name[len(chrs) :]
-
-        # Remove trailing whitespace
-        s_name = s_name.strip()
-
-        # If we cleaned back to an empty string, just use the original value
-        if s_name == "":
-            s_name = s_name_original
-
-        # Do any hard replacements that are set with --replace-names
-        if config.sample_names_replace:
-            for s_name_search, s_name_replace in config.sample_names_replace.items():
-                try:
-                    # Skip if we're looking for exact matches only
-                    if config.sample_names_replace_exact:
-                        # Simple strings
-                        if not config.sample_names_replace_regex and s_name != s_name_search:
-                            continue
-                        # regexes
-                        if config.sample_names_replace_regex and not re.fullmatch(s_name_search, s_name):
-                            continue
-                    # Replace - regex
-                    if config.sample_names_replace_regex:
-                        s_name = re.sub(s_name_search, s_name_replace, s_name)
-                    # Replace - simple string
-                    else:
-                        # Complete name swap
-                        if config.sample_names_replace_complete:
-                            if s_name_search in s_name:
-                                s_name = s_name_replace
-                        # Partial substring replace
-                        else:
-                            s_name = s_name.replace(s_name_search, s_name_replace)
-                except re.error as e:
-                    logger.error("Error with sample name replacement regex: {}".format(e))
-
-        return s_name
+        # Cleaning rules are compiled when first used by the module, and cleaned names remembered
+        return sample_names.clean(self.anchor, s_name_original, s_name, root)
 
     def ignore_samples(self, data):
         """Strip out samples which match `sample_names_ignore`"""
@@ -431,9 +388,11 @@ class BaseMultiqcModule(object):
 
     def is_ignore_sample(self, s_name):
         """Should a sample name be ignored?"""
-        glob_match = any(fnmatch.fnmatch(s_name, sn) for sn in config.sample_names_ignore)
-        re_match = any(re.match(sn, s_name) for sn in config.sample_names_ignore_re)
-        return glob_match or re_match
+        rule = sample_names.ignore_rule(s_name)
+        if rule is None:
+            return False
+        report.ignored_samples[rule].add(s_name)
+        return True
 
     def general_stats_addcols(self, data, headers=None, namespace=None):
         """Helper function to add to the General Statistics variable.
@@ -548,7 +507,7 @@ class BaseMultiqcModule(object):
 
         # Save the file
         report.saved_raw_data[fn] = data
-        util_functions.write_data_file(data, fn, sort_cols, data_format)
+        return util_functions.write_data_file(data, fn, sort_cols, data_format)
 
     ##################################################
     #### DEPRECATED FORWARDERS
@@ -2,6 +2,8 @@
 
 
 import base64
+import functools
+import io
 import json
 import logging
 import os
@@ -18,6 +20,9 @@ from multiqc.utils import report
 # Initialise the logger
 log = logging.getLogger(__name__)
 
+# Number of lines from which csv / tsv files are read with pyarrow, if installed
+FAST_READER_MIN_LINES = 10000
+
 
 # Load YAML as an ordered dict
 # From https://stackoverflow.com/a/21912744
@@ -149,7 +154,8 @@ def custom_module_classes():
                 # txt, csv, tsv etc
                 else:
                     # Look for configuration details in the header
-                    m_config = _find_file_header(f)
+                    comment_lines, lines = _split_lines(f["f"])
+                    m_config = _find_file_header(f, comment_lines)
                     s_name = None
                     if m_config is not None:
                         c_id = m_config.get("id", k)
@@ -183,10 +189,10 @@ def custom_module_classes():
 
                     # Guess file format if not given
                     if m_config.get("file_format") is None:
-                        m_config["file_format"] = _guess_file_format(f)
+                        m_config["file_format"] = _guess_file_format(f, lines)
                     # Parse data
                     try:
-                        parsed_data, conf = _parse_txt(f, m_config)
+                        parsed_data, conf = _parse_txt(f, m_config, lines, len(comment_lines) + len(lines))
                         if parsed_data is None or len(parsed_data) == 0:
                             log.warning("Not able to parse custom data in {}".format(f["fn"]))
                         else:
@@ -294,6 +300,11 @@ def custom_module_classes():
     return sorted_modules
 
 
+# Custom content builds its modules from the config and the files found by other
+# search patterns, so always run it in the main process (see --module-workers)
+custom_module_classes.serial_only = True
+
+
 class MultiqcModule(BaseMultiqcModule):
     """Module class, used for each custom content type"""
 
@@ -424,12 +435,23 @@ class MultiqcModule(BaseMultiqcModule):
         self.add_section(name=section_name, anchor=c_id, description=section_description, plot=plot, content=content)
 
 
-def _find_file_header(f):
-    # Collect commented out header lines
-    hlines = []
-    for l in f["f"].splitlines():
+def _split_lines(contents):
+    """
+    Split the contents of a text file into commented out lines (without the #)
+    and all other lines, so that the file is only split once
+    """
+    comment_lines = []
+    lines = []
+    for l in contents.splitlines():
         if l.startswith("#"):
-            hlines.append(l[1:])
+            comment_lines.append(l[1:])
+        else:
+            lines.append(l)
+    return comment_lines, lines
+
+
+def _find_file_header(f, hlines):
+    # Parse the commented out header lines
     if len(hlines) == 0:
         return None
     hconfig = None
@@ -459,7 +481,7 @@ def _find_html_file_header(f):
     return {}
 
 
-def _guess_file_format(f):
+def _guess_file_format(f, lines):
     """
     Tries to guess file format, first based on file extension (csv / tsv),
     then by looking for common column separators in the first 10 non-commented lines.
@@ -473,14 +495,11 @@ def _guess_file_format(f):
     commas = []
     spaces = []
     j = 0
-    for l in f["f"].splitlines():
-        if not l.startswith("#"):
-            j += 1
-            tabs.append(len(l.split("\t")))
-            commas.append(len(l.split(",")))
-            spaces.append(len(l.split()))
-        if j == 10:
-            break
+    for l in lines[:10]:
+        j += 1
+        tabs.append(len(l.split("\t")))
+        commas.append(len(l.split(",")))
+        spaces.append(len(l.split()))
     tab_mode = max(set(tabs), key=tabs.count)
     commas_mode = max(set(commas), key=commas.count)
     spaces_mode = max(set(spaces), key=spaces.count)
@@ -507,87 +526,158 @@ def _guess_file_format(f):
     return "spaces"
 
 
-def _parse_txt(f, conf):
+@functools.lru_cache()
+def _pyarrow_csv():
+    """Import the pyarrow CSV reader, which is an optional dependency. Returns None if not installed"""
+    try:
+        import pyarrow.csv
+    except ImportError:
+        return None
+    return pyarrow.csv
+
+
+def _read_columns(lines, sep, ncols):
+    """
+    Read csv / tsv lines into columns of strings with the pyarrow CSV reader.
+    Quotes and empty values are kept as they are, so that the columns are the
+    same as when splitting each line. Returns None if the lines can't be read.
+    """
+    import pyarrow
+
+    pa_csv = _pyarrow_csv()
+    try:
+        table = pa_csv.read_csv(
+            io.BytesIO("\n".join(lines).encode("utf-8")),
+            read_options=pa_csv.ReadOptions(autogenerate_column_names=True),
+            parse_options=pa_csv.ParseOptions(delimiter=sep, quote_char=False, double_quote=False),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={"f{}".format(i): pyarrow.string() for i in range(ncols)},
+                null_values=[],
+                strings_can_be_null=False,
+            ),
+        )
+    except (pyarrow.ArrowException, UnicodeError) as e:
+        log.debug("Could not read custom content with pyarrow: {}".format(e))
+        return None
+    return [column.to_pylist() for column in table.columns]
+
+
+def _split_columns(lines, sep):
+    """
+    Split the lines of a table into columns of strings. Large csv / tsv files are
+    read with pyarrow if it is installed. Returns None if the lines don't all have
+    the same number of columns.
+    """
+    ncols = len(lines[0].split(sep))
+    if sep is not None and len(lines) >= FAST_READER_MIN_LINES and _pyarrow_csv() is not None:
+        if any(l.count(sep) != ncols - 1 for l in lines):
+            return None
+        columns = _read_columns(lines, sep, ncols)
+        if columns is not None:
+            return columns
+    rows = [l.split(sep) for l in lines]
+    if any(len(sections) != ncols for sections in rows):
+        return None
+    return list(zip(*rows))
+
+
+def _unquote(v):
+    """Remove matching single or double quotes around a string"""
+    if v[:1] in ('"', "'") and v[-1:] == v[:1]:
+        return v[1:-1]
+    return v
+
+
+def _to_float(v):
+    """Convert a value to a float if we can, otherwise remove any quotes around it"""
+    try:
+        return float(v)
+    except ValueError:
+        return _unquote(v)
+
+
+def _convert_column(values):
+    """
+    Convert a column of values to floats, all at once if they are all numbers,
+    otherwise one by one. Returns the values and whether they were all numbers.
+    """
+    try:
+        return list(map(float, values)), True
+    except ValueError:
+        values = [_to_float(v) for v in values]
+        return values, all(type(v) == float for v in values)
+
+
+def _parse_txt(f, conf, lines, num_lines):
+    """
+    Parse a text file of custom content, given its lines without comments and
+    the total number of lines in the file
+    """
     # Split the data into a list of lists by column
     sep = None
     if conf["file_format"] == "csv":
         sep = ","
     if conf["file_format"] == "tsv":
         sep = "\t"
-    lines = f["f"].splitlines()
-    d = []
 
     # Check for special case - HTML
     if conf.get("plot_type") == "html":
-        for l in lines:
-            if l and not l.startswith("#"):
-                d.append(l)
-        return ("\n".join(d), conf)
+        return ("\n".join(l for l in lines if l), conf)
 
     # Not HTML, need to parse data
-    ncols = None
-    for l in lines:
-        if l and not l.startswith("#"):
-            sections = l.split(sep)
-            d.append(sections)
-            if ncols is None:
-                ncols = len(sections)
-            elif ncols != len(sections):
-                log.warning("Inconsistent number of columns found in {}! Skipping..".format(f["fn"]))
-                return (None, conf)
-
-    # Convert values to floats if we can
-    first_row_str = 0
-    for i, l in enumerate(d):
-        for j, v in enumerate(l):
-            if j != 0:  # we don't want to convert sample names to numbers
-                try:
-                    v = float(v)
-                except ValueError:
-                    pass
-            if isinstance(v, str):
-                if (v.startswith('"') and v.endswith('"')) or (v.startswith("'") and v.endswith("'")):
-                    v = v[1:-1]
-                # Count strings in first row (header?)
-                if i == 0:
-                    first_row_str += 1
-            d[i][j] = v
-
-    all_numeric = all([type(l) == float for l in d[i][1:] for i in range(1, len(d))])
+    lines = [l for l in lines if l]
+    if len(lines) == 0:
+        return (None, conf)
+    columns = _split_columns(lines, sep)
+    if columns is None:
+        log.warning("Inconsistent number of columns found in {}! Skipping..".format(f["fn"]))
+        return (None, conf)
+    ncols = len(columns)
+
+    # Convert values to floats if we can, a column at a time
+    # We don't want to convert sample names in the first column to numbers
+    header = [_unquote(columns[0][0])] + [_to_float(col[0]) for col in columns[1:]]
+    d = [header]
+    numeric_columns = []
+    if len(lines) > 1:
+        columns = [col[1:] for col in columns]
+        columns[0] = list(map(_unquote, columns[0]))
+        for j in range(1, ncols):
+            columns[j], is_numeric = _convert_column(columns[j])
+            numeric_columns.append(is_numeric)
+        d.extend(zip(*columns))
+
+    # Count strings in first row (header?)
+    first_row_str = sum(isinstance(v, str) for v in header)
+    # Only the last row is checked for being all numeric
+    all_numeric = len(d) == 1 or all(type(v) == float for v in d[-1][1:])
 
     # General stat info files - expected to have at least 2 rows (first row always being the header)
     # and have at least 2 columns (first column always being sample name)
     if conf.get("plot_type") == "generalstats" and len(d) >= 2 and ncols >= 2:
         data = defaultdict(dict)
-        for i, l in enumerate(d[1:], 1):
-            for j, v in enumerate(l[1:], 1):
-                data[l[0]][d[0][j]] = v
+        for l in d[1:]:
+            data[l[0]].update(zip(d[0][1:], l[1:]))
         return (data, conf)
 
     # Heatmap: Number of headers == number of lines
-    if conf.get("plot_type") is None and first_row_str == len(lines) and all_numeric:
+    if conf.get("plot_type") is None and first_row_str == num_lines and all_numeric:
         conf["plot_type"] = "heatmap"
     if conf.get("plot_type") == "heatmap":
         conf["xcats"] = d[0][1:]
         conf["ycats"] = [s[0] for s in d[1:]]
-        data = [s[1:] for s in d[1:]]
+        data = [list(s[1:]) for s in d[1:]]
         return (data, conf)
 
     # Header row of strings, or configured as table
     if first_row_str == len(d[0]) or conf.get("plot_type") == "table":
         data = OrderedDict()
+        cats = [str(cat) for cat in d[0][1:]]
         for s in d[1:]:
-            data[s[0]] = OrderedDict()
-            for i, v in enumerate(s[1:]):
-                cat = str(d[0][i + 1])
-                data[s[0]][cat] = v
+            data[s[0]] = dict(zip(cats, s[1:]))
         # Bar graph or table - if numeric data, go for bar graph
         if conf.get("plot_type") is None:
-            allfloats = True
-            for r in d[1:]:
-                for v in r[1:]:
-                    allfloats = allfloats and type(v) == float
-            if allfloats:
+            if all(numeric_columns):
                 conf["plot_type"] = "bargraph"
             else:
                 conf["plot_type"] = "table"
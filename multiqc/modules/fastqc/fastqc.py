@@ -13,21 +13,186 @@ import io
 import json
 import logging
 import math
+import multiprocessing
 import os
 import re
 import zipfile
 from collections import Counter, OrderedDict
 
+import numpy as np
+
 from multiqc import config
 from multiqc.modules.base_module import BaseMultiqcModule, ModuleNoSamplesFound
 from multiqc.plots import bargraph, heatmap, linegraph, table
-from multiqc.utils import report
+from multiqc.utils import report, util_functions
 
 # Initialise the logger
 log = logging.getLogger(__name__)
 
 VERSION_REGEX = r"FastQC\t([\d\.]+)"
 
+# Sections kept as NumPy structured arrays instead of lists of dicts, as these take up a lot
+# of memory with many samples. Columns are floats, apart from the first column which can be
+# kept as a label: base position ranges (eg. "10-14") also get their average position as "bp".
+ARRAY_SECTIONS = {
+    "per_base_sequence_quality": "range",
+    "per_sequence_quality_scores": "number",
+    "per_base_sequence_content": "range",
+    "per_sequence_gc_content": "number",
+    "per_base_n_content": "range",
+    "sequence_length_distribution": "range",
+    "sequence_duplication_levels": "label",
+    "adapter_content": "range",
+}
+
+
+def avg_bp_from_range(bp):
+    """Helper function - FastQC often gives base pair ranges (eg. 10-15)
+    which are not helpful when plotting. This returns the average from such
+    ranges as an int, which is helpful. If not a range, just returns the int"""
+
+    try:
+        if "-" in bp:
+            maxlen = float(bp.split("-", 1)[1])
+            minlen = float(bp.split("-", 1)[0])
+            bp = ((maxlen - minlen) / 2) + minlen
+    except TypeError:
+        pass
+    return int(bp)
+
+
+def label_value(label):
+    """Value of a label column as it would be in a row dict: a float if possible, otherwise a string"""
+    try:
+        return float(label)
+    except ValueError:
+        return label
+
+
+def section_array(headers, rows, first_col):
+    """
+    Convert the rows of a FastQC section to a NumPy structured array with a field for
+    each column. first_col is one of the ARRAY_SECTIONS types. Returns None if the
+    rows don't have a value for each column or the values aren't numbers.
+    """
+    if any(len(row) != len(headers) for row in rows):
+        return None
+    columns = list(zip(*rows)) if len(rows) > 0 else [()] * len(headers)
+    fields = []
+    try:
+        for i, (header, column) in enumerate(zip(headers, columns)):
+            if i == 0 and first_col != "number":
+                fields.append((header, np.array(column, dtype=str)))
+                if first_col == "range":
+                    bp = (avg_bp_from_range(label_value(v)) for v in column)
+                    fields.append(("bp", np.fromiter(bp, dtype=np.int64, count=len(column))))
+            else:
+                fields.append((header, np.fromiter(map(float, column), dtype=np.float64, count=len(column))))
+        arr = np.empty(len(rows), dtype=[(name, values.dtype) for name, values in fields])
+    except ValueError:
+        return None
+    for name, values in fields:
+        arr[name] = values
+    return arr
+
+
+def parse_fastqc_data(file_lines):
+    """
+    Parse the lines of a fastqc_data.txt file. Returns a dict of data for each section,
+    the input filename and FastQC version if found, and the order of the duplication keys.
+    """
+    # Parse the report
+    fqc_data = {"statuses": dict()}
+    fn_name = None
+    fqc_version = None
+    section = None
+    s_headers = None
+    dup_keys = []
+    array_headers = dict()
+    for l in file_lines:
+        if l.startswith("##FastQC"):
+            version_match = re.search(VERSION_REGEX, l)
+            if version_match:
+                fqc_version = version_match.group(1)
+        # Make the sample name from the input filename if we find it
+        if fn_name is None:
+            fn_search = re.search(r"Filename\s+(.+)", l)
+            if fn_search:
+                fn_name = fn_search.group(1)
+        if l == ">>END_MODULE":
+            section = None
+            s_headers = None
+        elif l.startswith(">>"):
+            (section, status) = l[2:].split("\t", 1)
+            section = section.lower().replace(" ", "_")
+            fqc_data["statuses"][section] = status
+        elif section is not None:
+            if l.startswith("#"):
+                s_headers = l[1:].split("\t")
+                # Special case: Total Deduplicated Percentage header line
+                if s_headers[0] == "Total Deduplicated Percentage":
+                    fqc_data["basic_statistics"].append(
+                        {"measure": "total_deduplicated_percentage", "value": float(s_headers[1])}
+                    )
+                else:
+                    # Special case: Rename dedup header in old versions of FastQC (v10)
+                    if s_headers[1] == "Relative count":
+                        s_headers[1] = "Percentage of total"
+                    s_headers = [s.lower().replace(" ", "_") for s in s_headers]
+                    fqc_data[section] = list()
+                    if section in ARRAY_SECTIONS:
+                        array_headers[section] = s_headers
+
+            elif s_headers is not None:
+                s = l.split("\t")
+                if section in ARRAY_SECTIONS:
+                    # Converted to an array once the whole report has been read
+                    fqc_data[section].append(s)
+                else:
+                    row = dict()
+                    for i, v in enumerate(s):
+                        v.replace("NaN", "0")
+                        try:
+                            v = float(v)
+                        except ValueError:
+                            pass
+                        row[s_headers[i]] = v
+                    fqc_data[section].append(row)
+                # Special case - need to remember order of duplication keys
+                if section == "sequence_duplication_levels":
+                    try:
+                        dup_keys.append(float(s[0]))
+                    except ValueError:
+                        dup_keys.append(s[0])
+
+    for section, headers in array_headers.items():
+        fqc_data[section] = section_array(headers, fqc_data[section], ARRAY_SECTIONS[section])
+        if fqc_data[section] is None:
+            log.warning("Couldn't read the values in FastQC section '{}', skipping".format(section))
+            del fqc_data[section]
+
+    return fqc_data, fn_name, fqc_version, dup_keys
+
+
+def read_fastqc_zip(path):
+    """
+    Parse fastqc_data.txt from a FastQC zip file, reading only that file from the zip.
+    Can be run in a worker process, so returns (parsed report, error) instead of logging.
+    """
+    try:
+        fqc_zip = zipfile.ZipFile(path)
+    except Exception as e:
+        log.debug("Bad zip file error: {}".format(e))
+        return None, "bad_zip"
+    with fqc_zip:
+        # FastQC zip files should have just one directory inside, containing report
+        d_name = fqc_zip.namelist()[0]
+        try:
+            with fqc_zip.open(os.path.join(d_name, "fastqc_data.txt")) as fh:
+                return parse_fastqc_data(util_functions.iter_lines(fh)), None
+        except KeyError:
+            return None, "no_data"
+
 
 class MultiqcModule(BaseMultiqcModule):
     def __init__(self):
@@ -44,11 +209,12 @@ class MultiqcModule(BaseMultiqcModule):
         self.fastqc_data = dict()
 
         # Find and parse unzipped FastQC reports
-        for f in self.find_log_files("fastqc/data"):
+        for f in self.find_log_files("fastqc/data", lines=True):
             s_name = self.clean_s_name(os.path.basename(f["root"]), f, root=os.path.dirname(f["root"]))
             self.parse_fastqc_report(f["f"], s_name, f)
 
         # Find and parse zipped FastQC reports
+        zip_files = []
         for f in self.find_log_files("fastqc/zip", filecontents=False):
             s_name = f["fn"]
             if s_name.endswith("_fastqc.zip"):
@@ -57,30 +223,17 @@ class MultiqcModule(BaseMultiqcModule):
             if s_name in self.fastqc_data.keys():
                 log.debug("Skipping '{}' as already parsed '{}'".format(f["fn"], s_name))
                 continue
-            try:
-                fqc_zip = zipfile.ZipFile(os.path.join(f["root"], f["fn"]))
-            except Exception as e:
+            zip_files.append((s_name, f))
+        for (s_name, f), (parsed, error) in zip(zip_files, self.read_zip_files(zip_files)):
+            # Check again, zips with the same name may have been read at the same time
+            if s_name in self.fastqc_data.keys():
+                log.debug("Skipping '{}' as already parsed '{}'".format(f["fn"], s_name))
+            elif error == "bad_zip":
                 log.warning("Couldn't read '{}' - Bad zip file".format(f["fn"]))
-                log.debug("Bad zip file error: {}".format(e))
-                continue
-            # FastQC zip files should have just one directory inside, containing report
-            d_name = fqc_zip.namelist()[0]
-            try:
-                path = os.path.join(d_name, "fastqc_data.txt")
-                with fqc_zip.open(path) as fh:
-                    r_data = fh.read()
-                    try:
-                        r_data = r_data.decode("utf8")
-                    except UnicodeDecodeError as e:
-                        log.debug(f"Could not parse {path} as Unicode: {e}, attempting the latin-1 encoding")
-                        try:
-                            r_data = r_data.decode("latin-1")
-                        except Exception as e:
-                            log.warning(f"Error reading FastQC data file {path}: {e}. Skipping sample {s_name}.")
-                            continue
-                    self.parse_fastqc_report(r_data, s_name, f)
-            except KeyError:
+            elif error == "no_data":
                 log.warning("Error - can't find fastqc_raw_data.txt in {}".format(f))
+            else:
+                self.add_fastqc_report(parsed, s_name, f)
 
         # Filter to strip out ignored sample names
         self.fastqc_data = self.ignore_samples(self.fastqc_data)
@@ -139,69 +292,43 @@ class MultiqcModule(BaseMultiqcModule):
         self.adapter_content_plot()
         self.status_heatmap()
 
-    def parse_fastqc_report(self, file_contents, s_name=None, f=None):
-        """Takes contents from a fastq_data.txt file and parses out required
+    def read_zip_files(self, zip_files):
+        """
+        Parse fastqc_data.txt from each FastQC zip file, in parallel if
+        fastqc_config.workers is set. Returns a list of (parsed report, error).
+        """
+        paths = [os.path.join(f["root"], f["fn"]) for _, f in zip_files]
+        workers = min(getattr(config, "fastqc_config", {}).get("workers", 1), len(paths))
+        if workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+            log.warning("Reading FastQC zip files in parallel is not supported on this system, running one by one")
+            workers = 1
+        # Modules run with --module-workers are already in a worker process, which can't start more
+        if workers > 1 and multiprocessing.current_process().daemon:
+            log.debug("Reading FastQC zip files one by one, as running in a worker process")
+            workers = 1
+        if workers <= 1:
+            return [read_fastqc_zip(path) for path in paths]
+        log.debug("Reading {} FastQC zip files using {} processes".format(len(paths), workers))
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            return pool.map(read_fastqc_zip, paths, chunksize=max(1, min(16, len(paths) // (workers * 4))))
+
+    def parse_fastqc_report(self, file_lines, s_name=None, f=None):
+        """Takes the lines of a fastq_data.txt file and parses out required
         statistics and data. Returns a dict with keys 'stats' and 'data'.
         Data is for plotting graphs, stats are for top table."""
+        self.add_fastqc_report(parse_fastqc_data(file_lines), s_name, f)
 
-        # Make the sample name from the input filename if we find it
-        fn_search = re.search(r"Filename\s+(.+)", file_contents)
-        if fn_search:
-            s_name = self.clean_s_name(fn_search.group(1), f)
-
+    def add_fastqc_report(self, parsed, s_name=None, f=None):
+        """Add a report parsed with parse_fastqc_data() to the module data"""
+        fqc_data, fn_name, fqc_version, self.dup_keys = parsed
+        if fn_name is not None:
+            s_name = self.clean_s_name(fn_name, f)
         if s_name in self.fastqc_data.keys():
             log.debug("Duplicate sample name found! Overwriting: {}".format(s_name))
         self.add_data_source(f, s_name)
-        self.fastqc_data[s_name] = {"statuses": dict()}
-
-        # Parse the report
-        section = None
-        s_headers = None
-        self.dup_keys = []
-        for l in file_contents.splitlines():
-            if l.startswith("##FastQC"):
-                version_match = re.search(VERSION_REGEX, l)
-                if version_match:
-                    self.add_software_version(version_match.group(1), s_name)
-            if l == ">>END_MODULE":
-                section = None
-                s_headers = None
-            elif l.startswith(">>"):
-                (section, status) = l[2:].split("\t", 1)
-                section = section.lower().replace(" ", "_")
-                self.fastqc_data[s_name]["statuses"][section] = status
-            elif section is not None:
-                if l.startswith("#"):
-                    s_headers = l[1:].split("\t")
-                    # Special case: Total Deduplicated Percentage header line
-                    if s_headers[0] == "Total Deduplicated Percentage":
-                        self.fastqc_data[s_name]["basic_statistics"].append(
-                            {"measure": "total_deduplicated_percentage", "value": float(s_headers[1])}
-                        )
-                    else:
-                        # Special case: Rename dedup header in old versions of FastQC (v10)
-                        if s_headers[1] == "Relative count":
-                            s_headers[1] = "Percentage of total"
-                        s_headers = [s.lower().replace(" ", "_") for s in s_headers]
-                        self.fastqc_data[s_name][section] = list()
-
-                elif s_headers is not None:
-                    s = l.split("\t")
-                    row = dict()
-                    for i, v in enumerate(s):
-                        v.replace("NaN", "0")
-                        try:
-                            v = float(v)
-                        except ValueError:
-                            pass
-                        row[s_headers[i]] = v
-                    self.fastqc_data[s_name][section].append(row)
-                    # Special case - need to remember order of duplication keys
-                    if section == "sequence_duplication_levels":
-                        try:
-                            self.dup_keys.append(float(s[0]))
-                        except ValueError:
-                            self.dup_keys.append(s[0])
+        if fqc_version is not None:
+            self.add_software_version(fqc_version, s_name)
+        self.fastqc_data[s_name] = fqc_data
 
         # Tidy up the Basic Stats
         self.fastqc_data[s_name]["basic_statistics"] = {
@@ -210,29 +337,24 @@ class MultiqcModule(BaseMultiqcModule):
 
         # we sort by the avg of the range, which is effectively
         # sorting ranges in asc order assuming no overlap
-        sequence_length_distributions = self.fastqc_data[s_name].get("sequence_length_distribution", [])
-        sequence_length_distributions.sort(key=lambda d: self.avg_bp_from_range(d["length"]))
+        lengths = self.fastqc_data[s_name].get("sequence_length_distribution")
+        if lengths is None or len(lengths) == 0:
+            return
+        lengths = lengths[np.argsort(lengths["bp"], kind="stable")]
+        self.fastqc_data[s_name]["sequence_length_distribution"] = lengths
 
         # Calculate the average sequence length (Basic Statistics gives a range)
-        length_reads = 0
-        length_bp = 0
-        total_count = sum(d["count"] for d in sequence_length_distributions)
-        median = None
-
-        for d in sequence_length_distributions:
-            length_reads += d["count"]
-            length_bp += d["count"] * self.avg_bp_from_range(d["length"])
-
-            if median is None and length_reads >= total_count / 2:
-                # if the distribution-entry is a range, we use the average of the range.
-                # this isn't technically correct, because we can't know what the distribution
-                # is within that range. Probably good enough though.
-                median = self.avg_bp_from_range(d["length"])
-
+        length_reads = np.cumsum(lengths["count"])
+        length_bp = np.cumsum(lengths["count"] * lengths["bp"])
+        total_count = length_reads[-1]
         if total_count > 0:
-            self.fastqc_data[s_name]["basic_statistics"]["avg_sequence_length"] = length_bp / total_count
-        if median is not None:
-            self.fastqc_data[s_name]["basic_statistics"]["median_sequence_length"] = median
+            self.fastqc_data[s_name]["basic_statistics"]["avg_sequence_length"] = float(length_bp[-1] / total_count)
+        # if the distribution-entry is a range, we use the average of the range.
+        # this isn't technically correct, because we can't know what the distribution
+        # is within that range. Probably good enough though.
+        median_idx = np.flatnonzero(length_reads >= total_count / 2)
+        if len(median_idx) > 0:
+            self.fastqc_data[s_name]["basic_statistics"]["median_sequence_length"] = int(lengths["bp"][median_idx[0]])
 
     def fastqc_general_stats(self):
         """Add some single-number stats to the basic statistics
@@ -401,12 +523,10 @@ class MultiqcModule(BaseMultiqcModule):
         data = dict()
         for s_name in self.fastqc_data:
             try:
-                data[s_name] = {
-                    self.avg_bp_from_range(d["base"]): d["mean"]
-                    for d in self.fastqc_data[s_name]["per_base_sequence_quality"]
-                }
+                d = self.fastqc_data[s_name]["per_base_sequence_quality"]
             except KeyError:
-                pass
+                continue
+            data[s_name] = dict(zip(d["bp"].tolist(), d["mean"].tolist()))
         if len(data) == 0:
             log.debug("sequence_quality not found in FastQC reports")
             return None
@@ -451,11 +571,10 @@ class MultiqcModule(BaseMultiqcModule):
         data = dict()
         for s_name in self.fastqc_data:
             try:
-                data[s_name] = {
-                    d["quality"]: d["count"] for d in self.fastqc_data[s_name]["per_sequence_quality_scores"]
-                }
+                d = self.fastqc_data[s_name]["per_sequence_quality_scores"]
             except KeyError:
-                pass
+                continue
+            data[s_name] = dict(zip(d["quality"].tolist(), d["count"].tolist()))
         if len(data) == 0:
             log.debug("per_seq_quality not found in FastQC reports")
             return None
@@ -498,27 +617,28 @@ class MultiqcModule(BaseMultiqcModule):
         data = OrderedDict()
         for s_name in sorted(self.fastqc_data.keys()):
             try:
-                data[s_name] = {
-                    self.avg_bp_from_range(d["base"]): d for d in self.fastqc_data[s_name]["per_base_sequence_content"]
-                }
+                d = self.fastqc_data[s_name]["per_base_sequence_content"]
             except KeyError:
                 # FastQC module was skipped - move on to the next sample
                 continue
+            bases = {base: d[base] for base in ["a", "c", "t", "g"]}
 
             # Old versions of FastQC give counts instead of percentages
-            for b in data[s_name]:
-                tot = sum([data[s_name][b][base] for base in ["a", "c", "t", "g"]])
-                if tot == 100.0:
-                    break  # Stop loop after one iteration if summed to 100 (percentages)
-                else:
-                    for base in ["a", "c", "t", "g"]:
-                        data[s_name][b][base] = (float(data[s_name][b][base]) / float(tot)) * 100.0
+            # Rows are converted until the first that sums to 100 (percentages)
+            tot = bases["a"] + bases["c"] + bases["t"] + bases["g"]
+            num_counts = np.argmax(tot == 100.0) if np.any(tot == 100.0) else len(tot)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                for base in bases:
+                    bases[base] = bases[base].copy()
+                    bases[base][:num_counts] = (bases[base][:num_counts] / tot[:num_counts]) * 100.0
 
             # Replace NaN with 0
-            for b in data[s_name]:
-                for base in ["a", "c", "t", "g"]:
-                    if math.isnan(float(data[s_name][b][base])):
-                        data[s_name][b][base] = 0
+            columns = [[label_value(b) for b in d["base"].tolist()]]
+            for name in d.dtype.names[2:]:
+                values = bases[name].tolist() if name in bases else d[name].tolist()
+                columns.append([0 if math.isnan(v) else v for v in values])
+            row_keys = ("base",) + d.dtype.names[2:]
+            data[s_name] = {bp: dict(zip(row_keys, row)) for bp, row in zip(d["bp"].tolist(), zip(*columns))}
 
         if len(data) == 0:
             log.debug("sequence_content not found in FastQC reports")
@@ -595,19 +715,15 @@ class MultiqcModule(BaseMultiqcModule):
         data_norm = dict()
         for s_name in self.fastqc_data:
             try:
-                data[s_name] = {
-                    d["gc_content"]: d["count"] for d in self.fastqc_data[s_name]["per_sequence_gc_content"]
-                }
+                d = self.fastqc_data[s_name]["per_sequence_gc_content"]
             except KeyError:
-                pass
+                continue
+            data[s_name] = dict(zip(d["gc_content"].tolist(), d["count"].tolist()))
+            total = sum(data[s_name].values())
+            if total == 0:
+                data_norm[s_name] = dict.fromkeys(data[s_name], 0)
             else:
-                data_norm[s_name] = dict()
-                total = sum([c for c in data[s_name].values()])
-                for gc, count in data[s_name].items():
-                    try:
-                        data_norm[s_name][gc] = (count / total) * 100
-                    except ZeroDivisionError:
-                        data_norm[s_name][gc] = 0
+                data_norm[s_name] = dict(zip(d["gc_content"].tolist(), ((d["count"] / total) * 100).tolist()))
         if len(data) == 0:
             log.debug("per_sequence_gc_content not found in FastQC reports")
             return None
@@ -712,12 +828,10 @@ class MultiqcModule(BaseMultiqcModule):
         data = dict()
         for s_name in self.fastqc_data:
             try:
-                data[s_name] = {
-                    self.avg_bp_from_range(d["base"]): d["n-count"]
-                    for d in self.fastqc_data[s_name]["per_base_n_content"]
-                }
+                d = self.fastqc_data[s_name]["per_base_n_content"]
             except KeyError:
-                pass
+                continue
+            data[s_name] = dict(zip(d["bp"].tolist(), d["n-count"].tolist()))
         if len(data) == 0:
             log.debug("per_base_n_content not found in FastQC reports")
             return None
@@ -768,15 +882,13 @@ class MultiqcModule(BaseMultiqcModule):
         multiple_lenths = False
         for s_name in self.fastqc_data:
             try:
-                data[s_name] = {
-                    self.avg_bp_from_range(d["length"]): d["count"]
-                    for d in self.fastqc_data[s_name]["sequence_length_distribution"]
-                }
-                avg_seq_lengths.update(data[s_name].keys())
-                if len(set(data[s_name].keys())) > 1:
-                    multiple_lenths = True
+                d = self.fastqc_data[s_name]["sequence_length_distribution"]
             except KeyError:
-                pass
+                continue
+            data[s_name] = dict(zip(d["bp"].tolist(), d["count"].tolist()))
+            avg_seq_lengths.update(data[s_name].keys())
+            if len(data[s_name]) > 1:
+                multiple_lenths = True
         if len(data) == 0:
             log.debug("sequence_length_distribution not found in FastQC reports")
             return None
@@ -818,18 +930,18 @@ class MultiqcModule(BaseMultiqcModule):
         max_dupval = 0
         for s_name in self.fastqc_data:
             try:
-                thisdata = {}
-                for d in self.fastqc_data[s_name]["sequence_duplication_levels"]:
-                    thisdata[d["duplication_level"]] = d["percentage_of_total"]
-                    max_dupval = max(max_dupval, d["percentage_of_total"])
-                data[s_name] = OrderedDict()
-                for k in self.dup_keys:
-                    try:
-                        data[s_name][k] = thisdata[k]
-                    except KeyError:
-                        pass
+                d = self.fastqc_data[s_name]["sequence_duplication_levels"]
             except KeyError:
-                pass
+                continue
+            percentages = d["percentage_of_total"].tolist()
+            thisdata = dict(zip(map(label_value, d["duplication_level"].tolist()), percentages))
+            max_dupval = max([max_dupval] + percentages)
+            data[s_name] = OrderedDict()
+            for k in self.dup_keys:
+                try:
+                    data[s_name][k] = thisdata[k]
+                except KeyError:
+                    pass
         if len(data) == 0:
             log.debug("sequence_length_distribution not found in FastQC reports")
             return None
@@ -1046,17 +1158,14 @@ class MultiqcModule(BaseMultiqcModule):
         data = dict()
         for s_name in self.fastqc_data:
             try:
-                for adapters in self.fastqc_data[s_name]["adapter_content"]:
-                    pos = self.avg_bp_from_range(adapters["position"])
-                    for adapter_name, percent in adapters.items():
-                        k = "{} - {}".format(s_name, adapter_name)
-                        if adapter_name != "position":
-                            try:
-                                data[k][pos] = percent
-                            except KeyError:
-                                data[k] = {pos: percent}
+                d = self.fastqc_data[s_name]["adapter_content"]
             except KeyError:
-                pass
+                continue
+            if len(d) == 0:
+                continue
+            positions = d["bp"].tolist()
+            for adapter_name in d.dtype.names[2:]:
+                data["{} - {}".format(s_name, adapter_name)] = dict(zip(positions, d[adapter_name].tolist()))
         if len(data) == 0:
             log.debug("adapter_content not found in FastQC reports")
             return None
@@ -1185,18 +1294,8 @@ class MultiqcModule(BaseMultiqcModule):
         )
 
     def avg_bp_from_range(self, bp):
-        """Helper function - FastQC often gives base pair ranges (eg. 10-15)
-        which are not helpful when plotting. This returns the average from such
-        ranges as an int, which is helpful. If not a range, just returns the int"""
-
-        try:
-            if "-" in bp:
-                maxlen = float(bp.split("-", 1)[1])
-                minlen = float(bp.split("-", 1)[0])
-                bp = ((maxlen - minlen) / 2) + minlen
-        except TypeError:
-            pass
-        return int(bp)
+        """Average of a base pair range, see avg_bp_from_range()"""
+        return avg_bp_from_range(bp)
 
     def get_status_cols(self, section):
         """Helper function - returns a list of colours according to the FastQC
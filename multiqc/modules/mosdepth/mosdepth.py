@@ -5,12 +5,15 @@ import fnmatch
 import logging
 from collections import OrderedDict, defaultdict
 
+import numpy as np
+
 from multiqc import config
 from multiqc.modules.base_module import BaseMultiqcModule, ModuleNoSamplesFound
 
 # Initialise the logger
 from multiqc.modules.qualimap.QM_BamQC import coverage_histogram_helptext, genome_fraction_helptext
 from multiqc.plots import bargraph, linegraph
+from multiqc.utils import histogram
 
 log = logging.getLogger(__name__)
 
@@ -125,9 +128,9 @@ class MultiqcModule(BaseMultiqcModule):
         genstats = defaultdict(OrderedDict)  # mean coverage
 
         # Parse mean coverage
-        for f in self.find_log_files("mosdepth/summary"):
+        for f in self.find_log_files("mosdepth/summary", lines=True):
             s_name = self.clean_s_name(f["fn"], f)
-            for line in f["f"].splitlines():
+            for line in f["f"]:
                 if line.startswith("total\t"):
                     contig, length, bases, mean, min_cov, max_cov = line.split("\t")
                     genstats[s_name]["mean_coverage"] = mean
@@ -320,45 +323,49 @@ class MultiqcModule(BaseMultiqcModule):
         perchrom_avg_data = defaultdict(OrderedDict)  # per chromosome average coverage
 
         # Parse coverage distributions
-        for f in self.find_log_files(f"mosdepth/{scope}_dist"):
+        for f in self.find_log_files(f"mosdepth/{scope}_dist", lines=True):
             s_name = self.clean_s_name(f["fn"], f)
             if s_name in cumcov_dist_data:  # both region and global might exist, prioritizing region
                 continue
 
-            for line in f["f"].split("\n"):
-                if "\t" not in line:
-                    continue
-                contig, cutoff_reads, bases_fraction = line.split("\t")
-                if float(bases_fraction) == 0:
+            contigs, cutoffs, bases_fractions = histogram.parse(f["f"], sep="\t", comment=None, label=True)
+            contigs = np.array(contigs, dtype=str)
+            nonzero = bases_fractions != 0
+            is_total = contigs == "total"
+
+            # Parse cumulative coverage
+            total_rows = nonzero & is_total
+            if total_rows.any():
+                cumcov = 100.0 * bases_fractions[total_rows]
+                cutoffs = cutoffs[total_rows].astype(np.int64)
+                cumcov_dist_data[s_name].update(zip(cutoffs.tolist(), cumcov.tolist()))
+
+            # Calculate per-contig coverage, summing the fractions for each contig
+            per_contig = nonzero & ~is_total
+            names, first_idx, contig_idx = np.unique(contigs[per_contig], return_index=True, return_inverse=True)
+            fraction_sums = np.bincount(contig_idx, weights=bases_fractions[per_contig], minlength=len(names))
+            names, fraction_sums = names.tolist(), fraction_sums.tolist()
+            for i in np.argsort(first_idx, kind="stable"):
+                contig = names[i]
+                # filter out contigs based on exclusion patterns
+                if any(fnmatch.fnmatch(contig, str(pattern)) for pattern in self.cfg["exclude_contigs"]):
+                    try:
+                        if self.cfg.get("show_excluded_debug_logs") is True:
+                            log.debug(f"Skipping excluded contig '{contig}'")
+                    except (AttributeError, KeyError):
+                        pass
                     continue
 
-                # Parse cumulative coverage
-                if contig == "total":
-                    cumcov = 100.0 * float(bases_fraction)
-                    x = int(cutoff_reads)
-                    cumcov_dist_data[s_name][x] = cumcov
+                # filter out contigs based on inclusion patterns
+                if len(self.cfg["include_contigs"]) > 0 and not any(
+                    fnmatch.fnmatch(contig, pattern) for pattern in self.cfg["include_contigs"]
+                ):
+                    # Commented out since this could be many thousands of contigs!
+                    # log.debug(f"Skipping not included contig '{contig}'")
+                    continue
 
-                # Calculate per-contig coverage
-                else:
-                    # filter out contigs based on exclusion patterns
-                    if any(fnmatch.fnmatch(contig, str(pattern)) for pattern in self.cfg["exclude_contigs"]):
-                        try:
-                            if self.cfg.get("show_excluded_debug_logs") is True:
-                                log.debug(f"Skipping excluded contig '{contig}'")
-                        except (AttributeError, KeyError):
-                            pass
-                        continue
-
-                    # filter out contigs based on inclusion patterns
-                    if len(self.cfg["include_contigs"]) > 0 and not any(
-                        fnmatch.fnmatch(contig, pattern) for pattern in self.cfg["include_contigs"]
-                    ):
-                        # Commented out since this could be many thousands of contigs!
-                        # log.debug(f"Skipping not included contig '{contig}'")
-                        continue
-
-                    avg = perchrom_avg_data[s_name].get(contig, 0) + float(bases_fraction)
-                    perchrom_avg_data[s_name][contig] = avg
+                avg = perchrom_avg_data[s_name].get(contig, 0) + fraction_sums[i]
+                perchrom_avg_data[s_name][contig] = avg
 
             if s_name in cumcov_dist_data:
                 self.add_data_source(f, s_name=s_name, section="genome_results")
@@ -431,9 +438,6 @@ class MultiqcModule(BaseMultiqcModule):
 
         # Calculate absolute coverage distribution (global)
         for s_name, s_cumcov_dist in cumcov_dist_data.items():
-            # Create sorted list of tuples (x, cumcov)
-            cumcov_dist = sorted(s_cumcov_dist.items())
-
             # Calculate absolute coverage for the given x by taking the difference between
             # the current and previous cumulative coverage.
             #
@@ -442,14 +446,15 @@ class MultiqcModule(BaseMultiqcModule):
             #   2x     -               2x  0.10   = 0.10 - 0    = 0.10
             #   1x     --------        1x  0.80   = 0.80 - 0.10 = 0.70
             #   genome ..........      0x  1.00   = 1.00 - 0.80 = 0.20
-            prev_x, prev_cumcov = cumcov_dist.pop()
-            if not cumcov_dist:
-                cov_dist_data[s_name][prev_x] = 1.0
+            if len(s_cumcov_dist) == 1:
+                cov_dist_data[s_name][next(iter(s_cumcov_dist))] = 1.0
             else:
-                while cumcov_dist:
-                    x, cumcov = cumcov_dist.pop()
-                    cov_dist_data[s_name][x] = cumcov - prev_cumcov
-                    prev_x, prev_cumcov = x, cumcov
+                x, abscov = histogram.from_cumulative(
+                    np.fromiter(s_cumcov_dist.keys(), dtype=np.int64, count=len(s_cumcov_dist)),
+                    np.fromiter(s_cumcov_dist.values(), dtype=np.float64, count=len(s_cumcov_dist)),
+                )
+                # Highest coverage first, leaving out the highest value that has no next value
+                cov_dist_data[s_name].update(zip(x[-2::-1].tolist(), abscov[-2::-1].tolist()))
 
         return cumcov_dist_data, cov_dist_data, perchrom_avg_data, xy_cov
 
@@ -472,12 +477,8 @@ class MultiqcModule(BaseMultiqcModule):
 
     def genstats_mediancov(self, genstats, genstats_headers, cumcov_dist_data):
         for s_name, d in cumcov_dist_data.items():
-            median_cov = None
-            for this_cov, cum_pct in d.items():
-                if cum_pct >= 50:
-                    median_cov = this_cov
-                    break
-            genstats[s_name]["median_coverage"] = median_cov
+            # Highest coverage that at least half of the bases have
+            genstats[s_name]["median_coverage"] = histogram.first_bin(list(d.keys()), list(d.values()), 50)
 
         genstats_headers["median_coverage"] = {
             "title": "Median",
@@ -5,8 +5,11 @@ import os
 import re
 from collections import OrderedDict
 
+import numpy as np
+
 from multiqc import config
 from multiqc.plots import linegraph
+from multiqc.utils import histogram
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -108,13 +111,15 @@ def parse_reports(self):
         self.picard_insertSize_samplestats[s_name]["summed_mean"] = v["meansum"] / v["total_pairs"]
 
     # Calculate summed median values for all read orientations
-    for s_name in self.picard_insertSize_histogram:
-        j = 0
-        for idx, c in self.picard_insertSize_histogram[s_name].items():
-            j += c
-            if j > (self.picard_insertSize_samplestats[s_name]["total_count"] / 2):
-                self.picard_insertSize_samplestats[s_name]["summed_median"] = idx
-                break
+    for s_name, hist in self.picard_insertSize_histogram.items():
+        summed_median = histogram.first_bin(
+            list(hist.keys()),
+            np.cumsum(list(hist.values())),
+            self.picard_insertSize_samplestats[s_name]["total_count"] / 2,
+            inclusive=False,
+        )
+        if summed_median is not None:
+            self.picard_insertSize_samplestats[s_name]["summed_median"] = summed_median
 
     # Filter to strip out ignored sample names
     self.picard_insertSize_data = self.ignore_samples(self.picard_insertSize_data)
@@ -5,8 +5,11 @@ import os
 import re
 from collections import OrderedDict
 
+import numpy as np
+
 from multiqc import config
 from multiqc.plots import bargraph, linegraph
+from multiqc.utils import histogram
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -145,35 +148,37 @@ def parse_reports(self):
         # Section with histogram plot
         if len(self.picard_wgsmetrics_histogram) > 0 and not skip_histo:
             # Figure out where to cut histogram tail
+            hist_arrays = {
+                s_name: (
+                    np.fromiter(samp.keys(), dtype=np.int64, count=len(samp)),
+                    np.fromiter(samp.values(), dtype=np.int64, count=len(samp)),
+                )
+                for s_name, samp in self.picard_wgsmetrics_histogram.items()
+            }
             max_cov = picard_config.get("wgsmetrics_histogram_max_cov")
             if max_cov is None:
                 max_cov = 10
-                for s_name, samp in self.picard_wgsmetrics_histogram.items():
-                    total = float(sum(samp.values()))
-                    running_total = 0
-                    for k, v in samp.items():
-                        running_total += v
-                        if running_total > total * 0.99:
-                            max_cov = max(k, max_cov)
-                            break
+                for s_name, (cov, counts) in hist_arrays.items():
+                    cumulative = np.cumsum(counts)
+                    tail_cov = histogram.first_bin(cov, cumulative, float(cumulative[-1]) * 0.99, inclusive=False)
+                    if tail_cov is not None:
+                        max_cov = max(tail_cov, max_cov)
 
             # Cut histogram tail and make a normalised percentage version of the data plus dropoff
             data = {}
             data_percent = {}
             maxval = 0
-            for s_name, samp in self.picard_wgsmetrics_histogram.items():
-                data[s_name] = OrderedDict()
-                data_percent[s_name] = OrderedDict()
-                total = float(sum(samp.values()))
-                cumulative = 0
-                for k, v in samp.items():
-                    if k <= max_cov:
-                        cumulative += v
-                        data[s_name][k] = v
-                        maxval = max(maxval, v)
-                        data_percent[s_name][k] = 100 - (cumulative / total) * 100
-                    else:
-                        break
+            for s_name, (cov, counts) in hist_arrays.items():
+                total = float(np.sum(counts))
+                # Keep the bins up to the first one above the maximum coverage
+                above_max = cov > max_cov
+                num_bins = np.argmax(above_max) if above_max.any() else len(cov)
+                cov, counts = cov[:num_bins].tolist(), counts[:num_bins]
+                if num_bins > 0:
+                    maxval = max(maxval, counts.max().item())
+                dropoff = 100 - (np.cumsum(counts) / total) * 100
+                data[s_name] = OrderedDict(zip(cov, counts.tolist()))
+                data_percent[s_name] = OrderedDict(zip(cov, dropoff.tolist()))
 
             # Plot the histogram data and add section
             pconfig = {
@@ -35,6 +35,8 @@ class MultiqcModule(BaseMultiqcModule):
 
         self.search_pattern_times_section()
 
+        self.ignored_samples_section()
+
     def file_search_stats_section(self):
         """Count of all files iterated through by MultiQC, by category"""
 
@@ -123,3 +125,38 @@ class MultiqcModule(BaseMultiqcModule):
             """,
             plot=bargraph.plot(pdata, None, pconfig),
         )
+
+    def ignored_samples_section(self):
+        """Section with a bar plot showing the number of samples removed by each ignore rule"""
+
+        if len(report.ignored_samples) == 0:
+            return None
+
+        pdata = OrderedDict()
+        for rule in sorted(report.ignored_samples, key=lambda r: len(report.ignored_samples[r]), reverse=True):
+            pdata[rule] = {"samples": len(report.ignored_samples[rule])}
+
+        pconfig = {
+            "id": "multiqc_runtime_ignored_samples_plot",
+            "title": "MultiQC: Samples removed by each ignore rule",
+            "ylab": "Number of sample names",
+            "use_legend": False,
+            "cpswitch": False,
+        }
+
+        self.add_section(
+            name="Ignored samples",
+            anchor="multiqc_runtime_ignored_samples",
+            description="""
+                Number of different sample names removed by each sample name ignore rule.
+                **Total sample names removed: {}**.
+            """.format(
+                len(set().union(*report.ignored_samples.values()))
+            ),
+            helptext="""
+                Sample names are ignored with `--ignore-samples` / `config.sample_names_ignore` (globs)
+                and `config.sample_names_ignore_re` (regular expressions). Each sample name is counted
+                against the first rule that matches it. Rules that didn't match any samples are not shown.
+            """,
+            plot=bargraph.plot(pdata, None, pconfig),
+        )
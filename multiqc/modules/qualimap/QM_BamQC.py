@@ -6,8 +6,11 @@ import math
 import re
 from collections import OrderedDict
 
+import numpy as np
+
 from multiqc import config
 from multiqc.plots import linegraph
+from multiqc.utils import histogram
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -167,35 +170,18 @@ def parse_coverage(self, f):
     # Typical path: <sample name>/raw_data_qualimapReport/coverage_histogram.txt
     s_name = self.get_s_name(f)
 
-    d = dict()
-    for l in f["f"]:
-        if l.startswith("#"):
-            continue
-        coverage, count = l.split(None, 1)
-        coverage = int(round(float(coverage)))
-        count = float(count)
-        d[coverage] = count
+    coverage, counts = histogram.parse(f["f"])
+    coverage = np.round(coverage).astype(np.int64)
 
-    if len(d) == 0:
+    if len(coverage) == 0:
         log.debug("Couldn't parse contents of coverage histogram file {}".format(f["fn"]))
         return None
 
-    # Find median without importing anything to do it for us
-    num_counts = sum(d.values())
-    cum_counts = 0
-    total_cov = 0
-    median_coverage = None
-    for thiscov, thiscount in d.items():
-        cum_counts += thiscount
-        total_cov += thiscov * thiscount
-        if cum_counts >= num_counts / 2:
-            median_coverage = thiscov
-            break
-    self.general_stats_data[s_name]["median_coverage"] = median_coverage
+    self.general_stats_data[s_name]["median_coverage"] = histogram.median(coverage, counts)
     # Save results
     if s_name in self.qualimap_bamqc_coverage_hist:
         log.debug("Duplicate coverage histogram sample name found! Overwriting: {}".format(s_name))
-    self.qualimap_bamqc_coverage_hist[s_name] = d
+    self.qualimap_bamqc_coverage_hist[s_name] = (coverage, counts)
     self.add_data_source(f, s_name=s_name, section="coverage_histogram")
 
 
@@ -205,35 +191,20 @@ def parse_insert_size(self, f):
     # Typical path: <sample name>/raw_data_qualimapReport/insert_size_histogram.txt
     s_name = self.get_s_name(f)
 
-    d = dict()
-    zero_insertsize = 0
-    for l in f["f"]:
-        if l.startswith("#"):
-            continue
-        insertsize, count = l.split(None, 1)
-        insertsize = int(round(float(insertsize)))
-        count = float(count) / 1000000
-        if insertsize == 0:
-            zero_insertsize = count
-        else:
-            d[insertsize] = count
-
-    # Find median without importing anything to do it for us
-    num_counts = sum(d.values())
-    cum_counts = 0
-    median_insert_size = None
-    for thisins, thiscount in d.items():
-        cum_counts += thiscount
-        if cum_counts >= num_counts / 2:
-            median_insert_size = thisins
-            break
+    insert_sizes, counts = histogram.parse(f["f"])
+    insert_sizes = np.round(insert_sizes).astype(np.int64)
+    counts = counts / 1000000
+    # Leave out the count of reads with an insert size of zero
+    nonzero = insert_sizes != 0
+    insert_sizes, counts = insert_sizes[nonzero], counts[nonzero]
+
     # Add the median insert size to the general stats table
-    self.general_stats_data[s_name]["median_insert_size"] = median_insert_size
+    self.general_stats_data[s_name]["median_insert_size"] = histogram.median(insert_sizes, counts)
 
     # Save results
     if s_name in self.qualimap_bamqc_insert_size_hist:
         log.debug("Duplicate insert size histogram sample name found! Overwriting: {}".format(s_name))
-    self.qualimap_bamqc_insert_size_hist[s_name] = d
+    self.qualimap_bamqc_insert_size_hist[s_name] = (insert_sizes, counts)
     self.add_data_source(f, s_name=s_name, section="insert_size_histogram")
 
 
@@ -349,17 +320,17 @@ def report_sections(self):
         # (find a sensible max x - lose 1% of longest tail)
         max_x = 0
         total_bases_by_sample = dict()
-        for s_name, d in self.qualimap_bamqc_coverage_hist.items():
-            total_bases_by_sample[s_name] = sum(d.values())
-            cumulative = 0
-            for count in sorted(d.keys(), reverse=True):
-                cumulative += d[count]
-                if cumulative / total_bases_by_sample[s_name] > 0.01:
-                    max_x = max(max_x, count)
-                    break
+        for s_name, (coverage, counts) in self.qualimap_bamqc_coverage_hist.items():
+            coverage_desc, cumulative = histogram.cumulative_from_top(coverage, counts)
+            total_bases_by_sample[s_name] = np.cumsum(counts)[-1]
+            tail_x = histogram.first_bin(
+                coverage_desc, cumulative / total_bases_by_sample[s_name], 0.01, inclusive=False
+            )
+            if tail_x is not None:
+                max_x = max(max_x, tail_x)
 
         rates_within_threshs = dict()
-        for s_name, hist in self.qualimap_bamqc_coverage_hist.items():
+        for s_name, (coverage, counts) in self.qualimap_bamqc_coverage_hist.items():
             total = total_bases_by_sample[s_name]
             # Make a range of depths that isn't stupidly huge for high coverage expts
             depth_range = list(range(0, max_x + 1, math.ceil(float(max_x) / 400.0) if max_x > 0 else 1))
@@ -368,7 +339,8 @@ def report_sections(self):
                 if int(c) not in depth_range:
                     depth_range.append(int(c))
             # Calculate the coverage rates for this range of coverages
-            rates_within_threshs[s_name] = _calculate_bases_within_thresholds(hist, total, depth_range)
+            rates = histogram.percent_at_least(coverage, counts, depth_range, total=total)
+            rates_within_threshs[s_name] = OrderedDict(zip(depth_range, rates))
             # Add requested coverage levels to the General Statistics table
             for c in self.covs:
                 if int(c) in rates_within_threshs[s_name]:
@@ -383,7 +355,7 @@ def report_sections(self):
             description="Distribution of the number of locations in the reference genome with a given depth of coverage.",
             helptext=coverage_histogram_helptext,
             plot=linegraph.plot(
-                self.qualimap_bamqc_coverage_hist,
+                _histogram_dicts(self.qualimap_bamqc_coverage_hist),
                 {
                     "id": "qualimap_coverage_histogram",
                     "title": "Qualimap BamQC: Coverage histogram",
@@ -469,7 +441,7 @@ def report_sections(self):
             description="Distribution of estimated insert sizes of mapped reads.",
             helptext=insert_size_helptext,
             plot=linegraph.plot(
-                self.qualimap_bamqc_insert_size_hist,
+                _histogram_dicts(self.qualimap_bamqc_insert_size_hist),
                 {
                     "id": "qualimap_insert_size",
                     "title": "Qualimap BamQC: Insert size histogram",
@@ -648,27 +620,6 @@ def general_stats_headers(self):
     }
 
 
-def _calculate_bases_within_thresholds(bases_by_depth, total_size, depth_thresholds):
-    bases_within_threshs = OrderedDict((depth, 0) for depth in depth_thresholds)
-    rates_within_threshs = OrderedDict((depth, None) for depth in depth_thresholds)
-
-    dt = sorted(depth_thresholds, reverse=True)
-    c = 0
-    for depth in sorted(bases_by_depth.keys(), reverse=True):
-        while depth < dt[c]:
-            c += 1
-            bases_within_threshs[dt[c]] = bases_within_threshs[dt[c - 1]]
-        if depth >= dt[c]:
-            bases_within_threshs[dt[c]] += bases_by_depth[depth]
-    while c + 1 < len(dt):
-        c += 1
-        bases_within_threshs[dt[c]] = total_size
-    for t in dt:
-        bs = bases_within_threshs[t]
-        if total_size > 0:
-            rate = 100.0 * bases_within_threshs[t] / total_size
-            assert rate <= 100, (
-                "Error: rate is > 1: rate = " + str(rate) + ", bases = " + str(bs) + ", size = " + str(total_size)
-            )
-            rates_within_threshs[t] = rate
-    return rates_within_threshs
+def _histogram_dicts(histograms):
+    """Histogram arrays for each sample as dicts of bin value: count, for plotting"""
+    return {s_name: dict(zip(x.tolist(), counts.tolist())) for s_name, (x, counts) in histograms.items()}
@@ -7,7 +7,6 @@ The main function to run MultiQC. Sorry about the messy namespace.
 Primarily called by multiqc.__main__.py
 Imported by __init__.py so available as multiqc.run()
 """
-import base64
 import errno
 import io
 import os
@@ -18,18 +17,28 @@ import sys
 import tempfile
 import time
 import traceback
-from distutils.dir_util import copy_tree
-from urllib.request import urlopen
 
 import jinja2
 import rich
+import rich.panel
 import rich_click as click
 from packaging import version
-from rich.syntax import Syntax
 
 from .modules.base_module import ModuleNoSamplesFound
-from .plots import table
-from .utils import config, log, megaqc, plugin_hooks, report, software_versions, strict_helpers, util_functions
+from .utils import (
+    asset_cache,
+    config,
+    flat_plots,
+    log,
+    megaqc,
+    parallel,
+    parse_cache,
+    plugin_hooks,
+    report,
+    software_versions,
+    strict_helpers,
+    util_functions,
+)
 
 # Set up logging
 start_execution_time = time.time()
@@ -113,6 +122,10 @@ click.rich_click.OPTION_GROUPS = {
                 "--quiet",
                 "--strict",
                 "--profile-runtime",
+                "--search-workers",
+                "--module-workers",
+                "--plot-workers",
+                "--incremental",
                 "--no-megaqc-upload",
                 "--no-ansi",
                 "--version",
@@ -264,6 +277,29 @@ click.rich_click.OPTION_GROUPS = {
 @click.option("-v", "--verbose", count=True, default=0, help="Increase output verbosity.")
 @click.option("-q", "--quiet", is_flag=True, help="Only show log warnings")
 @click.option("--profile-runtime", is_flag=True, help="Add analysis of how long MultiQC takes to run to the report")
+@click.option(
+    "--search-workers",
+    "search_workers",
+    type=int,
+    help="Number of threads to use when searching for files [i](default: 1)[/]",
+)
+@click.option(
+    "--module-workers",
+    "module_workers",
+    type=int,
+    help="Number of processes to use when running modules [i](default: 1)[/]",
+)
+@click.option(
+    "--plot-workers",
+    "plot_workers",
+    type=int,
+    help="Number of processes to use when rendering flat plots [i](default: 1)[/]",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="Only parse log files that have changed since the previous run with this output directory",
+)
 @click.option("--no-ansi", is_flag=True, help="Disable coloured log output")
 @click.option(
     "--custom-css-file",
@@ -335,6 +371,10 @@ def run(
     verbose=0,
     quiet=False,
     profile_runtime=False,
+    search_workers=None,
+    module_workers=None,
+    plot_workers=None,
+    incremental=False,
     no_ansi=False,
     custom_css_files=(),
     **kwargs,
@@ -389,6 +429,8 @@ def run(
     # Check that we're running the latest version of MultiQC
     if config.no_version_check is not True:
         try:
+            from urllib.request import urlopen
+
             response = urlopen("http://multiqc.info/version.php?v={}".format(config.short_version), timeout=5)
             remote_version = response.read().decode("utf-8").strip()
             if version.StrictVersion(re.sub(r"[^0-9.]", "", remote_version)) > version.StrictVersion(
@@ -473,6 +515,14 @@ def run(
         config.exclude_modules = exclude
     if profile_runtime:
         config.profile_runtime = True
+    if search_workers is not None:
+        config.filesearch_workers = search_workers
+    if module_workers is not None:
+        config.module_workers = module_workers
+    if plot_workers is not None:
+        config.plots_flat_workers = plot_workers
+    if incremental:
+        config.incremental = True
     if no_ansi:
         config.no_ansi = True
     if custom_css_files:
@@ -660,11 +710,18 @@ def run(
     run_modules = [m for m in run_modules if list(m.keys())[0].lower() in non_empty_modules]
     run_module_names = [list(m.keys())[0] for m in run_modules]
 
+    # Load results from the previous run for --incremental
+    parse_cache.init()
+
     # Run the modules!
     plugin_hooks.mqc_trigger("before_modules")
     report.modules_output = list()
     sys_exit_code = 0
     total_mods_starttime = time.time()
+    # Start running modules in worker processes, results are collected in order below
+    module_pool = None
+    if config.module_workers > 1 and len(run_modules) > 1:
+        module_pool = parallel.start_module_pool(run_modules, tmp_dir)
     for mod_idx, mod_dict in enumerate(run_modules):
         mod_starttime = time.time()
         this_module = list(mod_dict.keys())[0]
@@ -672,9 +729,14 @@ def run(
         if mod_cust_config is None:
             mod_cust_config = {}
         try:
-            mod = config.avail_modules[this_module].load()
-            mod.mod_cust_config = mod_cust_config  # feels bad doing this, but seems to work
-            output = mod()
+            output = None
+            if module_pool is not None:
+                output = module_pool.get_output(mod_idx)
+            if output is None:
+                # Not run in a worker process, or results clash with an earlier module
+                mod = config.avail_modules[this_module].load()
+                mod.mod_cust_config = mod_cust_config  # feels bad doing this, but seems to work
+                output = mod()
             if type(output) != list:
                 output = [output]
             for m in output:
@@ -718,6 +780,8 @@ def run(
                 logger.debug(msg)
             logger.debug(f"No samples found: {this_module}")
         except KeyboardInterrupt:
+            if module_pool is not None:
+                module_pool.terminate()
             shutil.rmtree(tmp_dir)
             logger.critical(
                 "User Cancelled Execution!\n{eq}\n{tb}{eq}\n".format(eq=("=" * 60), tb=traceback.format_exc())
@@ -742,6 +806,8 @@ def run(
                             issue_url, report.last_found_file
                         )
                     )
+                    from rich.syntax import Syntax
+
                     yield Syntax(traceback.format_exc(), "python")
 
                 def __rich_measure__(self, console: rich.console.Console, options: rich.console.ConsoleOptions):
@@ -778,7 +844,12 @@ def run(
             # Exit code 1 for CI failures etc
             sys_exit_code = 1
 
-        report.runtimes["mods"][run_module_names[mod_idx]] = time.time() - mod_starttime
+        if module_pool is not None and mod_idx in module_pool.runtimes:
+            report.runtimes["mods"][run_module_names[mod_idx]] = module_pool.runtimes[mod_idx]
+        else:
+            report.runtimes["mods"][run_module_names[mod_idx]] = time.time() - mod_starttime
+    if module_pool is not None:
+        module_pool.close()
     report.runtimes["total_mods"] = time.time() - total_mods_starttime
 
     # Update report with software versions provided in configs
@@ -864,6 +935,11 @@ def run(
 
     plugin_hooks.mqc_trigger("after_modules")
 
+    # Draw the flat plots that modules have queued
+    runtime_flat_plots_start = time.time()
+    flat_plots.render_all()
+    report.runtimes["total_flat_plots"] = time.time() - runtime_flat_plots_start
+
     # Remove empty data sections from the General Stats table
     empty_keys = [i for i, d in enumerate(report.general_stats_data[:]) if len(d) == 0]
     empty_keys.sort(reverse=True)
@@ -889,6 +965,8 @@ def run(
             "save_file": True,
             "raw_data_fn": "multiqc_general_stats",
         }
+        from .plots import table
+
         report.general_stats_html = table.plot(report.general_stats_data, report.general_stats_headers, pconfig)
     else:
         config.skip_generalstats = True
@@ -900,12 +978,17 @@ def run(
         # Create a file with the module DOIs
         report.dois_tofile(report.modules_output)
 
+        # Save parse results for the next run with --incremental
+        parse_cache.save()
+
     if config.make_report:
-        # Compress the report plot JSON data
-        runtime_compression_start = time.time()
-        logger.debug("Compressing plot data")
-        report.plot_compressed_json = report.compress_json(report.plot_data)
-        report.runtimes["total_compression"] = time.time() - runtime_compression_start
+        # Compress the report plot JSON data, separately for each plot so that
+        # the browser only needs to decompress the data for plots that are viewed.
+        # Each plot is compressed as the report is written. Data for virtual tables
+        # is compressed in the same way, but is not saved to multiqc_data.json.
+        report.plot_compressed_chunks = report.CompressedPlotData({**report.plot_data, **report.table_data})
+        # All plot data in one lzstring-compressed string, for older custom templates
+        report.plot_compressed_json = report.CompressedPlotJson(report.plot_data)
 
     plugin_hooks.mqc_trigger("before_report_generation")
 
@@ -994,8 +1077,8 @@ def run(
             )
             # Modules have run, so data directory should be complete by now. Move its contents.
             logger.debug("Moving data file from '{}' to '{}'".format(config.data_tmp_dir, config.data_dir))
-            # Disable preserving of times and mode on purpose to avoid problems with mounted CIFS shares (see #625)
-            copy_tree(config.data_tmp_dir, config.data_dir, preserve_times=0, preserve_mode=0)
+            # Times and modes are not copied on purpose to avoid problems with mounted CIFS shares (see #625)
+            util_functions.copy_tree(config.data_tmp_dir, config.data_dir)
             shutil.rmtree(config.data_tmp_dir)
 
         logger.debug("Full report path: {}".format(os.path.realpath(config.output_fn)))
@@ -1021,67 +1104,72 @@ def run(
 
             # Modules have run, so plots directory should be complete by now. Move its contents.
             logger.debug("Moving plots directory from '{}' to '{}'".format(config.plots_tmp_dir, config.plots_dir))
-            # Disable preserving of times and mode on purpose to avoid problems with mounted CIFS shares (see #625)
-            copy_tree(config.plots_tmp_dir, config.plots_dir, preserve_times=0, preserve_mode=0)
+            # Times and modes are not copied on purpose to avoid problems with mounted CIFS shares (see #625)
+            util_functions.copy_tree(config.plots_tmp_dir, config.plots_dir)
             shutil.rmtree(config.plots_tmp_dir)
 
     plugin_hooks.mqc_trigger("before_template")
 
     # Generate report if required
     if config.make_report:
-        # Load in parent template files first if a child theme
+        runtime_render_start = time.time()
+        # Find template files in the theme first, followed by the parent template if a child theme
+        template_dirs = [template_mod.template_dir]
         try:
             parent_template = config.avail_templates[template_mod.template_parent].load()
-            copy_tree(parent_template.template_dir, tmp_dir)
+            template_dirs.append(parent_template.template_dir)
         except AttributeError:
             pass  # Not a child theme
 
-        # Copy the template files to the tmp directory (distutils overwrites parent theme files)
-        copy_tree(template_mod.template_dir, tmp_dir)
-
-        # Function to include file contents in Jinja template
-        def include_file(name, fdir=tmp_dir, b64=False):
-            try:
-                if fdir is None:
-                    fdir = ""
-                if b64:
-                    with io.open(os.path.join(fdir, name), "rb") as f:
-                        return base64.b64encode(f.read()).decode("utf-8")
-                else:
-                    with io.open(os.path.join(fdir, name), "r", encoding="utf-8") as f:
-                        return f.read()
-            except (OSError, IOError) as e:
-                logger.error("Could not include file '{}': {}".format(name, e))
+        # Contents of files included in the report, cached between runs if requested
+        asset_cache_path = asset_cache.cache_path(config.template) if config.template_asset_cache else None
+        assets = asset_cache.AssetBundle(template_dirs, asset_cache_path)
 
         # Load the report template
         try:
-            env = jinja2.Environment(loader=jinja2.FileSystemLoader(tmp_dir))
-            env.globals["include_file"] = include_file
+            env = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dirs))
+            env.globals["include_file"] = assets.include_file
             j_template = env.get_template(template_mod.base_fn)
         except:
             raise IOError("Could not load {} template file '{}'".format(config.template, template_mod.base_fn))
 
-        # Use jinja2 to render the template and overwrite
+        # Use jinja2 to render the template and overwrite.
+        # Streamed to the output piece by piece, rather than building the whole report in memory.
         config.analysis_dir = [os.path.realpath(d) for d in config.analysis_dir]
-        report_output = j_template.render(report=report, config=config)
+        report_stream = j_template.stream(report=report, config=config)
         if filename == "stdout":
-            print(report_output.encode("utf-8"), file=sys.stdout)
+            sys.stdout.flush()
+            report_stream.dump(sys.stdout.buffer, encoding="utf-8")
+            sys.stdout.buffer.write(b"\n")
         else:
+            # Written to a temporary file first, so that an error doesn't leave a partial report
+            tmp_output_fn = "{}.{}.tmp".format(config.output_fn, os.getpid())
             try:
-                with io.open(config.output_fn, "w", encoding="utf-8") as f:
-                    print(report_output, file=f)
+                with io.open(tmp_output_fn, "w", encoding="utf-8", buffering=1024 * 1024) as f:
+                    report_stream.dump(f)
+                    f.write("\n")
+                os.replace(tmp_output_fn, config.output_fn)
             except IOError as e:
                 raise IOError("Could not print report to '{}' - {}".format(config.output_fn, IOError(e)))
+            finally:
+                if os.path.exists(tmp_output_fn):
+                    os.remove(tmp_output_fn)
 
-            # Copy over files if requested by the theme
+            # Copy over files if requested by the theme (theme files overwrite parent theme files)
             try:
                 for f in template_mod.copy_files:
-                    fn = os.path.join(tmp_dir, f)
                     dest_dir = os.path.join(os.path.dirname(config.output_fn), f)
-                    copy_tree(fn, dest_dir)
+                    for template_dir in reversed(template_dirs):
+                        if os.path.exists(os.path.join(template_dir, f)):
+                            util_functions.copy_tree(os.path.join(template_dir, f), dest_dir)
             except AttributeError:
                 pass  # No files to copy
 
+        assets.save()
+
+        # Plot data is compressed while rendering, this is reported separately
+        report.runtimes["total_render"] = time.time() - runtime_render_start - report.runtimes["total_compression"]
+
     # Clean up temporary directory
     shutil.rmtree(tmp_dir)
 
@@ -1136,8 +1224,11 @@ def run(
         logger.warning("Run took {:.2f} seconds".format(report.runtimes["total"]))
         logger.warning(" - {:.2f}s: Searching files".format(report.runtimes["total_sp"]))
         logger.warning(" - {:.2f}s: Running modules".format(report.runtimes["total_mods"]))
+        if report.runtimes["total_flat_plots"] > 0:
+            logger.warning(" - {:.2f}s: Rendering flat plots".format(report.runtimes["total_flat_plots"]))
         if config.make_report:
             logger.warning(" - {:.2f}s: Compressing report data".format(report.runtimes["total_compression"]))
+            logger.warning(" - {:.2f}s: Rendering report template".format(report.runtimes["total_render"]))
             logger.info(
                 "For more information, see the 'Run Time' section in {}".format(os.path.relpath(config.output_fn))
             )
@@ -3,36 +3,18 @@
 """ MultiQC functions to plot a bargraph """
 
 
-import base64
+import copy
 import inspect
-import io
 import logging
 import math
-import os
 import random
 import re
-import sys
 from collections import OrderedDict
 
-from multiqc.utils import config, mqc_colour, report, util_functions
+from multiqc.utils import config, flat_plots, mqc_colour, report, util_functions
 
 logger = logging.getLogger(__name__)
 
-try:
-    # Import matplot lib but avoid default X environment
-    import matplotlib
-
-    matplotlib.use("Agg")
-    import matplotlib.pyplot as plt
-
-    logger.debug("Using matplotlib version {}".format(matplotlib.__version__))
-except Exception as e:
-    # MatPlotLib can break in a variety of ways. Fake an error message and continue without it if so.
-    # The lack of the library will be handled when plots are attempted
-    print("##### ERROR! MatPlotLib library could not be loaded!    #####", file=sys.stderr)
-    print("##### Flat plots will instead be plotted as interactive #####", file=sys.stderr)
-    print(e)
-
 letters = "abcdefghijklmnopqrstuvwxyz"
 
 # Load the template so that we can access its configuration
@@ -217,7 +199,7 @@ def plot(data, cats=None, pconfig=None):
         # Use MatPlotLib to generate static plots if requested
         if config.export_plots:
             try:
-                matplotlib_bargraph(plotdata, plotsamples, pconfig)
+                matplotlib_bargraph(plotdata, plotsamples, pconfig, fallback=False)
             except Exception as e:
                 logger.error("############### Error making MatPlotLib figure! Plot not exported.")
                 logger.debug(e, exc_info=True)
@@ -320,11 +302,12 @@ def highcharts_bargraph(plotdata, plotsamples=None, pconfig=None):
     return html
 
 
-def matplotlib_bargraph(plotdata, plotsamples, pconfig=None):
+def matplotlib_bargraph(plotdata, plotsamples, pconfig=None, fallback=True):
     """
     Plot a bargraph with Matplot lib and return a HTML string. Either embeds a base64
     encoded image within HTML or writes the plot and links to it. Should be called by
     plot_bargraph, which properly formats the input data.
+    Without fallback, the HTML is only for exporting and is not kept for a HighCharts fallback.
     """
 
     if pconfig is None:
@@ -354,6 +337,7 @@ def matplotlib_bargraph(plotdata, plotsamples, pconfig=None):
         + '(see the <a href="http://multiqc.info/docs/#flat--interactive-plots" target="_blank">docs</a>).</small></p>'
     )
     html += '<div class="mqc_mplplot_plotgroup" id="{}">'.format(pconfig["id"])
+    fig_pids = []
 
     # Counts / Percentages Switch
     if pconfig.get("cpswitch") is not False and not config.simple_output:
@@ -390,6 +374,9 @@ def matplotlib_bargraph(plotdata, plotsamples, pconfig=None):
             )
         html += "</div>\n\n"
 
+    # Figures are drawn after all modules have run, and modules can change pconfig after plotting
+    fig_pconfig = copy.deepcopy(pconfig)
+
     # Go through datasets creating plots
     for pidx, pdata in enumerate(plotdata):
         # Save plot data to file
@@ -424,151 +411,137 @@ def matplotlib_bargraph(plotdata, plotsamples, pconfig=None):
                 if pconfig.get("cpswitch_c_active", True) is not True:
                     hide_plot = True
 
-            # Set up figure
-
-            # Height has a default, then adjusted by the number of samples
-            plt_height = len(plotsamples[pidx]) / 2.3  # Default in inches, empirically determined
-            plt_height = max(6, plt_height)  # At least 6" tall
-            plt_height = min(30, plt_height)  # Cap at 30" tall
-
-            # Use fixed height if pconfig['height'] is set (convert pixels -> inches)
-            if "height" in pconfig:
-                # Default interactive height in pixels = 512
-                # Not perfect replication, but good enough
-                plt_height = 6 * (pconfig["height"] / 512)
-
-            bar_width = 0.8
-
-            fig = plt.figure(figsize=(14, plt_height), frameon=False)
-            axes = fig.add_subplot(111)
-            y_ind = range(len(plotsamples[pidx]))
-
-            # Count totals for each sample
-            if plot_pct is True:
-                s_totals = [0 for _ in pdata[0]["data"]]
-                for series_idx, d in enumerate(pdata):
-                    for sample_idx, v in enumerate(d["data"]):
-                        s_totals[sample_idx] += v
-
-            # Plot bars
-            dlabels = []
-            prev_values = None
-            for idx, d in enumerate(pdata):
-                # Plot percentages
-                values = [x for x in d["data"]]
-                if len(values) < len(y_ind):
-                    values.extend([0] * (len(y_ind) - len(values)))
-                if plot_pct is True:
-                    for key, var in enumerate(values):
-                        s_total = s_totals[key]
-                        if s_total == 0:
-                            values[key] = 0
-                        else:
-                            values[key] = (float(var + 0.0) / float(s_total)) * 100
-
-                # Get offset for stacked bars
-                if idx == 0:
-                    prevdata = [0] * len(plotsamples[pidx])
-                else:
-                    for i, p in enumerate(prevdata):
-                        prevdata[i] += prev_values[i]
-                # Save the name of this series
-                dlabels.append(d["name"])
-                # Add the series of bars to the plot
-                axes.barh(
-                    y_ind,
-                    values,
-                    bar_width,
-                    left=prevdata,
-                    color=d["color"],
-                    align="center",
-                    linewidth=pconfig.get("borderWidth", 0),
-                )
-                prev_values = values
-
-            # Tidy up axes
-            axes.tick_params(
-                labelsize=pconfig.get("labelSize", 8), direction="out", left=False, right=False, top=False, bottom=False
-            )
-            axes.set_xlabel(pconfig.get("ylab", ""))  # I know, I should fix the fact that the config is switched
-            axes.set_ylabel(pconfig.get("xlab", ""))
-            axes.set_yticks(y_ind)  # Specify where to put the labels
-            axes.set_yticklabels(plotsamples[pidx])  # Set y axis sample name labels
-            axes.set_ylim((-0.5, len(y_ind) - 0.5))  # Reduce padding around plot area
-            if plot_pct is True:
-                axes.set_xlim((0, 100))
-                # Add percent symbols
-                vals = axes.get_xticks()
-                axes.set_xticks(axes.get_xticks())
-                axes.set_xticklabels(["{:.0f}%".format(x) for x in vals])
-            else:
-                default_xlimits = axes.get_xlim()
-                axes.set_xlim((pconfig.get("ymin", default_xlimits[0]), pconfig.get("ymax", default_xlimits[1])))
-            if "title" in pconfig:
-                top_gap = 1 + (0.5 / plt_height)
-                plt.text(
-                    0.5, top_gap, pconfig["title"], horizontalalignment="center", fontsize=16, transform=axes.transAxes
-                )
-            axes.grid(True, zorder=0, which="both", axis="x", linestyle="-", color="#dedede", linewidth=1)
-            axes.set_axisbelow(True)
-            axes.spines["right"].set_visible(False)
-            axes.spines["top"].set_visible(False)
-            axes.spines["bottom"].set_visible(False)
-            axes.spines["left"].set_visible(False)
-            plt.gca().invert_yaxis()  # y axis is reverse sorted otherwise
-
-            # Hide some labels if we have a lot of samples
-            show_nth = max(1, math.ceil(len(pdata[0]["data"]) / 150))
-            for idx, label in enumerate(axes.get_yticklabels()):
-                if idx % show_nth != 0:
-                    label.set_visible(False)
-
-            # Legend
-            bottom_gap = -1 * (1 - ((plt_height - 1.5) / plt_height))
-            lgd = axes.legend(
-                dlabels,
-                loc="lower center",
-                bbox_to_anchor=(0, bottom_gap, 1, 0.102),
-                ncol=5,
-                mode="expand",
-                fontsize=pconfig.get("labelSize", 8),
-                frameon=False,
-            )
-
             # Should this plot be hidden on report load?
             hidediv = ""
             if pidx > 0 or hide_plot:
                 hidediv = ' style="display:none;"'
 
-            # Save the plot to the data directory if export is requested
-            if config.export_plots:
-                for fformat in config.export_plot_formats:
-                    # Make the directory if it doesn't already exist
-                    plot_dir = os.path.join(config.plots_dir, fformat)
-                    if not os.path.exists(plot_dir):
-                        os.makedirs(plot_dir)
-                    # Save the plot
-                    plot_fn = os.path.join(plot_dir, "{}.{}".format(pid, fformat))
-                    fig.savefig(plot_fn, format=fformat, bbox_extra_artists=(lgd,), bbox_inches="tight")
-
-            # Output the figure to a base64 encoded string
-            if getattr(get_template_mod(), "base64_plots", True) is True:
-                img_buffer = io.BytesIO()
-                fig.savefig(img_buffer, format="png", bbox_inches="tight")
-                b64_img = base64.b64encode(img_buffer.getvalue()).decode("utf8")
-                img_buffer.close()
-                html += '<div class="mqc_mplplot" id="{}"{}><img src="data:image/png;base64,{}" /></div>'.format(
-                    pid, hidediv, b64_img
-                )
-
-            # Link to the saved image
-            else:
-                plot_relpath = os.path.join(config.plots_dir_name, "png", "{}.png".format(pid))
-                html += '<div class="mqc_mplplot" id="{}"{}><img src="{}" /></div>'.format(pid, hidediv, plot_relpath)
-
-            plt.close(fig)
+            # Draw the figure after all modules have run. Embed it as a base64 encoded
+            # string, or link to the exported file if the template doesn't use base64.
+            embed = getattr(get_template_mod(), "base64_plots", True) is True
+            img_src = flat_plots.add(
+                pid, _matplotlib_bargraph_figure, pdata, plotsamples[pidx], fig_pconfig, plot_pct, embed=embed
+            )
+            html += '<div class="mqc_mplplot" id="{}"{}><img src="{}" /></div>'.format(pid, hidediv, img_src)
+            fig_pids.append(pid)
 
     # Close wrapping div
     html += "</div>"
 
-    return html
+    # Use the interactive plot instead if any of the figures can't be drawn
+    if not fallback:
+        return html
+    return flat_plots.group(pconfig["id"], fig_pids, html, highcharts_bargraph, plotdata, plotsamples, fig_pconfig)
+
+
+def _matplotlib_bargraph_figure(pdata, samples, pconfig, plot_pct):
+    """Draw one dataset of a flat bar graph. Returns the figure and extra arguments for savefig()"""
+    plt = flat_plots.pyplot()
+    # Height has a default, then adjusted by the number of samples
+    plt_height = len(samples) / 2.3  # Default in inches, empirically determined
+    plt_height = max(6, plt_height)  # At least 6" tall
+    plt_height = min(30, plt_height)  # Cap at 30" tall
+
+    # Use fixed height if pconfig['height'] is set (convert pixels -> inches)
+    if "height" in pconfig:
+        # Default interactive height in pixels = 512
+        # Not perfect replication, but good enough
+        plt_height = 6 * (pconfig["height"] / 512)
+
+    bar_width = 0.8
+
+    fig = plt.figure(figsize=(14, plt_height), frameon=False)
+    axes = fig.add_subplot(111)
+    y_ind = range(len(samples))
+
+    # Count totals for each sample
+    if plot_pct is True:
+        s_totals = [0 for _ in pdata[0]["data"]]
+        for series_idx, d in enumerate(pdata):
+            for sample_idx, v in enumerate(d["data"]):
+                s_totals[sample_idx] += v
+
+    # Plot bars
+    dlabels = []
+    prev_values = None
+    for idx, d in enumerate(pdata):
+        # Plot percentages
+        values = [x for x in d["data"]]
+        if len(values) < len(y_ind):
+            values.extend([0] * (len(y_ind) - len(values)))
+        if plot_pct is True:
+            for key, var in enumerate(values):
+                s_total = s_totals[key]
+                if s_total == 0:
+                    values[key] = 0
+                else:
+                    values[key] = (float(var + 0.0) / float(s_total)) * 100
+
+        # Get offset for stacked bars
+        if idx == 0:
+            prevdata = [0] * len(samples)
+        else:
+            for i, p in enumerate(prevdata):
+                prevdata[i] += prev_values[i]
+        # Save the name of this series
+        dlabels.append(d["name"])
+        # Add the series of bars to the plot
+        axes.barh(
+            y_ind,
+            values,
+            bar_width,
+            left=prevdata,
+            color=d["color"],
+            align="center",
+            linewidth=pconfig.get("borderWidth", 0),
+        )
+        prev_values = values
+
+    # Tidy up axes
+    axes.tick_params(
+        labelsize=pconfig.get("labelSize", 8), direction="out", left=False, right=False, top=False, bottom=False
+    )
+    axes.set_xlabel(pconfig.get("ylab", ""))  # I know, I should fix the fact that the config is switched
+    axes.set_ylabel(pconfig.get("xlab", ""))
+    axes.set_yticks(y_ind)  # Specify where to put the labels
+    axes.set_yticklabels(samples)  # Set y axis sample name labels
+    axes.set_ylim((-0.5, len(y_ind) - 0.5))  # Reduce padding around plot area
+    if plot_pct is True:
+        axes.set_xlim((0, 100))
+        # Add percent symbols
+        vals = axes.get_xticks()
+        axes.set_xticks(axes.get_xticks())
+        axes.set_xticklabels(["{:.0f}%".format(x) for x in vals])
+    else:
+        default_xlimits = axes.get_xlim()
+        axes.set_xlim((pconfig.get("ymin", default_xlimits[0]), pconfig.get("ymax", default_xlimits[1])))
+    if "title" in pconfig:
+        top_gap = 1 + (0.5 / plt_height)
+        plt.text(0.5, top_gap, pconfig["title"], horizontalalignment="center", fontsize=16, transform=axes.transAxes)
+    axes.grid(True, zorder=0, which="both", axis="x", linestyle="-", color="#dedede", linewidth=1)
+    axes.set_axisbelow(True)
+    axes.spines["right"].set_visible(False)
+    axes.spines["top"].set_visible(False)
+    axes.spines["bottom"].set_visible(False)
+    axes.spines["left"].set_visible(False)
+    plt.gca().invert_yaxis()  # y axis is reverse sorted otherwise
+
+    # Hide some labels if we have a lot of samples
+    show_nth = max(1, math.ceil(len(pdata[0]["data"]) / 150))
+    for idx, label in enumerate(axes.get_yticklabels()):
+        if idx % show_nth != 0:
+            label.set_visible(False)
+
+    # Legend
+    bottom_gap = -1 * (1 - ((plt_height - 1.5) / plt_height))
+    lgd = axes.legend(
+        dlabels,
+        loc="lower center",
+        bbox_to_anchor=(0, bottom_gap, 1, 0.102),
+        ncol=5,
+        mode="expand",
+        fontsize=pconfig.get("labelSize", 8),
+        frameon=False,
+    )
+
+    return fig, {"bbox_extra_artists": (lgd,)}
@@ -2,34 +2,20 @@
 
 """ MultiQC functions to plot a linegraph """
 
-import base64
+import copy
 import inspect
 import io
 import logging
 import os
 import random
 import re
-import sys
 from collections import OrderedDict
 
-from multiqc.utils import config, mqc_colour, report, util_functions
+import numpy as np
 
-logger = logging.getLogger(__name__)
-
-try:
-    # Import matplot lib but avoid default X environment
-    import matplotlib
-
-    matplotlib.use("Agg")
-    import matplotlib.pyplot as plt
+from multiqc.utils import config, flat_plots, mqc_colour, report, util_functions
 
-    logger.debug("Using matplotlib version {}".format(matplotlib.__version__))
-except Exception as e:
-    # MatPlotLib can break in a variety of ways. Fake an error message and continue without it if so.
-    # The lack of the library will be handled when plots are attempted
-    print("##### ERROR! MatPlotLib library could not be loaded!    #####", file=sys.stderr)
-    print("##### Flat plots will instead be plotted as interactive #####", file=sys.stderr)
-    print(e)
+logger = logging.getLogger(__name__)
 
 letters = "abcdefghijklmnopqrstuvwxyz"
 
@@ -97,7 +83,7 @@ def plot(data, pconfig=None):
                 sumc = sumcounts[i]
             else:
                 sumc = sumcounts
-            data[i] = smooth_line_data(d, pconfig["smooth_points"], sumc)
+            data[i] = smooth_line_data(d, pconfig["smooth_points"], sumc, pconfig.get("smooth_method", "first"))
 
     # Add sane plotting config defaults
     for idx, yp in enumerate(pconfig.get("yPlotLines", [])):
@@ -120,14 +106,18 @@ def plot(data, pconfig=None):
     for data_index, d in enumerate(data):
         thisplotdata = list()
 
-        for s in sorted(d.keys()):
-            # Ensure any overwritten conditionals from data_labels (e.g. ymax) are taken in consideration
-            series_config = pconfig.copy()
-            if (
-                "data_labels" in pconfig and type(pconfig["data_labels"][data_index]) is dict
-            ):  # if not a dict: only dataset name is provided
-                series_config.update(pconfig["data_labels"][data_index])
+        # Ensure any overwritten conditionals from data_labels (e.g. ymax) are taken in consideration
+        series_config = pconfig.copy()
+        if (
+            "data_labels" in pconfig and type(pconfig["data_labels"][data_index]) is dict
+        ):  # if not a dict: only dataset name is provided
+            series_config.update(pconfig["data_labels"][data_index])
+        xmax = float(series_config["xmax"]) if "xmax" in series_config else None
+        xmin = float(series_config["xmin"]) if "xmin" in series_config else None
+        ymax = float(series_config["ymax"]) if "ymax" in series_config else None
+        ymin = float(series_config["ymin"]) if "ymin" in series_config else None
 
+        for s in sorted(d.keys()):
             pairs = list()
             maxval = 0
             if "categories" in series_config:
@@ -145,49 +135,43 @@ def plot(data, pconfig=None):
                     except KeyError:
                         pairs.append(None)
             else:
+                # Points within the x axis limits
+                points = list()
+                for k in sorted(d[s].keys()):
+                    if k is not None:
+                        if xmax is not None and float(k) > xmax:
+                            continue
+                        if xmin is not None and float(k) < xmin:
+                            continue
+                    points.append((k, d[s][k]))
+
                 # Discard > ymax or just hide?
                 # If it never comes back into the plot, discard. If it goes above then comes back, just hide.
                 discard_ymax = None
                 discard_ymin = None
-                for k in sorted(d[s].keys()):
-                    if "xmax" in series_config and float(k) > float(series_config["xmax"]):
-                        continue
-                    if "xmin" in series_config and float(k) < float(series_config["xmin"]):
-                        continue
-                    if d[s][k] is not None and "ymax" in series_config:
-                        if float(d[s][k]) > float(series_config["ymax"]):
-                            discard_ymax = True
-                        elif discard_ymax is True:
-                            discard_ymax = False
-                    if d[s][k] is not None and "ymin" in series_config:
-                        if float(d[s][k]) > float(series_config["ymin"]):
-                            discard_ymin = True
-                        elif discard_ymin is True:
-                            discard_ymin = False
+                if ymax is not None or ymin is not None:
+                    for k, v in points:
+                        if v is not None and ymax is not None:
+                            if float(v) > ymax:
+                                discard_ymax = True
+                            elif discard_ymax is True:
+                                discard_ymax = False
+                        if v is not None and ymin is not None:
+                            if float(v) > ymin:
+                                discard_ymin = True
+                            elif discard_ymin is True:
+                                discard_ymin = False
 
                 # Build the plot data structure
-                for k in sorted(d[s].keys()):
-                    if k is not None:
-                        if "xmax" in series_config and float(k) > float(series_config["xmax"]):
-                            continue
-                        if "xmin" in series_config and float(k) < float(series_config["xmin"]):
+                for k, v in points:
+                    if v is not None:
+                        if ymax is not None and float(v) > ymax and discard_ymax is not False:
                             continue
-                    if d[s][k] is not None:
-                        if (
-                            "ymax" in series_config
-                            and float(d[s][k]) > float(series_config["ymax"])
-                            and discard_ymax is not False
-                        ):
+                        if ymin is not None and float(v) < ymin and discard_ymin is not False:
                             continue
-                        if (
-                            "ymin" in series_config
-                            and float(d[s][k]) < float(series_config["ymin"])
-                            and discard_ymin is not False
-                        ):
-                            continue
-                    pairs.append([k, d[s][k]])
+                    pairs.append([k, v])
                     try:
-                        maxval = max(maxval, d[s][k])
+                        maxval = max(maxval, v)
                     except TypeError:
                         pass
             if maxval > 0 or series_config.get("hide_empty") is not True:
@@ -246,7 +230,7 @@ def plot(data, pconfig=None):
     else:
         # Use MatPlotLib to generate static plots if requested
         if config.export_plots:
-            matplotlib_linegraph(plotdata, pconfig)
+            matplotlib_linegraph(plotdata, pconfig, fallback=False)
         # Return HTML for HighCharts dynamic plot
         return highcharts_linegraph(plotdata, pconfig)
 
@@ -329,11 +313,12 @@ def highcharts_linegraph(plotdata, pconfig=None):
     return html
 
 
-def matplotlib_linegraph(plotdata, pconfig=None):
+def matplotlib_linegraph(plotdata, pconfig=None, fallback=True):
     """
     Plot a line graph with Matplot lib and return a HTML string. Either embeds a base64
     encoded image within HTML or writes the plot and links to it. Should be called by
     plot_bargraph, which properly formats the input data.
+    Without fallback, the HTML is only for exporting and is not kept for a HighCharts fallback.
     """
     if pconfig is None:
         pconfig = {}
@@ -362,6 +347,7 @@ def matplotlib_linegraph(plotdata, pconfig=None):
         + '(see the <a href="http://multiqc.info/docs/#flat--interactive-plots" target="_blank">docs</a>).</small></p>'
     )
     html += '<div class="mqc_mplplot_plotgroup" id="{}">'.format(pconfig["id"])
+    fig_pids = []
 
     # Buttons to cycle through different datasets
     if len(plotdata) > 1 and not config.simple_output:
@@ -378,6 +364,9 @@ def matplotlib_linegraph(plotdata, pconfig=None):
             )
         html += "</div>\n\n"
 
+    # Figures are drawn after all modules have run, and modules can change pconfig after plotting
+    fig_pconfig = copy.deepcopy(pconfig)
+
     # Go through datasets creating plots
     for pidx, pdata in enumerate(plotdata):
         # Plot ID
@@ -420,193 +409,184 @@ def matplotlib_linegraph(plotdata, pconfig=None):
             else:
                 util_functions.write_data_file(fdata, pid)
 
-        plt_height = 6
-        # Use fixed height if pconfig['height'] is set (convert pixels -> inches)
-        if "height" in pconfig:
-            # Default interactive height in pixels = 512
-            # Not perfect replication, but good enough
-            plt_height = 6 * (pconfig["height"] / 512)
-
-        # Set up figure
-        fig = plt.figure(figsize=(14, plt_height), frameon=False)
-        axes = fig.add_subplot(111)
-
-        # Go through data series
-        for idx, d in enumerate(pdata):
-            # Line style
-            linestyle = "solid"
-            if d.get("dashStyle", None) == "Dash":
-                linestyle = "dashed"
-
-            # Reformat data (again)
-            try:
-                axes.plot(
-                    [x[0] for x in d["data"]],
-                    [x[1] for x in d["data"]],
-                    label=d["name"],
-                    color=d["color"],
-                    linestyle=linestyle,
-                    linewidth=1,
-                    marker=None,
-                )
-            except TypeError:
-                # Categorical data on x axis
-                axes.plot(d["data"], label=d["name"], color=d["color"], linewidth=1, marker=None)
-
-        # Tidy up axes
-        axes.tick_params(
-            labelsize=pconfig.get("labelSize", 8), direction="out", left=False, right=False, top=False, bottom=False
-        )
-        axes.set_xlabel(pconfig.get("xlab", ""))
-        axes.set_ylabel(pconfig.get("ylab", ""))
-
-        # Dataset specific y label
-        try:
-            axes.set_ylabel(pconfig["data_labels"][pidx]["ylab"])
-        except:
-            pass
-
-        # Axis limits
-        default_ylimits = axes.get_ylim()
-        ymin = default_ylimits[0]
-        if "ymin" in pconfig:
-            ymin = pconfig["ymin"]
-        elif "yFloor" in pconfig:
-            ymin = max(pconfig["yFloor"], default_ylimits[0])
-        ymax = default_ylimits[1]
-        if "ymax" in pconfig:
-            ymax = pconfig["ymax"]
-        elif "yCeiling" in pconfig:
-            ymax = min(pconfig["yCeiling"], default_ylimits[1])
-        if (ymax - ymin) < pconfig.get("yMinRange", 0):
-            ymax = ymin + pconfig["yMinRange"]
-        axes.set_ylim((ymin, ymax))
-
-        # Dataset specific ymax
-        try:
-            axes.set_ylim((ymin, pconfig["data_labels"][pidx]["ymax"]))
-        except:
-            pass
-
-        default_xlimits = axes.get_xlim()
-        xmin = default_xlimits[0]
-        if "xmin" in pconfig:
-            xmin = pconfig["xmin"]
-        elif "xFloor" in pconfig:
-            xmin = max(pconfig["xFloor"], default_xlimits[0])
-        xmax = default_xlimits[1]
-        if "xmax" in pconfig:
-            xmax = pconfig["xmax"]
-        elif "xCeiling" in pconfig:
-            xmax = min(pconfig["xCeiling"], default_xlimits[1])
-        if (xmax - xmin) < pconfig.get("xMinRange", 0):
-            xmax = xmin + pconfig["xMinRange"]
-        axes.set_xlim((xmin, xmax))
-
-        # Plot title
-        if "title" in pconfig:
-            plt.text(0.5, 1.05, pconfig["title"], horizontalalignment="center", fontsize=16, transform=axes.transAxes)
-        axes.grid(True, zorder=10, which="both", axis="y", linestyle="-", color="#dedede", linewidth=1)
-
-        # X axis categories, if specified
-        if "categories" in pconfig:
-            axes.set_xticks([i for i, v in enumerate(pconfig["categories"])])
-            axes.set_xticklabels(pconfig["categories"])
-
-        # Axis lines
-        xlim = axes.get_xlim()
-        axes.plot([xlim[0], xlim[1]], [0, 0], linestyle="-", color="#dedede", linewidth=2)
-        axes.set_axisbelow(True)
-        axes.spines["right"].set_visible(False)
-        axes.spines["top"].set_visible(False)
-        axes.spines["bottom"].set_visible(False)
-        axes.spines["left"].set_visible(False)
-
-        # Background colours, if specified
-        if "yPlotBands" in pconfig:
-            xlim = axes.get_xlim()
-            for pb in pconfig["yPlotBands"]:
-                axes.barh(
-                    pb["from"],
-                    xlim[1],
-                    height=pb["to"] - pb["from"],
-                    left=xlim[0],
-                    color=pb["color"],
-                    linewidth=0,
-                    zorder=0,
-                    align="edge",
-                )
-        if "xPlotBands" in pconfig:
-            ylim = axes.get_ylim()
-            for pb in pconfig["xPlotBands"]:
-                axes.bar(
-                    pb["from"],
-                    ylim[1],
-                    width=pb["to"] - pb["from"],
-                    bottom=ylim[0],
-                    color=pb["color"],
-                    linewidth=0,
-                    zorder=0,
-                    align="edge",
-                )
-
-        # Tight layout - makes sure that legend fits in and stuff
-        if len(pdata) <= 15:
-            axes.legend(
-                loc="lower center",
-                bbox_to_anchor=(0, -0.22, 1, 0.102),
-                ncol=5,
-                mode="expand",
-                fontsize=pconfig.get("labelSize", 8),
-                frameon=False,
-            )
-            plt.tight_layout(rect=[0, 0.08, 1, 0.92])
-        else:
-            plt.tight_layout(rect=[0, 0, 1, 0.92])
-
         # Should this plot be hidden on report load?
         hidediv = ""
         if pidx > 0:
             hidediv = ' style="display:none;"'
 
-        # Save the plot to the data directory if export is requests
-        if config.export_plots:
-            for fformat in config.export_plot_formats:
-                # Make the directory if it doesn't already exist
-                plot_dir = os.path.join(config.plots_dir, fformat)
-                if not os.path.exists(plot_dir):
-                    os.makedirs(plot_dir)
-                # Save the plot
-                plot_fn = os.path.join(plot_dir, "{}.{}".format(pid, fformat))
-                fig.savefig(plot_fn, format=fformat, bbox_inches="tight")
-
-        # Output the figure to a base64 encoded string
-        if getattr(get_template_mod(), "base64_plots", True) is True:
-            img_buffer = io.BytesIO()
-            fig.savefig(img_buffer, format="png", bbox_inches="tight")
-            b64_img = base64.b64encode(img_buffer.getvalue()).decode("utf8")
-            img_buffer.close()
-            html += '<div class="mqc_mplplot" id="{}"{}><img src="data:image/png;base64,{}" /></div>'.format(
-                pid, hidediv, b64_img
+        # Draw the figure after all modules have run. Embed it as a base64 encoded
+        # string, or link to the exported file if the template doesn't use base64.
+        embed = getattr(get_template_mod(), "base64_plots", True) is True
+        img_src = flat_plots.add(pid, _matplotlib_linegraph_figure, pdata, fig_pconfig, pidx, embed=embed)
+        html += '<div class="mqc_mplplot" id="{}"{}><img src="{}" /></div>'.format(pid, hidediv, img_src)
+        fig_pids.append(pid)
+
+    # Close wrapping div
+    html += "</div>"
+
+    # Use the interactive plot instead if any of the figures can't be drawn
+    if not fallback:
+        return html
+    return flat_plots.group(pconfig["id"], fig_pids, html, highcharts_linegraph, plotdata, fig_pconfig)
+
+
+def _matplotlib_linegraph_figure(pdata, pconfig, pidx):
+    """Draw one dataset of a flat line graph. Returns the figure and extra arguments for savefig()"""
+    plt = flat_plots.pyplot()
+    plt_height = 6
+    # Use fixed height if pconfig['height'] is set (convert pixels -> inches)
+    if "height" in pconfig:
+        # Default interactive height in pixels = 512
+        # Not perfect replication, but good enough
+        plt_height = 6 * (pconfig["height"] / 512)
+
+    # Set up figure
+    fig = plt.figure(figsize=(14, plt_height), frameon=False)
+    axes = fig.add_subplot(111)
+
+    # Go through data series
+    for idx, d in enumerate(pdata):
+        # Line style
+        linestyle = "solid"
+        if d.get("dashStyle", None) == "Dash":
+            linestyle = "dashed"
+
+        # Reformat data (again)
+        try:
+            axes.plot(
+                [x[0] for x in d["data"]],
+                [x[1] for x in d["data"]],
+                label=d["name"],
+                color=d["color"],
+                linestyle=linestyle,
+                linewidth=1,
+                marker=None,
             )
+        except TypeError:
+            # Categorical data on x axis
+            axes.plot(d["data"], label=d["name"], color=d["color"], linewidth=1, marker=None)
 
-        # Save to a file and link <img>
-        else:
-            plot_relpath = os.path.join(config.plots_dir_name, "png", "{}.png".format(pid))
-            html += '<div class="mqc_mplplot" id="{}"{}><img src="{}" /></div>'.format(pid, hidediv, plot_relpath)
+    # Tidy up axes
+    axes.tick_params(
+        labelsize=pconfig.get("labelSize", 8), direction="out", left=False, right=False, top=False, bottom=False
+    )
+    axes.set_xlabel(pconfig.get("xlab", ""))
+    axes.set_ylabel(pconfig.get("ylab", ""))
 
-        plt.close(fig)
+    # Dataset specific y label
+    try:
+        axes.set_ylabel(pconfig["data_labels"][pidx]["ylab"])
+    except:
+        pass
 
-    # Close wrapping div
-    html += "</div>"
+    # Axis limits
+    default_ylimits = axes.get_ylim()
+    ymin = default_ylimits[0]
+    if "ymin" in pconfig:
+        ymin = pconfig["ymin"]
+    elif "yFloor" in pconfig:
+        ymin = max(pconfig["yFloor"], default_ylimits[0])
+    ymax = default_ylimits[1]
+    if "ymax" in pconfig:
+        ymax = pconfig["ymax"]
+    elif "yCeiling" in pconfig:
+        ymax = min(pconfig["yCeiling"], default_ylimits[1])
+    if (ymax - ymin) < pconfig.get("yMinRange", 0):
+        ymax = ymin + pconfig["yMinRange"]
+    axes.set_ylim((ymin, ymax))
+
+    # Dataset specific ymax
+    try:
+        axes.set_ylim((ymin, pconfig["data_labels"][pidx]["ymax"]))
+    except:
+        pass
 
-    return html
+    default_xlimits = axes.get_xlim()
+    xmin = default_xlimits[0]
+    if "xmin" in pconfig:
+        xmin = pconfig["xmin"]
+    elif "xFloor" in pconfig:
+        xmin = max(pconfig["xFloor"], default_xlimits[0])
+    xmax = default_xlimits[1]
+    if "xmax" in pconfig:
+        xmax = pconfig["xmax"]
+    elif "xCeiling" in pconfig:
+        xmax = min(pconfig["xCeiling"], default_xlimits[1])
+    if (xmax - xmin) < pconfig.get("xMinRange", 0):
+        xmax = xmin + pconfig["xMinRange"]
+    axes.set_xlim((xmin, xmax))
+
+    # Plot title
+    if "title" in pconfig:
+        plt.text(0.5, 1.05, pconfig["title"], horizontalalignment="center", fontsize=16, transform=axes.transAxes)
+    axes.grid(True, zorder=10, which="both", axis="y", linestyle="-", color="#dedede", linewidth=1)
+
+    # X axis categories, if specified
+    if "categories" in pconfig:
+        axes.set_xticks([i for i, v in enumerate(pconfig["categories"])])
+        axes.set_xticklabels(pconfig["categories"])
+
+    # Axis lines
+    xlim = axes.get_xlim()
+    axes.plot([xlim[0], xlim[1]], [0, 0], linestyle="-", color="#dedede", linewidth=2)
+    axes.set_axisbelow(True)
+    axes.spines["right"].set_visible(False)
+    axes.spines["top"].set_visible(False)
+    axes.spines["bottom"].set_visible(False)
+    axes.spines["left"].set_visible(False)
+
+    # Background colours, if specified
+    if "yPlotBands" in pconfig:
+        xlim = axes.get_xlim()
+        for pb in pconfig["yPlotBands"]:
+            axes.barh(
+                pb["from"],
+                xlim[1],
+                height=pb["to"] - pb["from"],
+                left=xlim[0],
+                color=pb["color"],
+                linewidth=0,
+                zorder=0,
+                align="edge",
+            )
+    if "xPlotBands" in pconfig:
+        ylim = axes.get_ylim()
+        for pb in pconfig["xPlotBands"]:
+            axes.bar(
+                pb["from"],
+                ylim[1],
+                width=pb["to"] - pb["from"],
+                bottom=ylim[0],
+                color=pb["color"],
+                linewidth=0,
+                zorder=0,
+                align="edge",
+            )
+
+    # Tight layout - makes sure that legend fits in and stuff
+    if len(pdata) <= 15:
+        axes.legend(
+            loc="lower center",
+            bbox_to_anchor=(0, -0.22, 1, 0.102),
+            ncol=5,
+            mode="expand",
+            fontsize=pconfig.get("labelSize", 8),
+            frameon=False,
+        )
+        plt.tight_layout(rect=[0, 0.08, 1, 0.92])
+    else:
+        plt.tight_layout(rect=[0, 0, 1, 0.92])
+
+    return fig, {}
 
 
-def smooth_line_data(data, numpoints, sumcounts=True):
+def smooth_line_data(data, numpoints, sumcounts=True, method="first"):
     """
     Function to take an x-y dataset and use binning to smooth to a maximum number of datapoints.
-    Each datapoint in a smoothed dataset corresponds to the first point in a bin.
+    With the default method ("first"), each datapoint in a smoothed dataset corresponds to the first point in a bin.
+    Other methods keep peaks that would otherwise be lost:
+      "minmax" - keep the lowest and highest point in each bin
+      "lttb" - Largest-Triangle-Three-Buckets, keeps the points that best preserve the shape of the line
 
     Examples to show the idea:
 
@@ -634,9 +614,74 @@ def smooth_line_data(data, numpoints, sumcounts=True):
             smoothed_data[s_name] = d
             continue
 
-        binsize = (len(d) - 1) / (numpoints - 1)
-        first_element_indices = [round(binsize * i) for i in range(numpoints)]
-        smoothed_d = OrderedDict(xy for i, xy in enumerate(d.items()) if i in first_element_indices)
-        smoothed_data[s_name] = smoothed_d
+        items = list(d.items())
+        indices = None
+        if method in ("minmax", "lttb"):
+            try:
+                y = np.array([v for _, v in items], dtype=float)
+                if not np.isfinite(y).all():
+                    raise ValueError("Missing or infinite values")
+                if method == "minmax":
+                    indices = _minmax_indices(y, numpoints)
+                else:
+                    try:
+                        x = np.array([k for k, _ in items], dtype=float)
+                    except (TypeError, ValueError):
+                        x = np.arange(len(items), dtype=float)
+                    indices = _lttb_indices(x, y, numpoints)
+            except (TypeError, ValueError) as e:
+                logger.debug(f"Could not smooth '{s_name}' with method '{method}', using 'first': {e}")
+        elif method != "first":
+            logger.warning(f"Unknown line smoothing method '{method}', using 'first'")
+        if indices is None:
+            binsize = (len(d) - 1) / (numpoints - 1)
+            # Rounding can give the same index twice, so remove duplicates while keeping the order
+            indices = dict.fromkeys(round(binsize * i) for i in range(numpoints))
+        smoothed_data[s_name] = OrderedDict(items[i] for i in indices)
 
     return smoothed_data
+
+
+def _minmax_indices(y, numpoints):
+    """Indices of the first and last points, plus the lowest and highest point in each bin in between"""
+    nbins = max((numpoints - 2) // 2, 0)
+    if nbins == 0:
+        return [0, len(y) - 1]
+    indices = [0]
+    for bin_y in np.array_split(np.arange(1, len(y) - 1), nbins):
+        if len(bin_y) == 0:
+            continue
+        lo = bin_y[np.argmin(y[bin_y])]
+        hi = bin_y[np.argmax(y[bin_y])]
+        indices.extend(sorted({lo, hi}))
+    indices.append(len(y) - 1)
+    return indices
+
+
+def _lttb_indices(x, y, numpoints):
+    """
+    Largest-Triangle-Three-Buckets downsampling. Keeps the first and last point, and from each
+    bucket in between the point making the largest triangle with the previously kept point
+    and the average of the next bucket.
+    """
+    n = len(y)
+    if numpoints < 3:
+        return [0, n - 1]
+    bucket_size = (n - 2) / (numpoints - 2)
+    indices = [0]
+    a = 0
+    for i in range(numpoints - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_start = end
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        if next_start >= next_end:
+            avg_x, avg_y = x[n - 1], y[n - 1]
+        else:
+            avg_x = x[next_start:next_end].mean()
+            avg_y = y[next_start:next_end].mean()
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        indices.append(a)
+    indices.append(n - 1)
+    return indices
@@ -6,6 +6,8 @@ import logging
 import random
 from collections import OrderedDict, defaultdict
 
+import numpy as np
+
 from multiqc.plots import beeswarm, table_object
 from multiqc.utils import config, mqc_colour, report, util_functions
 
@@ -48,6 +50,157 @@ def plot(data, headers=None, pconfig=None):
         return make_table(dt)
 
 
+def _float_values(vals):
+    """Values as a NumPy array of floats, with a mask of the values that could be converted"""
+    numbers = np.full(len(vals), np.nan)
+    valid = np.zeros(len(vals), dtype=bool)
+    for i, val in enumerate(vals):
+        try:
+            numbers[i] = float(val)
+            valid[i] = True
+        except (ValueError, TypeError):
+            pass
+    return numbers, valid
+
+
+def _bar_percentages(vals, header):
+    """Width of the cell background bar for each value in a column"""
+    percentages = [0] * len(vals)
+    dmin = header["dmin"]
+    dmax = header["dmax"]
+    if not isinstance(dmin, (int, float)) or not isinstance(dmax, (int, float)) or dmax == dmin:
+        return percentages
+    numbers, valid = _float_values(vals)
+    with np.errstate(all="ignore"):
+        # Treat 0 as 0-width and make bars width of absolute value
+        if header.get("bars_zero_centrepoint"):
+            dmax = max(abs(dmin), abs(dmax))
+            numbers = (np.abs(numbers) - 0) / (dmax - 0) * 100
+        else:
+            numbers = (numbers - dmin) / (dmax - dmin) * 100
+    for i, (percentage, is_valid) in enumerate(zip(numbers.tolist(), valid.tolist())):
+        if is_valid:
+            percentages[i] = max(min(percentage, 100), 0)
+    return percentages
+
+
+def _format_value(fmt, val):
+    """Format a single table value, falling back to the value as a string"""
+    try:
+        return str(fmt.format(val))
+    except ValueError:
+        try:
+            return str(fmt.format(float(val)))
+        except (ValueError, TypeError):
+            return str(val)
+    except:
+        return str(val)
+
+
+def _cond_formatting_warning(bad_vals, cmp):
+    others = " (and {} other values)".format(len(bad_vals) - 1) if len(bad_vals) > 1 else ""
+    logger.warning("Not able to apply table conditional formatting to '{}'{} ({})".format(bad_vals[0], others, cmp))
+
+
+def _cond_formatting_badges(vals, rules, colours):
+    """
+    Find the conditional formatting badge colour for each value in a column, or None.
+    Each comparison is tested against the whole column at once. Where a value
+    matches several, colours later in the config take priority.
+    """
+    badges = [None] * len(vals)
+    cmatches = {cfck: np.zeros(len(vals), dtype=bool) for cfc in colours for cfck in cfc}
+    if len(vals) == 0 or not any(ftype in rule for rule in rules for ftype in cmatches):
+        return badges
+
+    str_vals = None
+    numbers = None
+    for rule in rules:
+        # Loop through match types
+        for ftype, matches in cmatches.items():
+            # Loop through array of comparison types
+            for cmp in rule.get(ftype, []):
+                try:
+                    # Each comparison should be a dict with single key: val
+                    if any(ctype in cmp for ctype in ["s_eq", "s_contains", "s_ne"]) and str_vals is None:
+                        str_vals = np.array([str(val).lower() for val in vals])
+                    if "s_eq" in cmp:
+                        matches |= str_vals == str(cmp["s_eq"]).lower()
+                    if "s_contains" in cmp:
+                        matches |= np.char.find(str_vals, str(cmp["s_contains"]).lower()) >= 0
+                    if "s_ne" in cmp:
+                        matches |= str_vals != str(cmp["s_ne"]).lower()
+                    checked_numbers = False
+                    for ctype, cmp_op in [("eq", np.equal), ("ne", np.not_equal), ("gt", np.less), ("lt", np.greater)]:
+                        if ctype in cmp:
+                            threshold = float(cmp[ctype])
+                            if numbers is None:
+                                numbers, valid = _float_values(vals)
+                            if not checked_numbers and not valid.all():
+                                _cond_formatting_warning([val for val, ok in zip(vals, valid) if not ok], cmp)
+                            checked_numbers = True
+                            matches |= cmp_op(threshold, numbers) & valid
+                except:
+                    _cond_formatting_warning(vals, cmp)
+
+    # Apply HTML in order of config keys
+    for cfc in colours:
+        for cfck in cfc:  # should always be one, but you never know
+            for i in np.flatnonzero(cmatches[cfck]).tolist():
+                badges[i] = cfc[cfck]
+    return badges
+
+
+def _is_virtual(dt):
+    """
+    True if the table has config.table_virtual_rows rows or more, so that rows
+    should be drawn in the browser as they are scrolled to, instead of as HTML
+    """
+    if not config.table_virtual_rows:
+        return False
+    s_names = set()
+    for d in dt.data:
+        s_names.update(d.keys())
+    return len(s_names) >= config.table_virtual_rows
+
+
+def _json_value(val):
+    """
+    Table value as a type that can be written to JSON, for sorting virtual tables.
+    Floats are kept to 6 significant figures, which is plenty for sorting and keeps
+    the report data small.
+    """
+    if val is None or isinstance(val, (str, int)):
+        return val
+    try:
+        return float("{:.6g}".format(float(val)))
+    except (ValueError, TypeError):
+        return str(val)
+
+
+def _virtual_table_data(t_headers, t_rows, s_names):
+    """
+    Report data for a virtual table. Each column has lists of the value, cell
+    text, background colour and bar width for each sample, in the order of
+    s_names. None where a sample has no value, and lists left out if all None.
+    Background colours are given as positions in a list of the column's colours.
+    """
+    columns = []
+    for rid in t_headers:
+        cells = [t_rows[s_name].get(rid) for s_name in s_names]
+        column = {"rid": rid}
+        for i, key in enumerate(["values", "text", "colours", "bars"]):
+            values = [None if cell is None else cell[i] for cell in cells]
+            if any(v is not None for v in values):
+                column[key] = values
+        if "colours" in column:
+            palette = dict()
+            column["colours"] = [None if c is None else palette.setdefault(c, len(palette)) for c in column["colours"]]
+            column["palette"] = list(palette)
+        columns.append(column)
+    return {"plot_type": "table", "samples": s_names, "columns": columns}
+
+
 def make_table(dt):
     """
     Build the HTML needed for a MultiQC table.
@@ -56,6 +209,8 @@ def make_table(dt):
 
     table_id = dt.pconfig.get("id", "table_{}".format("".join(random.sample(letters, 4))))
     table_id = report.save_htmlid(table_id)
+    # Very large tables are drawn in the browser from JSON data, a screen of rows at a time
+    virtual = _is_virtual(dt)
     t_headers = OrderedDict()
     t_modal_headers = OrderedDict()
     t_rows = OrderedDict()
@@ -66,6 +221,14 @@ def make_table(dt):
     table_title = dt.pconfig.get("table_title")
     if table_title is None:
         table_title = table_id.replace("_", " ").title()
+    num_cells = 0
+
+    # This is horrible, but Python locale settings are worse
+    if config.thousandsSep_format is None:
+        config.thousandsSep_format = '<span class="mqc_thousandSep"></span>'
+    if config.decimalPoint_format is None:
+        config.decimalPoint_format = "."
+    separators = str.maketrans({".": config.decimalPoint_format, ",": config.thousandsSep_format})
 
     for idx, k, header in dt.get_headers_in_order():
         rid = header["rid"]
@@ -139,138 +302,77 @@ def make_table(dt):
         cond_formatting_colours = header.get("cond_formatting_colours", [])
         cond_formatting_colours.extend(config.table_cond_formatting_colours)
 
-        # Add the data table cells
+        # Add the data table cells, one column at a time
+        kname = "{}_{}".format(header["namespace"], rid)
+        s_names = []
+        vals = []
         for s_name, samp in dt.data[idx].items():
             if k in samp:
-                val = samp[k]
-                kname = "{}_{}".format(header["namespace"], rid)
-                dt.raw_vals[s_name][kname] = val
-
-                if "modify" in header and callable(header["modify"]):
-                    try:
-                        val = header["modify"](val)
-                    except TypeError as e:
-                        logger.debug(f"Error modifying table value {kname} : {val} - {e}")
-
+                s_names.append(s_name)
+                vals.append(samp[k])
+                dt.raw_vals[s_name][kname] = samp[k]
+        if "modify" in header and callable(header["modify"]):
+            for i, val in enumerate(vals):
                 try:
-                    dmin = header["dmin"]
-                    dmax = header["dmax"]
-                    percentage = ((float(val) - dmin) / (dmax - dmin)) * 100
-                    # Treat 0 as 0-width and make bars width of absolute value
-                    if header.get("bars_zero_centrepoint"):
-                        dmax = max(abs(header["dmin"]), abs(header["dmax"]))
-                        dmin = 0
-                        percentage = ((abs(float(val)) - dmin) / (dmax - dmin)) * 100
-                    percentage = min(percentage, 100)
-                    percentage = max(percentage, 0)
-                except (ZeroDivisionError, ValueError, TypeError):
-                    percentage = 0
-
-                try:
-                    valstring = str(header["format"].format(val))
-                except ValueError:
-                    try:
-                        valstring = str(header["format"].format(float(val)))
-                    except ValueError:
-                        valstring = str(val)
-                except:
-                    valstring = str(val)
-
-                # This is horrible, but Python locale settings are worse
-                if config.thousandsSep_format is None:
-                    config.thousandsSep_format = '<span class="mqc_thousandSep"></span>'
-                if config.decimalPoint_format is None:
-                    config.decimalPoint_format = "."
-                valstring = valstring.replace(".", "DECIMAL").replace(",", "THOUSAND")
-                valstring = valstring.replace("DECIMAL", config.decimalPoint_format).replace(
-                    "THOUSAND", config.thousandsSep_format
-                )
-
-                # Percentage suffixes etc
-                valstring += header.get("suffix", "")
-
-                # Conditional formatting
-                # Build empty dict for cformatting matches
-                cmatches = {}
-                for cfc in cond_formatting_colours:
-                    for cfck in cfc:
-                        cmatches[cfck] = False
-                # Find general rules followed by column-specific rules
-                for cfk in ["all_columns", rid, table_id]:
-                    if cfk in cond_formatting_rules:
-                        # Loop through match types
-                        for ftype in cmatches.keys():
-                            # Loop through array of comparison types
-                            for cmp in cond_formatting_rules[cfk].get(ftype, []):
-                                try:
-                                    # Each comparison should be a dict with single key: val
-                                    if "s_eq" in cmp and str(cmp["s_eq"]).lower() == str(val).lower():
-                                        cmatches[ftype] = True
-                                    if "s_contains" in cmp and str(cmp["s_contains"]).lower() in str(val).lower():
-                                        cmatches[ftype] = True
-                                    if "s_ne" in cmp and str(cmp["s_ne"]).lower() != str(val).lower():
-                                        cmatches[ftype] = True
-                                    if "eq" in cmp and float(cmp["eq"]) == float(val):
-                                        cmatches[ftype] = True
-                                    if "ne" in cmp and float(cmp["ne"]) != float(val):
-                                        cmatches[ftype] = True
-                                    if "gt" in cmp and float(cmp["gt"]) < float(val):
-                                        cmatches[ftype] = True
-                                    if "lt" in cmp and float(cmp["lt"]) > float(val):
-                                        cmatches[ftype] = True
-                                except:
-                                    logger.warning(
-                                        "Not able to apply table conditional formatting to '{}' ({})".format(val, cmp)
-                                    )
-                # Apply HTML in order of config keys
-                badge_col = None
-                for cfc in cond_formatting_colours:
-                    for cfck in cfc:  # should always be one, but you never know
-                        if cmatches[cfck]:
-                            badge_col = cfc[cfck]
-                if badge_col is not None:
-                    valstring = '<span class="badge" style="background-color:{}">{}</span>'.format(badge_col, valstring)
-
-                # Categorical background colours supplied
-                if val in header.get("bgcols", {}).keys():
-                    col = 'style="background-color:{} !important;"'.format(header["bgcols"][val])
-                    if s_name not in t_rows:
-                        t_rows[s_name] = dict()
-                    t_rows[s_name][rid] = '<td class="{rid} {h}" {c}>{v}</td>'.format(
-                        rid=rid, h=hide, c=col, v=valstring
-                    )
-
-                # Build table cell background colour bar
+                    vals[i] = header["modify"](val)
+                except TypeError as e:
+                    logger.debug(f"Error modifying table value {kname} : {val} - {e}")
+
+        percentages = _bar_percentages(vals, header)
+        # Find general rules followed by column-specific rules
+        col_rules = [cond_formatting_rules[cfk] for cfk in ["all_columns", rid, table_id] if cfk in cond_formatting_rules]
+        badge_cols = _cond_formatting_badges(vals, col_rules, cond_formatting_colours)
+        bgcols = header.get("bgcols", {})
+        has_bgcol = [val in bgcols.keys() for val in vals]
+        colours = None
+        if header["scale"] and c_scale is not None:
+            scale_vals = [val for val, bgcol in zip(vals, has_bgcol) if not bgcol]
+            colours = iter(c_scale.get_colours_for(scale_vals, source=f"Table {table_id}, column {k}"))
+        suffix = header.get("suffix", "")
+
+        for i, (s_name, val) in enumerate(zip(s_names, vals)):
+            valstring = _format_value(header["format"], val).translate(separators) + suffix
+            if badge_cols[i] is not None:
+                valstring = '<span class="badge" style="background-color:{}">{}</span>'.format(badge_cols[i], valstring)
+
+            # Virtual tables: value for sorting, cell text, background colour and bar width
+            if virtual:
+                if has_bgcol[i]:
+                    cell = (_json_value(val), valstring, bgcols[val], None)
                 elif header["scale"]:
-                    if c_scale is not None:
-                        col = " background-color:{} !important;".format(
-                            c_scale.get_colour(val, source=f"Table {table_id}, column {k}")
-                        )
-                    else:
-                        col = ""
-                    bar_html = '<span class="bar" style="width:{}%;{}"></span>'.format(percentage, col)
-                    val_html = '<span class="val">{}</span>'.format(valstring)
-                    wrapper_html = '<div class="wrapper">{}{}</div>'.format(bar_html, val_html)
-
-                    if s_name not in t_rows:
-                        t_rows[s_name] = dict()
-                    t_rows[s_name][rid] = '<td class="data-coloured {rid} {h}">{c}</td>'.format(
-                        rid=rid, h=hide, c=wrapper_html
-                    )
-
-                # Scale / background colours are disabled
+                    colour = next(colours) if colours is not None else None
+                    cell = (_json_value(val), valstring, colour, round(percentages[i], 2))
                 else:
-                    if s_name not in t_rows:
-                        t_rows[s_name] = dict()
-                    t_rows[s_name][rid] = '<td class="{rid} {h}">{v}</td>'.format(rid=rid, h=hide, v=valstring)
-
-                # Is this cell hidden or empty?
-                if s_name not in t_rows_empty:
-                    t_rows_empty[s_name] = dict()
-                t_rows_empty[s_name][rid] = header.get("hidden", False) or str(val).strip() == ""
+                    cell = (_json_value(val), valstring, None, None)
+
+            # Categorical background colours supplied
+            elif has_bgcol[i]:
+                col = 'style="background-color:{} !important;"'.format(bgcols[val])
+                cell = '<td class="{rid} {h}" {c}>{v}</td>'.format(rid=rid, h=hide, c=col, v=valstring)
+
+            # Build table cell background colour bar
+            elif header["scale"]:
+                col = " background-color:{} !important;".format(next(colours)) if colours is not None else ""
+                bar_html = '<span class="bar" style="width:{}%;{}"></span>'.format(percentages[i], col)
+                val_html = '<span class="val">{}</span>'.format(valstring)
+                wrapper_html = '<div class="wrapper">{}{}</div>'.format(bar_html, val_html)
+                cell = '<td class="data-coloured {rid} {h}">{c}</td>'.format(rid=rid, h=hide, c=wrapper_html)
+
+            # Scale / background colours are disabled
+            else:
+                cell = '<td class="{rid} {h}">{v}</td>'.format(rid=rid, h=hide, v=valstring)
+
+            if s_name not in t_rows:
+                t_rows[s_name] = dict()
+                t_rows_empty[s_name] = dict()
+            t_rows[s_name][rid] = cell
+            num_cells += 1
+
+            # Is this cell hidden or empty?
+            t_rows_empty[s_name][rid] = header.get("hidden", False) or str(val).strip() == ""
 
         # Remove header if we don't have any filled cells for it
-        if sum([len(rows) for rows in t_rows.values()]) == 0:
+        if num_cells == 0:
             if header.get("hidden", False) is True:
                 hidden_cols -= 1
             t_headers.pop(rid, None)
@@ -353,9 +455,9 @@ def make_table(dt):
     html += """
         <div id="{tid}_container" class="mqc_table_container">
             <div class="table-responsive mqc-table-responsive {cc}">
-                <table id="{tid}" class="table table-condensed mqc_table" data-title="{title}">
+                <table id="{tid}" class="table table-condensed mqc_table{vc}" data-title="{title}">
         """.format(
-        tid=table_id, title=table_title, cc=collapse_class
+        tid=table_id, title=table_title, cc=collapse_class, vc=" mqc_vtable" if virtual else ""
     )
 
     # Build the header row
@@ -367,6 +469,10 @@ def make_table(dt):
     t_row_keys = t_rows.keys()
     if dt.pconfig.get("sortRows") is not False:
         t_row_keys = sorted(t_row_keys)
+    if virtual:
+        logger.debug("Table '{}' has {} rows, drawing as a virtual table".format(table_id, len(t_rows)))
+        report.table_data[table_id] = _virtual_table_data(t_headers, t_rows, list(t_row_keys))
+        t_row_keys = []
     for s_name in t_row_keys:
         # Hide the row if all cells are empty or hidden
         row_hidden = ' style="display:none"' if all(t_rows_empty[s_name].values()) else ""
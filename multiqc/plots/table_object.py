@@ -6,11 +6,91 @@ import logging
 import re
 from collections import OrderedDict, defaultdict
 
+import numpy as np
+
 from multiqc.utils import config, report
 
 logger = logging.getLogger(__name__)
 
 
+def _to_float(val):
+    try:
+        return float(val)
+    except (ValueError, TypeError):
+        return np.nan
+
+
+class ColumnarData(object):
+    """A table section stored by column, built in a single pass over the
+    sample dicts. Each data key has a boolean mask of the samples that have
+    a value, and a NumPy array of the values as floats (NaN where missing or
+    not a number), both indexed by position in s_names."""
+
+    def __init__(self, data):
+        self.s_names = list(data.keys())
+        positions = defaultdict(list)
+        values = defaultdict(list)
+        for i, samp in enumerate(data.values()):
+            for k, v in samp.items():
+                positions[k].append(i)
+                values[k].append(v)
+        # Keys in the order that they first appear
+        self.keys = list(positions.keys())
+        self.present = dict()
+        self.numeric = dict()
+        for k in self.keys:
+            idx = np.array(positions[k], dtype=np.intp)
+            try:
+                vals = np.asarray(values[k], dtype=np.float64)
+            except Exception:
+                vals = None
+            # Value by value if some can't be converted, or are lists of the same length
+            if vals is None or vals.shape != (len(idx),):
+                vals = np.array([_to_float(v) for v in values[k]], dtype=np.float64)
+            self.present[k] = np.zeros(len(self.s_names), dtype=bool)
+            self.present[k][idx] = True
+            self.numeric[k] = np.full(len(self.s_names), np.nan)
+            self.numeric[k][idx] = vals
+
+    def keep(self, mask):
+        """Only keep the samples where mask is True"""
+        self.s_names = [s_name for s_name, keep in zip(self.s_names, mask.tolist()) if keep]
+        for k in self.keys:
+            self.present[k] = self.present[k][mask]
+            self.numeric[k] = self.numeric[k][mask]
+
+    def all_str(self):
+        """True if all sample names and data keys are strings"""
+        return all(type(s) is str for s in self.s_names) and all(type(k) is str for k in self.keys)
+
+    def modified_values(self, k, modify=None):
+        """
+        Numeric values for a column, after applying a header 'modify' function.
+        The function is given the whole array at once if it supports that,
+        otherwise it is called for each value. Values that can't be converted are dropped.
+        """
+        vals = self.numeric[k][self.present[k]]
+        vals = vals[~np.isnan(vals)]
+        if not callable(modify) or len(vals) == 0:
+            return vals
+        try:
+            with np.errstate(all="ignore"):
+                modified = modify(vals)
+            if isinstance(modified, np.ndarray) and modified.shape == vals.shape and modified.dtype.kind in "biuf":
+                modified = modified.astype(np.float64)
+                return modified[~np.isnan(modified)]
+        except Exception:
+            pass
+        modified = []
+        for val in vals.tolist():
+            try:
+                modified.append(float(modify(val)))
+            except (ValueError, TypeError):
+                pass
+        modified = np.array(modified, dtype=np.float64)
+        return modified[~np.isnan(modified)]
+
+
 class datatable(object):
     """Data table class. Prepares and holds data and configuration
     for either a table or a beeswarm plot."""
@@ -33,6 +113,7 @@ class datatable(object):
         if type(headers) is not list:
             headers = [headers]
 
+        self.columns = list()
         sectcols = [
             "55,126,184",
             "77,175,74",
@@ -55,14 +136,13 @@ class datatable(object):
             except (IndexError, AttributeError, AssertionError):
                 pconfig["only_defined_headers"] = False
 
+            # Store the data by column
+            columns = ColumnarData(d)
+
             # Add header keys from the data
             if pconfig.get("only_defined_headers", True) is False:
                 # Get the keys from the data
-                keys = list()
-                for samp in d.values():
-                    for k in samp.keys():
-                        if k not in keys:
-                            keys.append(k)
+                keys = list(columns.keys)
 
                 # If we don't have a headers dict for this data set yet, create one
                 try:
@@ -85,23 +165,19 @@ class datatable(object):
             for k in list(headers[idx].keys()):
                 headers[idx][str(k)] = headers[idx].pop(k)
             # Ensure that all sample names are strings as well
-            cdata = OrderedDict()
-            for k, v in data[idx].items():
-                cdata[str(k)] = v
-            data[idx] = cdata
-            for s_name in data[idx].keys():
-                for k in list(data[idx][s_name].keys()):
-                    data[idx][s_name][str(k)] = data[idx][s_name].pop(k)
+            if not columns.all_str():
+                cdata = OrderedDict()
+                for k, v in data[idx].items():
+                    cdata[str(k)] = v
+                data[idx] = cdata
+                for s_name in data[idx].keys():
+                    for k in list(data[idx][s_name].keys()):
+                        data[idx][s_name][str(k)] = data[idx][s_name].pop(k)
+                columns = ColumnarData(data[idx])
+            self.columns.append(columns)
 
             # Check that we have some data in each column
-            empties = list()
-            for k in keys:
-                n = 0
-                for samp in d.values():
-                    if k in samp:
-                        n += 1
-                if n == 0:
-                    empties.append(k)
+            empties = [k for k in keys if k not in columns.present]
             for k in empties:
                 keys = [j for j in keys if j != k]
                 del headers[idx][k]
@@ -217,19 +293,12 @@ class datatable(object):
 
                 # Figure out the min / max if not supplied
                 if setdmax or setdmin:
-                    for s_name, samp in data[idx].items():
-                        try:
-                            val = float(samp[k])
-                            if callable(headers[idx][k]["modify"]):
-                                val = float(headers[idx][k]["modify"](val))
-                            if setdmax:
-                                headers[idx][k]["dmax"] = max(headers[idx][k]["dmax"], val)
-                            if setdmin:
-                                headers[idx][k]["dmin"] = min(headers[idx][k]["dmin"], val)
-                        except (ValueError, TypeError):
-                            val = samp[k]  # couldn't convert to float - keep as a string
-                        except KeyError:
-                            pass  # missing data - skip
+                    vals = columns.modified_values(k, headers[idx][k]["modify"])
+                    if len(vals) > 0:
+                        if setdmax:
+                            headers[idx][k]["dmax"] = max(headers[idx][k]["dmax"], float(vals.max()))
+                        if setdmin:
+                            headers[idx][k]["dmin"] = min(headers[idx][k]["dmin"], float(vals.min()))
                     # Limit auto-generated scales with floor, ceiling and minRange.
                     if headers[idx][k]["ceiling"] is not None and headers[idx][k]["max"] is None:
                         headers[idx][k]["dmax"] = min(headers[idx][k]["dmax"], float(headers[idx][k]["ceiling"]))
@@ -269,10 +338,15 @@ class datatable(object):
 
         # Skip any data that is not used in the table
         # Would be ignored for making the table anyway, but can affect whether a beeswarm plot is used
-        for idx, d in enumerate(data):
-            for s_name in list(d.keys()):
-                if not any(h in data[idx][s_name].keys() for h in headers[idx]):
-                    del data[idx][s_name]
+        for idx, columns in enumerate(self.columns):
+            used = np.zeros(len(columns.s_names), dtype=bool)
+            for k in headers[idx]:
+                if k in columns.present:
+                    used |= columns.present[k]
+            if not used.all():
+                for pos in np.flatnonzero(~used).tolist():
+                    del data[idx][columns.s_names[pos]]
+                columns.keep(used)
 
         # Assign to class
         self.data = data
@@ -97,3 +97,178 @@ $(function () {
     });
   });
 });
+
+// Decompress the plot data from the report, encoded as set by config.plot_data_compression
+function mqc_decompress_plotdata(compressed, method) {
+  if (method === "zlib") {
+    var bin = atob(compressed);
+    var bytes = new Uint8Array(bin.length);
+    for (var i = 0; i < bin.length; i++) {
+      bytes[i] = bin.charCodeAt(i);
+    }
+    // Skip the two byte zlib header. The Adler-32 checksum at the end is not checked.
+    return new TextDecoder("utf-8").decode(mqc_inflate(bytes.subarray(2)));
+  }
+  return LZString.decompressFromBase64(compressed);
+}
+
+// Small synchronous DEFLATE decoder (RFC 1951), so that plot data is ready
+// as soon as the page loads without needing the asynchronous DecompressionStream API
+function mqc_inflate(data) {
+  var LEN_BASE = [
+    3, 4, 5, 6, 7, 8, 9, 10, 11, 13, 15, 17, 19, 23, 27, 31, 35, 43, 51, 59, 67, 83, 99, 115, 131, 163, 195, 227, 258,
+  ];
+  var LEN_EXTRA = [0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4, 5, 5, 5, 5, 0];
+  var DIST_BASE = [
+    1, 2, 3, 4, 5, 7, 9, 13, 17, 25, 33, 49, 65, 97, 129, 193, 257, 385, 513, 769, 1025, 1537, 2049, 3073, 4097, 6145,
+    8193, 12289, 16385, 24577,
+  ];
+  var DIST_EXTRA = [0, 0, 0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6, 7, 7, 8, 8, 9, 9, 10, 10, 11, 11, 12, 12, 13, 13];
+  var CODE_LENGTH_ORDER = [16, 17, 18, 0, 8, 7, 9, 6, 10, 5, 11, 4, 12, 3, 13, 2, 14, 1, 15];
+
+  var pos = 0;
+  var bitbuf = 0;
+  var bitcnt = 0;
+  var out = new Uint8Array(Math.max(data.length * 4, 1024));
+  var outlen = 0;
+
+  function grow(n) {
+    if (outlen + n > out.length) {
+      var bigger = new Uint8Array(Math.max(out.length * 2, outlen + n));
+      bigger.set(out);
+      out = bigger;
+    }
+  }
+  function bits(n) {
+    while (bitcnt < n) {
+      if (pos >= data.length) {
+        throw new Error("Unexpected end of compressed data");
+      }
+      bitbuf |= data[pos++] << bitcnt;
+      bitcnt += 8;
+    }
+    var val = bitbuf & ((1 << n) - 1);
+    bitbuf >>>= n;
+    bitcnt -= n;
+    return val;
+  }
+  // Canonical Huffman code: number of codes of each length and symbols ordered by code
+  function huffman(lengths) {
+    var count = new Uint16Array(16);
+    var offs = new Uint16Array(16);
+    var symbol = new Uint16Array(lengths.length);
+    for (var i = 0; i < lengths.length; i++) {
+      count[lengths[i]]++;
+    }
+    count[0] = 0;
+    for (i = 1; i < 16; i++) {
+      offs[i] = offs[i - 1] + count[i - 1];
+    }
+    for (i = 0; i < lengths.length; i++) {
+      if (lengths[i]) {
+        symbol[offs[lengths[i]]++] = i;
+      }
+    }
+    return { count: count, symbol: symbol };
+  }
+  function decode(h) {
+    var code = 0;
+    var first = 0;
+    var index = 0;
+    for (var len = 1; len < 16; len++) {
+      code |= bits(1);
+      var count = h.count[len];
+      if (code - count < first) {
+        return h.symbol[index + (code - first)];
+      }
+      index += count;
+      first = (first + count) << 1;
+      code <<= 1;
+    }
+    throw new Error("Invalid Huffman code in compressed data");
+  }
+  function inflate_block(lencode, distcode) {
+    for (;;) {
+      var sym = decode(lencode);
+      if (sym < 256) {
+        grow(1);
+        out[outlen++] = sym;
+      } else if (sym === 256) {
+        return;
+      } else {
+        sym -= 257;
+        var len = LEN_BASE[sym] + bits(LEN_EXTRA[sym]);
+        var dsym = decode(distcode);
+        var dist = DIST_BASE[dsym] + bits(DIST_EXTRA[dsym]);
+        grow(len);
+        for (var i = 0; i < len; i++) {
+          out[outlen] = out[outlen - dist];
+          outlen++;
+        }
+      }
+    }
+  }
+
+  // Fixed Huffman codes, used for short blocks
+  var lengths = new Uint8Array(288);
+  for (var i = 0; i < 288; i++) {
+    lengths[i] = i < 144 ? 8 : i < 256 ? 9 : i < 280 ? 7 : 8;
+  }
+  var fixed_lencode = huffman(lengths);
+  var fixed_distcode = huffman(new Uint8Array(30).fill(5));
+
+  var last;
+  do {
+    last = bits(1);
+    var type = bits(2);
+    if (type === 0) {
+      // Stored block, starts at the next byte
+      bitbuf = 0;
+      bitcnt = 0;
+      var stored_len = data[pos] | (data[pos + 1] << 8);
+      pos += 4;
+      grow(stored_len);
+      out.set(data.subarray(pos, pos + stored_len), outlen);
+      pos += stored_len;
+      outlen += stored_len;
+    } else if (type === 1) {
+      inflate_block(fixed_lencode, fixed_distcode);
+    } else if (type === 2) {
+      // Dynamic Huffman codes, described at the start of the block
+      var nlen = bits(5) + 257;
+      var ndist = bits(5) + 1;
+      var ncode = bits(4) + 4;
+      var code_lengths = new Uint8Array(19);
+      for (i = 0; i < ncode; i++) {
+        code_lengths[CODE_LENGTH_ORDER[i]] = bits(3);
+      }
+      var lencode = huffman(code_lengths);
+      lengths = new Uint8Array(nlen + ndist);
+      i = 0;
+      while (i < nlen + ndist) {
+        var sym = decode(lencode);
+        if (sym < 16) {
+          lengths[i++] = sym;
+        } else {
+          var repeat_len = 0;
+          var repeat = 0;
+          if (sym === 16) {
+            repeat_len = lengths[i - 1];
+            repeat = 3 + bits(2);
+          } else if (sym === 17) {
+            repeat = 3 + bits(3);
+          } else {
+            repeat = 11 + bits(7);
+          }
+          while (repeat--) {
+            lengths[i++] = repeat_len;
+          }
+        }
+      }
+      inflate_block(huffman(lengths.subarray(0, nlen)), huffman(lengths.subarray(nlen)));
+    } else {
+      throw new Error("Invalid block type in compressed data");
+    }
+  } while (!last);
+  return out.subarray(0, outlen);
+}
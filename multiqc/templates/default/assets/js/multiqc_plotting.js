@@ -22,8 +22,21 @@ $(function () {
   // Show loading warning
   $(".mqc_loading_warning").show();
 
-  // Decompress the JSON plot data
-  mqc_plots = JSON.parse(LZString.decompressFromBase64(mqc_compressed_plotdata));
+  // Plot data is compressed separately for each plot, and decompressed the first time that it is used
+  $.each(mqc_compressed_plotdata, function (target, compressed) {
+    Object.defineProperty(mqc_plots, target, {
+      configurable: true,
+      enumerable: true,
+      get: function () {
+        var data = JSON.parse(mqc_decompress_plotdata(compressed, mqc_config["plot_data_compression"]));
+        Object.defineProperty(mqc_plots, target, { value: data, writable: true, configurable: true, enumerable: true });
+        return data;
+      },
+      set: function (data) {
+        Object.defineProperty(mqc_plots, target, { value: data, writable: true, configurable: true, enumerable: true });
+      },
+    });
+  });
 
   // HighCharts Defaults
   window.HCDefaults = $.extend(true, {}, Highcharts.getOptions(), {});
@@ -61,21 +74,42 @@ $(function () {
     },
   });
 
-  // Render plots on page load
-  $(".hc-plot.not_rendered:visible:not(.gt_max_num_ds)").each(function () {
-    var target = $(this).attr("id");
-    // Only one point per dataset, so multiply limit by arbitrary number.
-    var max_num = mqc_config["num_datasets_plot_limit"] * 50;
-    // Deferring each plot call prevents browser from locking up
-    setTimeout(function () {
-      plot_graph(target, undefined, max_num);
-      if ($(".hc-plot.not_rendered:visible:not(.gt_max_num_ds)").length == 0) {
-        $(".mqc_loading_warning").hide();
-      }
-    }, 50);
-  });
-  if ($(".hc-plot.not_rendered:visible:not(.gt_max_num_ds)").length == 0) {
+  // Render plots when they are scrolled into view
+  // Only one point per dataset, so multiply limit by arbitrary number.
+  var max_num = mqc_config["num_datasets_plot_limit"] * 50;
+  if ("IntersectionObserver" in window) {
+    var plot_observer = new IntersectionObserver(
+      function (entries) {
+        entries.forEach(function (entry) {
+          if (entry.isIntersecting) {
+            plot_observer.unobserve(entry.target);
+            if ($(entry.target).is(".not_rendered:not(.gt_max_num_ds)")) {
+              plot_graph(entry.target.id, undefined, max_num);
+            }
+          }
+        });
+      },
+      { rootMargin: "500px 0px" },
+    );
+    $(".hc-plot.not_rendered:visible:not(.gt_max_num_ds)").each(function () {
+      plot_observer.observe(this);
+    });
     $(".mqc_loading_warning").hide();
+  } else {
+    // Render all plots on page load
+    $(".hc-plot.not_rendered:visible:not(.gt_max_num_ds)").each(function () {
+      var target = $(this).attr("id");
+      // Deferring each plot call prevents browser from locking up
+      setTimeout(function () {
+        plot_graph(target, undefined, max_num);
+        if ($(".hc-plot.not_rendered:visible:not(.gt_max_num_ds)").length == 0) {
+          $(".mqc_loading_warning").hide();
+        }
+      }, 50);
+    });
+    if ($(".hc-plot.not_rendered:visible:not(.gt_max_num_ds)").length == 0) {
+      $(".mqc_loading_warning").hide();
+    }
   }
 
   // Render a plot when clicked
@@ -55,7 +55,12 @@ $(function () {
 
       return text;
     };
-    $(".mqc_table").tablesorter({ sortInitialOrder: "desc", textExtraction: get_sort_val });
+    $(".mqc_table").not(".mqc_vtable").tablesorter({ sortInitialOrder: "desc", textExtraction: get_sort_val });
+
+    // Virtual tables: only the rows in view are drawn, from the table data
+    $(".mqc_vtable").each(function () {
+      mqc_vtable_init($(this));
+    });
 
     // Update tablesorter if samples renamed
     $(document).on("mqc_renamesamples", function (e, f_texts, t_texts, regex_mode) {
@@ -63,7 +68,13 @@ $(function () {
     });
 
     // Copy table contents to clipboard
-    var clipboard = new Clipboard(".mqc_table_copy_btn");
+    var clipboard = new Clipboard(".mqc_table_copy_btn", {
+      text: function (trigger) {
+        // Virtual tables don't have all rows in the page, so copy from the table data
+        var vt = mqc_vtables[$(trigger).data("clipboard-target").replace(/^#/, "")];
+        return vt === undefined ? undefined : mqc_vtable_text(vt);
+      },
+    });
     clipboard.on("success", function (e) {
       e.clearSelection();
     });
@@ -95,6 +106,10 @@ $(function () {
         $(this).parent().find(".mqc-table-responsive").css("max-height", "400px");
         $(this).find("span").removeClass("glyphicon-chevron-down").addClass("glyphicon-chevron-down");
       }
+      var vt = mqc_vtables[$(this).parent().find(".mqc_vtable").attr("id")];
+      if (vt !== undefined) {
+        mqc_vtable_draw(vt);
+      }
     });
 
     /////// COLUMN CONFIG
@@ -122,6 +137,11 @@ $(function () {
           $(target + "_configModal_table ." + cclass).addClass("text-muted");
         }
       });
+      var vt = mqc_vtables[target.replace(/^#/, "")];
+      if (vt !== undefined) {
+        mqc_vtable_update(vt);
+        return;
+      }
       // Hide empty rows
       $(target + " tbody tr").show();
       $(target + " tbody tr").each(function () {
@@ -166,8 +186,8 @@ $(function () {
     // highlight samples
     $(document).on("mqc_highlights", function (e, f_texts, f_cols, regex_mode) {
       $(".mqc_table_sortHighlight").hide();
-      $(".mqc_table tbody th").removeClass("highlighted").removeData("highlight");
-      $(".mqc_table tbody th").each(function (i) {
+      $(".mqc_table").not(".mqc_vtable").find("tbody th").removeClass("highlighted").removeData("highlight");
+      $(".mqc_table").not(".mqc_vtable").find("tbody th").each(function (i) {
         var th = $(this);
         var thtext = $(this).text();
         var thiscol = "#333";
@@ -180,12 +200,23 @@ $(function () {
         });
         $(this).css("color", thiscol);
       });
+      $.each(mqc_vtables, function (tid, vt) {
+        if (mqc_vtable_highlight(vt, f_texts, f_cols, regex_mode)) {
+          $(".mqc_table_sortHighlight").show();
+        }
+      });
     });
 
     // Sort MultiQC tables by highlight
     $(".mqc_table_sortHighlight").click(function (e) {
       e.preventDefault();
       var target = $(this).data("target");
+      var vt = mqc_vtables[target.replace(/^#/, "")];
+      if (vt !== undefined) {
+        mqc_vtable_sort_highlights(vt, $(this).data("direction"));
+        $(this).data("direction", $(this).data("direction") == "desc" ? "asc" : "desc");
+        return;
+      }
       // collect highlighted rows
       var hrows = $(target + " tbody th.highlighted")
         .parent()
@@ -205,7 +236,10 @@ $(function () {
 
     // Rename samples
     $(document).on("mqc_renamesamples", function (e, f_texts, t_texts, regex_mode) {
-      $(".mqc_table tbody th").each(function () {
+      $.each(mqc_vtables, function (tid, vt) {
+        mqc_vtable_rename(vt, f_texts, t_texts, regex_mode);
+      });
+      $(".mqc_table").not(".mqc_vtable").find("tbody th").each(function () {
         var s_name = String($(this).data("original-sn"));
         $.each(f_texts, function (idx, f_text) {
           if (regex_mode) {
@@ -222,7 +256,10 @@ $(function () {
     // Hide samples
     $(document).on("mqc_hidesamples", function (e, f_texts, regex_mode) {
       // Hide rows in MultiQC tables
-      $(".mqc_table tbody th").each(function () {
+      $.each(mqc_vtables, function (tid, vt) {
+        mqc_vtable_hide(vt, f_texts, regex_mode);
+      });
+      $(".mqc_table").not(".mqc_vtable").find("tbody th").each(function () {
         var match = false;
         var hfilter = $(this).text();
         $.each(f_texts, function (idx, f_text) {
@@ -241,11 +278,13 @@ $(function () {
       });
       $(".mqc_table_numrows").each(function () {
         var tid = $(this).attr("id").replace("_numrows", "");
-        $(this).text($("#" + tid + " tbody tr:visible").length);
+        if (mqc_vtables[tid] === undefined) {
+          $(this).text($("#" + tid + " tbody tr:visible").length);
+        }
       });
 
       // Hide empty columns
-      $(".mqc_table").each(function () {
+      $(".mqc_table").not(".mqc_vtable").each(function () {
         var table = $(this);
         var gsthidx = 0;
         table.find("thead th, tbody tr td").show();
@@ -343,7 +382,11 @@ $(function () {
         },
         datasets: [[]],
       };
-      $(tid + " tbody tr").each(function (e) {
+      var vt = mqc_vtables[tid.replace(/^#/, "")];
+      if (vt !== undefined) {
+        mqc_vtable_scatter_data(vt, col1, col2, mqc_plots["tableScatterPlot"]["datasets"][0]);
+      }
+      $(tid).not(".mqc_vtable").find("tbody tr").each(function (e) {
         var s_name = $(this).children("th.rowheader").text();
         var val_1 = $(this)
           .children("td." + col1)
@@ -413,4 +456,389 @@ function change_mqc_table_col_order(table) {
       }
     }
   });
+  // Virtual tables are drawn again in the new column order
+  if (mqc_vtables[target] !== undefined) {
+    mqc_vtable_draw(mqc_vtables[target], true);
+  }
+}
+
+////////////////////////////////////////////////
+// Virtual tables
+// Tables with very many rows are written to the report as JSON data instead of HTML.
+// Only the rows scrolled into view are drawn, and sorting and the toolbox filters
+// work on the table data.
+////////////////////////////////////////////////
+
+// Virtual table data and state, keyed by table ID
+var mqc_vtables = {};
+// Number of extra rows drawn above and below the visible part of a table
+var mqc_vtable_buffer_rows = 20;
+
+function mqc_vtable_init(table) {
+  var tid = table.attr("id");
+  var data = JSON.parse(mqc_decompress_plotdata(mqc_compressed_plotdata[tid], mqc_config["plot_data_compression"]));
+  var vt = {
+    tid: tid,
+    table: table,
+    container: table.closest(".mqc-table-responsive"),
+    samples: data["samples"],
+    names: data["samples"].slice(),
+    columns: {},
+    order: [], // Row indexes in sorted order
+    rows: [], // Row indexes that are shown, in sorted order
+    hidden: [], // Rows hidden with the toolbox
+    highlight: [], // Toolbox highlight index for each row
+    highlight_cols: [],
+    sort_th: null,
+    sort_desc: false,
+    row_height: 30,
+    first: -1,
+    last: -1,
+  };
+  $.each(data["columns"], function (idx, col) {
+    vt.columns[col["rid"]] = col;
+  });
+  for (var i = 0; i < vt.samples.length; i++) {
+    vt.order.push(i);
+    vt.hidden.push(false);
+  }
+  mqc_vtables[tid] = vt;
+
+  // Draw the rows in view when scrolled
+  var draw_pending = false;
+  var draw = function () {
+    if (!draw_pending) {
+      draw_pending = true;
+      window.requestAnimationFrame(function () {
+        draw_pending = false;
+        mqc_vtable_draw(vt);
+      });
+    }
+  };
+  vt.container.scroll(draw);
+  $(window).on("scroll resize", draw);
+  // Tabs and modals can show tables that were hidden
+  $(document).on("shown.bs.tab shown.bs.modal", draw);
+
+  // Sort by clicking on the column headers
+  table.find("thead th").click(function () {
+    mqc_vtable_sort(vt, this);
+  });
+
+  mqc_vtable_update(vt);
+}
+
+// Values for a table column, or null if the column has none
+function mqc_vtable_get(col, key, i) {
+  return col === undefined || col[key] === undefined ? null : col[key][i];
+}
+
+// True if a cell has no value
+function mqc_vtable_empty(col, i) {
+  var value = mqc_vtable_get(col, "values", i);
+  return mqc_vtable_get(col, "text", i) === null || (typeof value === "string" && value.trim() === "");
+}
+
+// Column IDs and header cells, in the order shown in the table
+function mqc_vtable_headers(vt) {
+  var headers = [];
+  vt.table.find("thead th").each(function () {
+    if (!$(this).hasClass("rowheader")) {
+      headers.push({ rid: this.id.replace(/^header_/, ""), th: this });
+    }
+  });
+  return headers;
+}
+
+// Columns that are currently shown
+function mqc_vtable_columns(vt) {
+  return mqc_vtable_headers(vt).filter(function (h) {
+    return !$(h.th).hasClass("hidden") && h.th.style.display != "none";
+  });
+}
+
+function mqc_vtable_escape(text) {
+  return String(text).replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;").replace(/"/g, "&quot;");
+}
+
+// HTML for one table row
+function mqc_vtable_row(vt, i, columns) {
+  var name = mqc_vtable_escape(vt.names[i]);
+  var th = '<th class="rowheader" data-original-sn="' + mqc_vtable_escape(vt.samples[i]) + '">' + name + "</th>";
+  if (vt.highlight[i] !== undefined) {
+    var col = vt.highlight_cols[vt.highlight[i]];
+    th = '<th class="rowheader highlighted" style="color:' + col + ';" data-original-sn="';
+    th += mqc_vtable_escape(vt.samples[i]) + '">' + name + "</th>";
+  }
+  var html = "<tr>" + th;
+  for (var c = 0; c < columns.length; c++) {
+    var rid = columns[c].rid;
+    var col = vt.columns[rid];
+    var text = mqc_vtable_get(col, "text", i);
+    var colour = mqc_vtable_get(col, "colours", i);
+    colour = colour === null ? null : col["palette"][colour];
+    var bar = mqc_vtable_get(col, "bars", i);
+    if (text === null) {
+      html += '<td class="data-coloured ' + rid + '"></td>';
+    } else if (bar !== null) {
+      // Cell background colour bar
+      var bg = colour === null ? "" : " background-color:" + colour + " !important;";
+      html += '<td class="data-coloured ' + rid + '"><div class="wrapper">';
+      html += '<span class="bar" style="width:' + bar + "%;" + bg + '"></span><span class="val">' + text + "</span>";
+      html += "</div></td>";
+    } else if (colour !== null) {
+      // Categorical background colours
+      html += '<td class="' + rid + '" style="background-color:' + colour + ' !important;">' + text + "</td>";
+    } else {
+      html += '<td class="' + rid + '">' + text + "</td>";
+    }
+  }
+  return html + "</tr>";
+}
+
+// Empty row taking up the height of rows that are not drawn
+function mqc_vtable_spacer(num_rows, height, num_cols) {
+  if (num_rows <= 0) {
+    return "";
+  }
+  var td = '<td colspan="' + num_cols + '" style="height:' + num_rows * height + 'px; padding:0; border:none;"></td>';
+  return '<tr class="mqc_vtable_spacer" data-rows="' + num_rows + '">' + td + "</tr>";
+}
+
+// Draw the rows that are in view. Does nothing if these are already drawn, unless force is true.
+function mqc_vtable_draw(vt, force) {
+  var tbody = vt.table.children("tbody")[0];
+  var num_rows = vt.rows.length;
+  var body_top = tbody.getBoundingClientRect().top;
+  var container = vt.container[0].getBoundingClientRect();
+  var view_top = Math.max(container.top, 0) - body_top;
+  var view_bottom = Math.min(container.bottom, window.innerHeight) - body_top;
+  var first = Math.floor(view_top / vt.row_height) - mqc_vtable_buffer_rows;
+  first = Math.min(num_rows, Math.max(0, first));
+  var last = Math.ceil(view_bottom / vt.row_height) + mqc_vtable_buffer_rows;
+  last = Math.min(num_rows, Math.max(first + mqc_vtable_buffer_rows, last));
+  if (!force && first == vt.first && last == vt.last) {
+    return;
+  }
+  vt.first = first;
+  vt.last = last;
+
+  var columns = mqc_vtable_columns(vt);
+  var html = [mqc_vtable_spacer(first, vt.row_height, columns.length + 1)];
+  for (var r = first; r < last; r++) {
+    html.push(mqc_vtable_row(vt, vt.rows[r], columns));
+  }
+  html.push(mqc_vtable_spacer(num_rows - last, vt.row_height, columns.length + 1));
+  tbody.innerHTML = html.join("");
+
+  // Measure the rows, to size the space for the rows that are not drawn
+  var drawn = $(tbody).children("tr").not(".mqc_vtable_spacer");
+  if (drawn.length > 0) {
+    var height = drawn.last()[0].getBoundingClientRect().bottom - drawn[0].getBoundingClientRect().top;
+    if (height > 0) {
+      vt.row_height = height / drawn.length;
+      $(tbody)
+        .children(".mqc_vtable_spacer")
+        .each(function () {
+          $(this)
+            .children("td")
+            .css("height", $(this).data("rows") * vt.row_height + "px");
+        });
+    }
+  }
+}
+
+// Work out which rows and columns are shown, then draw the table again
+function mqc_vtable_update(vt) {
+  var headers = mqc_vtable_headers(vt).filter(function (h) {
+    return !$(h.th).hasClass("hidden");
+  });
+  var has_data = {};
+  vt.rows = [];
+  for (var o = 0; o < vt.order.length; o++) {
+    var i = vt.order[o];
+    if (vt.hidden[i]) {
+      continue;
+    }
+    // Hide rows with no data in any of the visible columns
+    var row_has_data = false;
+    for (var c = 0; c < headers.length; c++) {
+      if (!mqc_vtable_empty(vt.columns[headers[c].rid], i)) {
+        row_has_data = true;
+        has_data[headers[c].rid] = true;
+      }
+    }
+    if (row_has_data) {
+      vt.rows.push(i);
+    }
+  }
+  // Hide columns with no data in the rows that are shown
+  $.each(headers, function (idx, h) {
+    $(h.th).toggle(vt.rows.length == 0 || has_data[h.rid] === true);
+  });
+  $("#" + vt.tid + "_numrows").text(vt.rows.length);
+  $("#" + vt.tid + "_numcols").text(vt.table.find("thead th:visible").length - 1);
+  mqc_vtable_draw(vt, true);
+}
+
+// Value to sort a cell by. Numbers are compared as numbers, including text starting with a digit (e.g. 300X)
+function mqc_vtable_sort_key(value) {
+  if (value === null || value === undefined || typeof value === "number") {
+    return value === undefined ? null : value;
+  }
+  var text = String(value);
+  if (text.length > 0 && text[0].match(/\d/)) {
+    var number = parseFloat(text.replace(/[^\d.]/g, ""));
+    if (!isNaN(number)) {
+      return number;
+    }
+  }
+  return text.toLowerCase();
+}
+
+// Compare sort keys. Numbers come before text, and missing values are always last.
+function mqc_vtable_compare(a, b, desc) {
+  if (a === null || b === null) {
+    return (a === null) - (b === null);
+  }
+  var cmp = 0;
+  if (typeof a !== typeof b) {
+    cmp = typeof a === "number" ? -1 : 1;
+  } else if (a < b) {
+    cmp = -1;
+  } else if (a > b) {
+    cmp = 1;
+  }
+  return desc ? -cmp : cmp;
+}
+
+// Sort the table by a column when its header is clicked. Sorts descending first, then toggles.
+function mqc_vtable_sort(vt, th) {
+  vt.sort_desc = vt.sort_th === th ? !vt.sort_desc : true;
+  vt.sort_th = th;
+  var keys = [];
+  var col = $(th).hasClass("rowheader") ? null : vt.columns[th.id.replace(/^header_/, "")];
+  for (var i = 0; i < vt.samples.length; i++) {
+    if (col === null) {
+      keys.push(mqc_vtable_sort_key(vt.names[i]));
+    } else {
+      keys.push(mqc_vtable_empty(col, i) ? null : mqc_vtable_sort_key(mqc_vtable_get(col, "values", i)));
+    }
+  }
+  vt.order.sort(function (a, b) {
+    return mqc_vtable_compare(keys[a], keys[b], vt.sort_desc) || a - b;
+  });
+  // Same header classes as tablesorter
+  vt.table.find("thead th").removeClass("headerSortUp headerSortDown");
+  $(th).addClass(vt.sort_desc ? "headerSortUp" : "headerSortDown");
+  mqc_vtable_update(vt);
+}
+
+// True if a sample name matches any of the toolbox filter texts
+function mqc_vtable_matches(name, f_texts, regex_mode) {
+  for (var idx = 0; idx < f_texts.length; idx++) {
+    if ((regex_mode && name.match(f_texts[idx])) || (!regex_mode && name.indexOf(f_texts[idx]) > -1)) {
+      return true;
+    }
+  }
+  return false;
+}
+
+// Toolbox highlights. Returns true if any rows are highlighted.
+function mqc_vtable_highlight(vt, f_texts, f_cols, regex_mode) {
+  var highlighted = false;
+  vt.highlight = [];
+  vt.highlight_cols = f_cols;
+  for (var i = 0; i < vt.names.length; i++) {
+    // Later filters take priority
+    for (var idx = 0; idx < f_texts.length; idx++) {
+      if (mqc_vtable_matches(vt.names[i], [f_texts[idx]], regex_mode)) {
+        vt.highlight[i] = idx;
+        highlighted = true;
+      }
+    }
+  }
+  mqc_vtable_draw(vt, true);
+  return highlighted;
+}
+
+// Move highlighted rows to the top (desc) or the bottom (asc) of the table
+function mqc_vtable_sort_highlights(vt, direction) {
+  var highlighted = vt.order.filter(function (i) {
+    return vt.highlight[i] !== undefined;
+  });
+  var others = vt.order.filter(function (i) {
+    return vt.highlight[i] === undefined;
+  });
+  highlighted.sort(function (a, b) {
+    return vt.highlight[a] - vt.highlight[b];
+  });
+  vt.order = direction == "desc" ? highlighted.reverse().concat(others) : others.concat(highlighted);
+  vt.sort_th = null;
+  vt.table.find("thead th").removeClass("headerSortUp headerSortDown");
+  mqc_vtable_update(vt);
+}
+
+// Toolbox sample renaming
+function mqc_vtable_rename(vt, f_texts, t_texts, regex_mode) {
+  for (var i = 0; i < vt.samples.length; i++) {
+    var s_name = String(vt.samples[i]);
+    $.each(f_texts, function (idx, f_text) {
+      if (regex_mode) {
+        s_name = s_name.replace(new RegExp(f_text, "g"), t_texts[idx]);
+      } else {
+        s_name = s_name.replace(f_text, t_texts[idx]);
+      }
+    });
+    vt.names[i] = s_name;
+  }
+  mqc_vtable_draw(vt, true);
+}
+
+// Toolbox show / hide samples
+function mqc_vtable_hide(vt, f_texts, regex_mode) {
+  for (var i = 0; i < vt.names.length; i++) {
+    var match = mqc_vtable_matches(vt.names[i], f_texts, regex_mode);
+    vt.hidden[i] = window.mqc_hide_mode == "show" ? !match : match;
+  }
+  mqc_vtable_update(vt);
+}
+
+// Tab-separated text of the rows and columns shown, for copying the table
+function mqc_vtable_text(vt) {
+  var columns = mqc_vtable_columns(vt);
+  var line = [vt.table.find("thead th.rowheader").text()];
+  $.each(columns, function (idx, h) {
+    line.push($(h.th).text());
+  });
+  var lines = [line.join("\t")];
+  for (var r = 0; r < vt.rows.length; r++) {
+    var i = vt.rows[r];
+    line = [vt.names[i]];
+    for (var c = 0; c < columns.length; c++) {
+      var text = mqc_vtable_get(vt.columns[columns[c].rid], "text", i);
+      line.push(text === null ? "" : text.replace(/<[^>]*>/g, ""));
+    }
+    lines.push(line.join("\t"));
+  }
+  return lines.join("\n");
+}
+
+// Add data points for the table scatter plot
+function mqc_vtable_scatter_data(vt, col1, col2, data) {
+  var number = function (col, i) {
+    var value = mqc_vtable_get(vt.columns[col], "values", i);
+    if (typeof value !== "number") {
+      value = String(value).replace(/[^\d\.]/g, "");
+      value = isFinite(value) ? parseFloat(value) : NaN;
+    }
+    return value;
+  };
+  for (var i = 0; i < vt.samples.length; i++) {
+    var val_1 = number(col1, i);
+    var val_2 = number(col2, i);
+    if (isFinite(val_1) && isFinite(val_2)) {
+      data.push({ name: vt.names[i], x: val_1, y: val_2 });
+    }
+  }
 }
@@ -346,6 +346,12 @@ $(function () {
         var zip = new JSZip();
       }
       var skipped_plots = 0;
+      // Plots are only drawn when scrolled into view, so draw any that haven't been yet
+      checked_plots.each(function () {
+        if ($("#" + $(this).val()).is(".hc-plot.not_rendered:not(.gt_max_num_ds)")) {
+          plot_graph($(this).val(), undefined, mqc_config["num_datasets_plot_limit"] * 50);
+        }
+      });
       ////// EXPORT PLOT IMAGES
       //////
       if ($("#mqc_image_download").is(":visible")) {
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+""" MultiQC report asset cache. Keeps the contents of the template files
+included in the report (JavaScript, CSS, fonts and images, base64-encoded
+where needed), so that they don't need to be read and encoded again for
+every report. """
+
+
+import base64
+import io
+import json
+import os
+import re
+
+from . import config
+
+logger = config.logger
+
+
+def cache_path(template):
+    """
+    Location of the asset bundle for a template and MultiQC version. Assets are keyed
+    on their file size and modification time, so the git hash is left out of the name.
+    """
+    cache_dir = config.template_asset_cache_dir
+    if cache_dir is None:
+        cache_dir = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "multiqc", "assets")
+    version = re.sub(r"[^\w.]+", "_", config.short_version).strip("_")
+    return os.path.join(cache_dir, "{}-{}.json".format(template, version))
+
+
+class AssetBundle:
+    """
+    Files included in the report by a template. Files are found in the template
+    directory, followed by the directory of the parent theme. Contents are kept
+    in memory, keyed on the file path, size and modification time. If a path is
+    given, the bundle is loaded from and saved to that file for the next run.
+    """
+
+    def __init__(self, template_dirs, path=None):
+        self.template_dirs = template_dirs
+        self.path = path
+        self.assets = dict()
+        self.used = set()
+        # Keys of files used in this report that were found in the saved bundle
+        self.hits = set()
+        self.loaded = set()
+        if self.path is None:
+            return
+        try:
+            with io.open(self.path, "r", encoding="utf-8") as fh:
+                self.assets = json.load(fh)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.debug(f"Could not load report asset cache '{self.path}': {e}")
+        else:
+            self.loaded = set(self.assets)
+            logger.debug(f"Loaded {len(self.assets)} cached report assets from '{self.path}'")
+
+    def find(self, name):
+        """Path to a template file, from the theme itself or its parent"""
+        for template_dir in self.template_dirs:
+            fn = os.path.join(template_dir, name)
+            if os.path.exists(fn):
+                return fn
+        return os.path.join(self.template_dirs[0], name)
+
+    def include_file(self, name, fdir=False, b64=False):
+        """
+        Function to include file contents in Jinja template. Files are looked for
+        in the template directories unless a directory is given (None for paths
+        relative to the working directory).
+        """
+        try:
+            if fdir is False:
+                fn = self.find(name)
+            else:
+                fn = os.path.join(fdir or "", name)
+            fstat = os.stat(fn)
+            key = "{}|{}|{}|{}".format(os.path.realpath(fn), fstat.st_size, fstat.st_mtime_ns, "b64" if b64 else "")
+            self.used.add(key)
+            if key in self.loaded:
+                self.hits.add(key)
+            if key in self.assets:
+                return self.assets[key]
+            if b64:
+                with io.open(fn, "rb") as f:
+                    self.assets[key] = base64.b64encode(f.read()).decode("utf-8")
+            else:
+                with io.open(fn, "r", encoding="utf-8") as f:
+                    self.assets[key] = f.read()
+            return self.assets[key]
+        except (OSError, IOError) as e:
+            logger.error("Could not include file '{}': {}".format(name, e))
+
+    def save(self):
+        """Write the files used in this report to the bundle, if anything changed"""
+        logger.debug(f"Report asset cache: {len(self.hits)} of {len(self.used)} files found")
+        # Unchanged if every file used was in the bundle, and it has nothing else
+        if self.path is None or self.hits == self.used == self.loaded:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with io.open(self.path, "w", encoding="utf-8") as fh:
+                json.dump({key: self.assets[key] for key in self.used}, fh)
+        except OSError as e:
+            logger.warning(f"Could not save report asset cache '{self.path}': {e}")
@@ -6,10 +6,13 @@ config variables to be used across all other modules """
 
 import collections
 import inspect
+import io
+import json
 
 # Default logger will be replaced by caller
 import logging
 import os
+import re
 import subprocess
 import sys
 from datetime import datetime
@@ -21,35 +24,109 @@ import multiqc
 
 logger = logging.getLogger("multiqc")
 
+# Constants
+MULTIQC_DIR = os.path.dirname(os.path.realpath(inspect.getfile(multiqc)))
+script_path = os.path.dirname(os.path.realpath(__file__))
+
+
+def _get_git_hash():
+    """
+    Commit hash if MultiQC is running from a git checkout. Read from the .git
+    directory where possible, which is much faster than running git.
+    """
+    repo_dir = os.path.dirname(MULTIQC_DIR)
+    git_dir = os.path.join(repo_dir, ".git")
+    if not os.path.exists(git_dir):
+        return None
+    try:
+        with open(os.path.join(git_dir, "HEAD")) as f:
+            head = f.read().strip()
+        if head.startswith("ref: "):
+            ref = head[5:]
+            head = None
+            if os.path.isfile(os.path.join(git_dir, ref)):
+                with open(os.path.join(git_dir, ref)) as f:
+                    head = f.read().strip()
+            elif os.path.isfile(os.path.join(git_dir, "packed-refs")):
+                with open(os.path.join(git_dir, "packed-refs")) as f:
+                    for line in f:
+                        if line.rstrip("\n").endswith(" " + ref):
+                            head = line.split(" ")[0]
+        if head is not None and re.match(r"^[0-9a-f]{40}$", head):
+            return head
+    except OSError:
+        pass  # Eg. a worktree, where .git is a file
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=repo_dir, stderr=subprocess.STDOUT, universal_newlines=True
+        ).strip()
+    except:
+        return None
+
+
 # Get the MultiQC version
 version = importlib_metadata.version("multiqc")
 short_version = version
-script_path = os.path.dirname(os.path.realpath(__file__))
-git_hash = None
+git_hash = _get_git_hash()
 git_hash_short = None
-try:
-    git_hash = subprocess.check_output(
-        ["git", "rev-parse", "HEAD"], cwd=script_path, stderr=subprocess.STDOUT, universal_newlines=True
-    ).strip()
+if git_hash is not None:
     git_hash_short = git_hash[:7]
     version = "{} ({})".format(version, git_hash_short)
-except:
-    pass
 
-# Constants
-MULTIQC_DIR = os.path.dirname(os.path.realpath(inspect.getfile(multiqc)))
+
+def _load_defaults_yaml(filenames):
+    """
+    Parse the YAML files with the config defaults and search patterns. These take a
+    while to read, so are saved as JSON in the user cache directory for the next run,
+    keyed on the size and modification time of each file. The file name only has the
+    short MultiQC version, so that development installs don't leave one per commit.
+    Set the MULTIQC_NO_CONFIG_CACHE environment variable to not use the cache.
+    """
+    sources = [[fn, os.path.getsize(fn), os.path.getmtime(fn)] for fn in filenames]
+    cache_fn = None
+    if not os.environ.get("MULTIQC_NO_CONFIG_CACHE"):
+        cache_fn = os.path.join(
+            os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+            "multiqc",
+            "config_defaults-{}.json".format(re.sub(r"[^\w.]+", "_", short_version).strip("_")),
+        )
+        try:
+            with io.open(cache_fn, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached["sources"] == sources:
+                return cached["data"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    # Use the much faster LibYAML parser if available
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    data = []
+    for fn in filenames:
+        with open(fn) as f:
+            data.append(yaml.load(f, Loader=loader))
+    if cache_fn is None:
+        return data
+    try:
+        # Only cache if nothing is lost by saving as JSON
+        if json.loads(json.dumps(data)) == data:
+            os.makedirs(os.path.dirname(cache_fn), exist_ok=True)
+            with io.open(cache_fn, "w", encoding="utf-8") as f:
+                json.dump({"sources": sources, "data": data}, f)
+    except (OSError, TypeError, ValueError):
+        pass
+    return data
+
 
 ##### MultiQC Defaults
-# Default MultiQC config
-searchp_fn = os.path.join(MULTIQC_DIR, "utils", "config_defaults.yaml")
-with open(searchp_fn) as f:
-    configs = yaml.safe_load(f)
-    for c, v in configs.items():
-        globals()[c] = v
-# Module filename search patterns
-searchp_fn = os.path.join(MULTIQC_DIR, "utils", "search_patterns.yaml")
-with open(searchp_fn) as f:
-    sp = yaml.safe_load(f)
+# Default MultiQC config and module filename search patterns
+configs, sp = _load_defaults_yaml(
+    [
+        os.path.join(MULTIQC_DIR, "utils", "config_defaults.yaml"),
+        os.path.join(MULTIQC_DIR, "utils", "search_patterns.yaml"),
+    ]
+)
+for c, v in configs.items():
+    globals()[c] = v
 
 # Other defaults that can't be set in YAML
 data_tmp_dir = "/tmp"  # will be overwritten by core script
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+
+""" MultiQC flat plot rendering. MatPlotLib figures are queued while modules
+run and drawn once all modules have finished, optionally in worker processes
+and reusing images saved by previous runs. """
+
+
+import base64
+import hashlib
+import importlib.util
+import io
+import multiprocessing
+import os
+import re
+
+from . import config, parallel, report
+
+logger = config.logger
+
+PLACEHOLDER = "%%mqc_flat_plot:{}%%"
+PLACEHOLDER_RE = re.compile(r"%%mqc_flat_plot:(.+?)%%")
+GROUP = "<!--mqc_flat_group:{gid}-->{html}<!--/mqc_flat_group:{gid}-->"
+GROUP_RE = re.compile(r"<!--mqc_flat_group:(.+?)-->(.*?)<!--/mqc_flat_group:\1-->", re.DOTALL)
+
+# MatPlotLib pyplot module, once imported
+_pyplot = None
+
+# Figures to draw, set before the worker processes are forked
+_jobs = None
+
+
+def cache_dir():
+    """Location of previously rendered flat plots"""
+    if config.plots_flat_cache_dir is not None:
+        return config.plots_flat_cache_dir
+    return os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "multiqc", "flat_plots")
+
+
+def pyplot():
+    """
+    Import MatPlotLib when the first figure is drawn, as it is slow to import.
+    Uses the Agg backend to avoid needing an X environment.
+    """
+    global _pyplot
+    if _pyplot is None:
+        import matplotlib
+
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+
+        logger.debug("Using matplotlib version {}".format(matplotlib.__version__))
+        _pyplot = plt
+    return _pyplot
+
+
+def add(pid, draw_function, *args, embed=True):
+    """
+    Queue a figure to be drawn after all modules have run. draw_function must be
+    a module-level function that takes args and returns a MatPlotLib figure and a
+    dict of extra keyword arguments for savefig(). The figure is saved in every
+    export format, plus as a PNG to embed in the report if embed is True. Modules
+    often reuse and change pconfig after plotting, so pass a copy of it in args.
+    Returns the source to use for the HTML <img> tag.
+    """
+    # Checked now, so that plots can use HighCharts instead if MatPlotLib is missing
+    if importlib.util.find_spec("matplotlib") is None:
+        raise ImportError("MatPlotLib library could not be found")
+    formats = []
+    if config.export_plots and config.plots_dir is not None:
+        formats.extend(config.export_plot_formats)
+    if embed and "png" not in formats:
+        formats.append("png")
+    report.flat_plots.append({"pid": pid, "figure": (draw_function, args), "formats": formats})
+    if embed:
+        return "data:image/png;base64," + PLACEHOLDER.format(pid)
+    return os.path.join(config.plots_dir_name, "png", "{}.png".format(pid))
+
+
+def group(gid, pids, html, fallback_function=None, *args):
+    """
+    Mark the HTML of a plot made up of the queued figures pids. If any of these
+    can't be drawn, the HTML is replaced by fallback_function(*args), such as the
+    HighCharts version of the plot, or by an error message if there is none.
+    Returns the HTML to use in the report.
+    """
+    fallback = None
+    if fallback_function is not None:
+        fallback = (fallback_function, args)
+    report.flat_plots.append({"gid": gid, "pids": pids, "fallback": fallback})
+    return GROUP.format(gid=gid, html=html)
+
+
+def _fallback_html(group):
+    """HTML to use instead of a plot with figures that could not be drawn"""
+    if group["fallback"] is not None:
+        try:
+            fallback_function, args = group["fallback"]
+            html = fallback_function(*args)
+            logger.warning(f"Using an interactive plot instead of flat plot '{group['gid']}'")
+            return html
+        except Exception as e:
+            logger.error(f"Error making interactive plot instead of flat plot '{group['gid']}': {e}")
+            logger.debug(e, exc_info=True)
+    return '<p class="text-danger">Error making flat plot: the figure could not be drawn.</p>'
+
+
+def _render(figure, formats):
+    """Draw a figure and save it in each format. Returns a dict of format: bytes."""
+    plt = pyplot()
+    draw_function, args = figure
+    fig, savefig_kwargs = draw_function(*args)
+    images = dict()
+    try:
+        for fformat in formats:
+            buf = io.BytesIO()
+            fig.savefig(buf, format=fformat, bbox_inches="tight", **savefig_kwargs)
+            images[fformat] = buf.getvalue()
+    finally:
+        plt.close(fig)
+    return images
+
+
+def _render_job(job_idx):
+    """Worker process wrapper around _render(), for a job in _jobs"""
+    job = _jobs[job_idx]
+    try:
+        return _render(job["figure"], job["formats"])
+    except Exception as e:
+        logger.debug(f"Could not render flat plot '{job['pid']}' in worker process: {e}")
+        return None
+
+
+def _html_containers():
+    """Section dicts and module objects that can contain plot HTML, with the attribute used to get / set it"""
+    for mod in report.modules_output:
+        if isinstance(getattr(mod, "intro", None), str):
+            yield mod, "intro"
+        for section in getattr(mod, "sections", []):
+            for key, value in section.items():
+                if isinstance(value, str):
+                    yield section, key
+
+
+def _get(container, key):
+    return container[key] if isinstance(container, dict) else getattr(container, key)
+
+
+def _set(container, key, value):
+    if isinstance(container, dict):
+        container[key] = value
+    else:
+        setattr(container, key, value)
+
+
+def render_all():
+    """
+    Render all queued flat plots: save them to the plots directory and replace
+    their placeholders in the report with base64-encoded images. Plots with
+    figures that could not be drawn are replaced with their fallback HTML.
+    """
+    if len(report.flat_plots) == 0:
+        return
+    jobs = [job for job in report.flat_plots if "pid" in job]
+    groups = {group["gid"]: group for group in report.flat_plots if "gid" in group}
+    report.flat_plots = []
+    if len(jobs) > 0:
+        logger.info(f"Rendering {len(jobs)} flat plot{'s' if len(jobs) > 1 else ''}")
+
+    # Only make the embedded PNG if the plot HTML made it into the report
+    embedded = set()
+    for container, key in _html_containers():
+        if "%%mqc_flat_plot:" in _get(container, key):
+            embedded.update(PLACEHOLDER_RE.findall(_get(container, key)))
+    for job in jobs:
+        if job["pid"] not in embedded and not (config.export_plots and "png" in config.export_plot_formats):
+            job["formats"] = [f for f in job["formats"] if f != "png"]
+    jobs = [job for job in jobs if len(job["formats"]) > 0]
+
+    # Reuse images with the same figure data from previous runs
+    images = dict()
+    cache_path = None
+    if config.plots_flat_cache:
+        import matplotlib
+
+        cache_path = cache_dir()
+        for job in jobs:
+            try:
+                figure = parallel.dumps(job["figure"])
+            except Exception as e:
+                logger.debug(f"Flat plot '{job['pid']}' can't be cached: {e}")
+                continue
+            fig_hash = hashlib.sha1()
+            for part in [config.version, matplotlib.__version__, figure]:
+                fig_hash.update(part if isinstance(part, bytes) else part.encode("utf-8"))
+            job["hash"] = fig_hash.hexdigest()
+            cached = dict()
+            for fformat in job["formats"]:
+                try:
+                    with open(os.path.join(cache_path, "{}.{}".format(job["hash"], fformat)), "rb") as fh:
+                        cached[fformat] = fh.read()
+                except OSError:
+                    break
+            else:
+                images[job["pid"]] = cached
+        logger.debug(f"Flat plot cache: {len(images)} of {len(jobs)} plots found in '{cache_path}'")
+    to_render = [job for job in jobs if job["pid"] not in images]
+
+    # Draw the new figures, in parallel if requested
+    workers = min(config.plots_flat_workers, len(to_render))
+    if workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+        logger.warning("Rendering flat plots in parallel is not supported on this system, running one by one")
+        workers = 1
+    results = [None] * len(to_render)
+    if workers > 1:
+        # Worker processes get the figures when forked, so they don't need to be pickled
+        global _jobs
+        _jobs = to_render
+        logger.debug(f"Rendering flat plots using {workers} processes")
+        try:
+            with multiprocessing.get_context("fork").Pool(workers) as pool:
+                results = pool.map(_render_job, range(len(to_render)), chunksize=1)
+        finally:
+            _jobs = None
+    failed = set()
+    for job, result in zip(to_render, results):
+        if result is None:
+            # Not rendered yet, or failed in a worker - run here to get the error
+            try:
+                result = _render(job["figure"], job["formats"])
+            except Exception as e:
+                if config.strict:
+                    raise
+                logger.error(f"Error making MatPlotLib figure '{job['pid']}': {e}")
+                logger.debug(e, exc_info=True)
+                failed.add(job["pid"])
+                continue
+        images[job["pid"]] = result
+        if cache_path is not None and "hash" in job:
+            try:
+                os.makedirs(cache_path, exist_ok=True)
+                for fformat, image in result.items():
+                    with open(os.path.join(cache_path, "{}.{}".format(job["hash"], fformat)), "wb") as fh:
+                        fh.write(image)
+            except OSError as e:
+                logger.warning(f"Could not save flat plot to cache '{cache_path}': {e}")
+                cache_path = None
+
+    # Save exported plots
+    if config.export_plots and config.plots_dir is not None:
+        for pid, pimages in images.items():
+            for fformat in config.export_plot_formats:
+                if fformat not in pimages:
+                    continue
+                plot_dir = os.path.join(config.plots_dir, fformat)
+                os.makedirs(plot_dir, exist_ok=True)
+                with open(os.path.join(plot_dir, "{}.{}".format(pid, fformat)), "wb") as fh:
+                    fh.write(pimages[fformat])
+
+    # Swap out plots with figures that failed, and embed images in the report
+    def group_html(match):
+        group = groups.get(match.group(1))
+        if group is not None and failed.intersection(group["pids"]):
+            return _fallback_html(group)
+        return match.group(2)
+
+    def b64_image(match):
+        png = images.get(match.group(1), {}).get("png", b"")
+        return base64.b64encode(png).decode("utf8")
+
+    for container, key in _html_containers():
+        value = _get(container, key)
+        if "<!--mqc_flat_group:" in value or "%%mqc_flat_plot:" in value:
+            value = GROUP_RE.sub(group_html, value)
+            _set(container, key, PLACEHOLDER_RE.sub(b64_image, value))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+""" MultiQC histogram helpers. Histograms such as coverage and insert size
+distributions are held as a pair of NumPy arrays, the bin values and the counts,
+so that summary statistics are worked out without a Python loop over the bins. """
+
+
+import numpy as np
+
+
+def parse(lines, sep=None, comment="#", label=False):
+    """
+    Read a text histogram with one bin per line into arrays of bin values and
+    counts. Comment lines and lines with too few columns are skipped. If label is
+    True the first column is a label, such as a contig name, and the list of labels
+    is returned before the arrays. Raises ValueError if a value is not a number.
+    """
+    num_columns = 3 if label else 2
+    # Columns are kept as lists of strings, as a list for every row is slow to make
+    labels, x, counts = [], [], []
+    for line in lines:
+        if comment and line.startswith(comment):
+            continue
+        fields = line.split(sep)
+        if len(fields) >= num_columns:
+            if label:
+                labels.append(fields[0])
+            x.append(fields[num_columns - 2])
+            counts.append(fields[num_columns - 1])
+    x, counts = [np.fromiter(map(float, column), dtype=np.float64, count=len(column)) for column in (x, counts)]
+    if label:
+        return labels, x, counts
+    return x, counts
+
+
+def first_bin(x, values, threshold, inclusive=True):
+    """
+    Bin value of the first bin, in the order given, where values reach the
+    threshold (or go above it, if not inclusive). None if no bin does.
+    """
+    values = np.asarray(values)
+    reached = values >= threshold if inclusive else values > threshold
+    if not reached.any():
+        return None
+    return np.asarray(x)[np.argmax(reached)].item()
+
+
+def percentile(x, counts, q):
+    """
+    Weighted percentile: the bin value of the first bin, in the order given, where
+    the cumulative count reaches q percent of the total. None if there are no bins.
+    """
+    cumulative = np.cumsum(counts)
+    if len(cumulative) == 0:
+        return None
+    return first_bin(x, cumulative, cumulative[-1] * (q / 100.0))
+
+
+def median(x, counts):
+    """Weighted median bin value, see percentile()"""
+    return percentile(x, counts, 50)
+
+
+def mean(x, counts):
+    """Weighted mean of the bin values, or None if the histogram is empty"""
+    total = np.sum(counts)
+    if len(counts) == 0 or total == 0:
+        return None
+    return float(np.dot(x, counts) / total)
+
+
+def cumulative_from_top(x, counts):
+    """
+    Bin values sorted from highest to lowest, with the cumulative count of all
+    bins at or above each of them.
+    """
+    order = np.argsort(x, kind="stable")[::-1]
+    return np.asarray(x)[order], np.cumsum(np.asarray(counts)[order])
+
+
+def from_cumulative(x, cumulative):
+    """
+    Reverse of cumulative_from_top(): counts for each bin from the cumulative
+    counts at or above each bin value. Returns the bin values sorted from lowest.
+    """
+    order = np.argsort(x, kind="stable")
+    x, cumulative = np.asarray(x)[order], np.asarray(cumulative)[order]
+    return x, cumulative - np.append(cumulative[1:], 0)
+
+
+def percent_at_least(x, counts, thresholds, total=None):
+    """
+    Percentage of the total count in bins with values at or above each threshold,
+    such as the percentage of the genome with at least X coverage. The total
+    defaults to the sum of the counts. Returns a list in the order of the
+    thresholds, with None for each threshold if the total is zero.
+    """
+    x_desc, cumulative = cumulative_from_top(x, counts)
+    if total is None:
+        total = cumulative[-1] if len(cumulative) > 0 else 0
+    if total <= 0:
+        return [None] * len(thresholds)
+    # Number of bins at or above each threshold, used to index the cumulative counts
+    num_bins = len(x_desc) - np.searchsorted(x_desc[::-1], thresholds, side="left")
+    counts_above = np.concatenate(([0], cumulative))[num_bins]
+    return (100.0 * counts_above / total).tolist()
+
+
+def rebin(x, counts, width):
+    """
+    Sum the counts into wider bins starting at multiples of width. Returns the
+    start of each wider bin that is used and the summed counts.
+    """
+    starts, inverse = np.unique(np.floor_divide(x, width) * width, return_inverse=True)
+    return starts, np.bincount(inverse, weights=counts, minlength=len(starts))
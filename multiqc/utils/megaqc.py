@@ -8,8 +8,6 @@ import io
 import json
 import os
 
-import requests
-
 from . import config
 
 log = config.logger
@@ -86,6 +84,9 @@ def multiqc_api_post(exported_data):
     gzfh.close()
     request_body = sio_obj.getvalue()
 
+    # Imported here as requests is slow to import and MegaQC is rarely used
+    import requests
+
     log.debug("Sending data to MegaQC")
     log.debug("MegaQC URL: {}".format(config.megaqc_url))
     try:
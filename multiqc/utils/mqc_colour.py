@@ -5,16 +5,54 @@ Helper functions to manipulate colours and colour scales
 
 
 # Default logger will be replaced by caller
+import functools
 import logging
 import re
 
 import numpy as np
-import spectra
 
 from multiqc.utils import config, report
 
 logger = logging.getLogger(__name__)
 
+# Number of colours precomputed along each sequential colour scale
+GRADIENT_STEPS = 256
+
+
+def _lighten(rgb, lighten):
+    """Lighten RGB values (0-1) and return a hex code"""
+    # Imported when first needed, as spectra is slow to import
+    import spectra
+
+    # Ported from the original JavaScript for continuity
+    # Seems to work better than adjusting brightness / saturation / luminosity
+    return spectra.rgb(*[max(0, min(1, 1 + ((x - 1) * lighten))) for x in rgb]).hexcode
+
+
+@functools.lru_cache(maxsize=256)
+def _lightened_colour(colour, lighten):
+    """Hex code for a single lightened colour"""
+    import spectra
+
+    return _lighten(spectra.html(colour).rgb, lighten)
+
+
+@functools.lru_cache(maxsize=128)
+def _gradient(colours, minval, maxval, lighten):
+    """Hex codes for GRADIENT_STEPS evenly spaced values along a lightened colour scale"""
+    import spectra
+
+    domain_nums = list(np.linspace(minval, maxval, len(colours)))
+    my_scale = spectra.scale(list(colours)).domain(domain_nums)
+    return [_lighten(my_scale(val).rgb, lighten) for val in np.linspace(minval, maxval, GRADIENT_STEPS).tolist()]
+
+
+def _is_finite_number(val):
+    try:
+        return isinstance(val, (int, float)) and not isinstance(val, bool) and np.isfinite(float(val))
+    except OverflowError:
+        return False
+
 
 class mqc_colour_scale(object):
     """Class to hold a colour scheme."""
@@ -348,10 +386,6 @@ class mqc_colour_scale(object):
     def get_colour(self, val, colformat="hex", lighten=0.3, source=None):
         """Given a value, return a colour within the colour scale"""
 
-        # Ported from the original JavaScript for continuity
-        # Seems to work better than adjusting brightness / saturation / luminosity
-        rgb_converter = lambda x: max(0, min(1, 1 + ((x - 1) * lighten)))
-
         try:
             if self.name in mqc_colour_scale.qualitative_scales and isinstance(val, float):
                 if config.strict:
@@ -372,15 +406,11 @@ class mqc_colour_scale(object):
                     # values assigned with the same color. But instead we will get a hash from a string to hope to assign
                     # a unique color for each possible enumeration value.
                     val = hash(val)
-                thecolour = spectra.html(self.colours[val % len(self.colours)])
-                thecolour = spectra.rgb(*[rgb_converter(v) for v in thecolour.rgb])
-                return thecolour.hexcode
+                return _lightened_colour(self.colours[val % len(self.colours)], lighten)
 
             # When there is only 1 color in scale, spectra.scale() will crash with DevisionByZero
             elif len(self.colours) == 1:
-                thecolour = spectra.html(self.colours[0])
-                thecolour = spectra.rgb(*[rgb_converter(v) for v in thecolour.rgb])
-                return thecolour.hexcode
+                return _lightened_colour(self.colours[0], lighten)
 
             else:
                 # Sanity checks
@@ -391,17 +421,42 @@ class mqc_colour_scale(object):
                 val = max(val, self.minval)
                 val = min(val, self.maxval)
 
-                domain_nums = list(np.linspace(self.minval, self.maxval, len(self.colours)))
-                my_scale = spectra.scale(self.colours).domain(domain_nums)
+                # Nearest colour from the precomputed gradient
+                gradient = _gradient(tuple(self.colours), self.minval, self.maxval, lighten)
+                return gradient[int(round((val - self.minval) / (self.maxval - self.minval) * (GRADIENT_STEPS - 1)))]
 
-                # Lighten colours
-                thecolour = spectra.rgb(*[rgb_converter(v) for v in my_scale(val).rgb])
+        except:
+            # Shouldn't crash all of MultiQC just for colours
+            return ""
 
-                return thecolour.hexcode
+    def get_colours_for(self, values, lighten=0.3, source=None):
+        """
+        Given a list of values, return a list of colours within the colour scale.
+        Gives the same colours as get_colour(), but looks up all numbers at once.
+        """
+        if self.name in mqc_colour_scale.qualitative_scales or len(self.colours) == 1:
+            return [self.get_colour(val, lighten=lighten, source=source) for val in values]
+
+        colours = [None] * len(values)
+        num_idx = []
+        for i, val in enumerate(values):
+            if _is_finite_number(val):
+                num_idx.append(i)
+            else:
+                colours[i] = self.get_colour(val, lighten=lighten, source=source)
+        if len(num_idx) == 0:
+            return colours
 
+        try:
+            gradient = _gradient(tuple(self.colours), self.minval, self.maxval, lighten)
         except:
             # Shouldn't crash all of MultiQC just for colours
-            return ""
+            gradient = [""] * GRADIENT_STEPS
+        numbers = np.clip(np.array([float(values[i]) for i in num_idx]), self.minval, self.maxval)
+        steps = np.rint((numbers - self.minval) / (self.maxval - self.minval) * (GRADIENT_STEPS - 1))
+        for i, step in zip(num_idx, steps.astype(int).tolist()):
+            colours[i] = gradient[step]
+        return colours
 
     def get_colours(self, name="GnBu"):
         """Function to get a colour scale by name
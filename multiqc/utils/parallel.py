@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+
+""" MultiQC parallel execution helpers. Runs modules in worker
+processes and merges what they add to the report back into the
+main process, in the original module order. """
+
+
+import copy
+import importlib
+import io
+import marshal
+import multiprocessing
+import os
+import pickle
+import random
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+from . import config, report
+
+logger = config.logger
+
+# Report variables that modules add to. Every module run in a worker starts
+# from a copy of these as they were before any modules ran.
+REPORT_ATTRS = [
+    "general_stats_data",
+    "general_stats_headers",
+    "data_sources",
+    "plot_data",
+    "table_data",
+    "html_ids",
+    "lint_errors",
+    "num_hc_plots",
+    "num_mpl_plots",
+    "saved_raw_data",
+    "software_versions",
+    "parsed_files",
+    "flat_plots",
+    "ignored_samples",
+]
+
+# Set in the main process before the worker processes are forked
+_baseline = None
+
+
+def _rebuild_function(code, module, name, defaults, closure_values):
+    """Recreate a function pickled by _Pickler"""
+    try:
+        func_globals = importlib.import_module(module).__dict__
+    except (ImportError, TypeError):
+        func_globals = {"__builtins__": __builtins__}
+    closure = None
+    if closure_values is not None:
+        closure = tuple(types.CellType(v) for v in closure_values)
+    return types.FunctionType(marshal.loads(code), func_globals, name, defaults, closure)
+
+
+class _Pickler(pickle.Pickler):
+    """
+    Modules often put lambda functions in their table headers (eg. 'modify'),
+    which the standard pickle module can't handle. Lambdas and other functions
+    that can't be imported by name are pickled by their code instead. Only
+    for sending data between processes running the same Python.
+    Requires Python 3.8+, other Python versions will fail to pickle them.
+    """
+
+    def reducer_override(self, obj):
+        if not isinstance(obj, types.FunctionType):
+            return NotImplemented
+        # Normal functions are pickled by reference
+        try:
+            found = sys.modules[obj.__module__]
+            for part in obj.__qualname__.split("."):
+                found = getattr(found, part)
+            if found is obj:
+                return NotImplemented
+        except (KeyError, AttributeError):
+            pass
+        closure_values = None
+        if obj.__closure__ is not None:
+            closure_values = tuple(c.cell_contents for c in obj.__closure__)
+        return _rebuild_function, (
+            marshal.dumps(obj.__code__),
+            obj.__module__,
+            obj.__name__,
+            obj.__defaults__,
+            closure_values,
+        )
+
+
+def dumps(obj):
+    """Pickle an object, including any lambda functions"""
+    buf = io.BytesIO()
+    _Pickler(buf, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+    return buf.getvalue()
+
+
+def _plain_dict(d):
+    """Convert nested defaultdicts (which can have unpicklable default factories) to dicts"""
+    if isinstance(d, dict):
+        return {k: _plain_dict(v) for k, v in d.items()}
+    return d
+
+
+def _run_module(this_module, mod_cust_config, tmp_dir):
+    """
+    Run a single module in a worker process. Returns the pickled module
+    output together with everything that the module added to the report.
+    """
+    from ..modules.base_module import ModuleNoSamplesFound
+
+    # Start from a clean report, as though this was the first module to run
+    for attr in REPORT_ATTRS:
+        setattr(report, attr, copy.deepcopy(_baseline[attr]))
+    # Forked processes share the random state - avoid identical random plot IDs
+    random.seed()
+
+    # Write data files and exported plots to a private directory, merged later
+    work_dir = tempfile.mkdtemp(dir=tmp_dir)
+    if config.data_dir is not None:
+        config.data_dir = os.path.join(work_dir, "data")
+        os.makedirs(config.data_dir)
+    if config.plots_dir is not None:
+        config.plots_dir = os.path.join(work_dir, "plots")
+        os.makedirs(config.plots_dir)
+
+    start = time.time()
+    result = {"status": "ok", "output": [], "work_dir": work_dir}
+    try:
+        mod = config.avail_modules[this_module].load()
+        mod.mod_cust_config = mod_cust_config
+        output = mod()
+        if type(output) != list:
+            output = [output]
+        result["output"] = output
+    except ModuleNoSamplesFound:
+        result["status"] = "no_samples"
+    except Exception as e:
+        # Run again in the main process, which handles reporting the error
+        logger.debug(f"Module '{this_module}' failed in a worker process: {e}")
+        return dumps({"status": "failed", "work_dir": work_dir})
+    result["runtime"] = time.time() - start
+
+    # Everything the module added to the report
+    added = {}
+    for attr in ["general_stats_data", "general_stats_headers", "html_ids", "lint_errors", "flat_plots"]:
+        added[attr] = getattr(report, attr)[len(_baseline[attr]) :]
+    for attr in ["plot_data", "table_data", "saved_raw_data"]:
+        added[attr] = {k: v for k, v in getattr(report, attr).items() if k not in _baseline[attr]}
+    for attr in ["num_hc_plots", "num_mpl_plots"]:
+        added[attr] = getattr(report, attr) - _baseline[attr]
+    for attr in ["data_sources", "software_versions", "parsed_files", "ignored_samples"]:
+        added[attr] = _plain_dict(getattr(report, attr))
+    result["report"] = added
+
+    try:
+        return dumps(result)
+    except Exception as e:
+        # Run again in the main process, which reports this as it loses the benefit of the workers
+        error = f"Could not send results of module '{this_module}' from worker process: {e}"
+        return dumps({"status": "failed", "work_dir": work_dir, "error": error})
+
+
+class ModulePool:
+    """
+    Runs modules in a pool of worker processes. Results are collected
+    with get_output(), which must be called in the original module order
+    so that the report ends up the same as when running modules one by one.
+    """
+
+    def __init__(self, run_modules, workers, tmp_dir):
+        global _baseline
+        _baseline = {attr: copy.deepcopy(getattr(report, attr)) for attr in REPORT_ATTRS}
+        self.runtimes = dict()
+        self.results = dict()
+        self.pool = multiprocessing.get_context("fork").Pool(workers)
+        for mod_idx, mod_dict in enumerate(run_modules):
+            this_module = list(mod_dict.keys())[0]
+            mod_cust_config = list(mod_dict.values())[0] or {}
+            if getattr(config.avail_modules[this_module].load(), "serial_only", False):
+                logger.debug(f"Module '{this_module}' will not be run in a worker process")
+                continue
+            self.results[mod_idx] = self.pool.apply_async(_run_module, (this_module, mod_cust_config, tmp_dir))
+        self.pool.close()
+
+    def get_output(self, mod_idx):
+        """
+        Wait for a module to finish and merge its results into the report.
+        Returns the module output, or None if the module should be run again
+        in the main process. Raises ModuleNoSamplesFound if the module found nothing.
+        """
+        from ..modules.base_module import ModuleNoSamplesFound
+
+        if mod_idx not in self.results:
+            return None
+        result = pickle.loads(self.results.pop(mod_idx).get())
+        if "error" in result:
+            if config.strict:
+                logger.error(result["error"])
+                report.lint_errors.append(result["error"])
+            else:
+                logger.warning(result["error"])
+        try:
+            if result["status"] == "failed" or not self._merge(result):
+                return None
+        finally:
+            shutil.rmtree(result["work_dir"], ignore_errors=True)
+        self.runtimes[mod_idx] = result["runtime"]
+        if result["status"] == "no_samples":
+            raise ModuleNoSamplesFound
+        return result["output"]
+
+    def _merge(self, result):
+        """
+        Add the results from a worker to the report. Returns False without changing
+        anything if these clash with results from an earlier module (such as
+        duplicate HTML IDs or data file names), as these must be renamed in order.
+        """
+        added = result["report"]
+        if (
+            set(added["html_ids"]) & set(report.html_ids)
+            or set(added["plot_data"]) & set(report.plot_data)
+            or set(added["saved_raw_data"]) & set(report.saved_raw_data)
+        ):
+            logger.debug("Results from worker process clash with an earlier module")
+            return False
+
+        # Data files and exported plots to move from the worker directory
+        move_files = []
+        for subdir, dest_dir in [("data", config.data_dir), ("plots", config.plots_dir)]:
+            src_dir = os.path.join(result["work_dir"], subdir)
+            if dest_dir is None or not os.path.isdir(src_dir):
+                continue
+            for root, _, filenames in os.walk(src_dir):
+                for fn in filenames:
+                    src = os.path.join(root, fn)
+                    dest = os.path.join(dest_dir, os.path.relpath(src, src_dir))
+                    if os.path.exists(dest):
+                        logger.debug(f"File from worker process already exists: {dest}")
+                        return False
+                    move_files.append((src, dest))
+        for src, dest in move_files:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.move(src, dest)
+
+        report.general_stats_data.extend(added["general_stats_data"])
+        report.general_stats_headers.extend(added["general_stats_headers"])
+        report.html_ids.extend(added["html_ids"])
+        report.lint_errors.extend(added["lint_errors"])
+        report.flat_plots.extend(added["flat_plots"])
+        report.plot_data.update(added["plot_data"])
+        report.table_data.update(added["table_data"])
+        report.saved_raw_data.update(added["saved_raw_data"])
+        report.num_hc_plots += added["num_hc_plots"]
+        report.num_mpl_plots += added["num_mpl_plots"]
+        for mod, sections in added["data_sources"].items():
+            for section, sources in sections.items():
+                report.data_sources[mod][section].update(sources)
+        for group, versions in added["software_versions"].items():
+            report.software_versions[group].update(versions)
+        for group, results in added["parsed_files"].items():
+            report.parsed_files.setdefault(group, {}).update(results)
+        for rule, s_names in added["ignored_samples"].items():
+            report.ignored_samples[rule].update(s_names)
+        return True
+
+    def close(self):
+        self.pool.join()
+
+    def terminate(self):
+        self.pool.terminate()
+
+
+def start_module_pool(run_modules, tmp_dir):
+    """Start running modules in worker processes, if possible. Returns a ModulePool or None."""
+    if "fork" not in multiprocessing.get_all_start_methods():
+        logger.warning("Running modules in parallel is not supported on this system, running one by one")
+        return None
+    logger.info(f"Running modules using {config.module_workers} processes")
+    return ModulePool(run_modules, config.module_workers, tmp_dir)
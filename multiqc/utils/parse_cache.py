@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+""" MultiQC incremental mode. Saves the results of parsing each log file
+in the data directory, so that files that haven't changed don't need to be
+parsed again when MultiQC is run again with the same output directory. """
+
+
+import copy
+import io
+import json
+import os
+
+from . import config, report
+
+logger = config.logger
+
+CACHE_FN = "multiqc_parse_cache.json"
+
+# Results loaded from the previous run
+previous = dict()
+
+
+def init():
+    """Load parse results from the data directory of a previous run"""
+    global previous
+    previous = dict()
+    if not config.incremental:
+        return
+    path = os.path.join(config.output_dir, config.data_dir_name, CACHE_FN)
+    if not os.path.isfile(path):
+        logger.debug(f"No previous parse results found at '{path}'")
+        return
+    try:
+        with io.open(path, "r", encoding="utf-8") as fh:
+            cache = json.load(fh)
+    except (IOError, OSError, ValueError) as e:
+        logger.warning(f"Could not load previous parse results from '{path}': {e}")
+        return
+    if cache.get("version") != config.version:
+        logger.debug(f"Ignoring parse results from MultiQC {cache.get('version')}")
+        return
+    previous = cache.get("results", {})
+    logger.debug(f"Loaded previous parse results for {sum(len(v) for v in previous.values())} files")
+
+
+def file_key(f):
+    """Path, size and modification time of a found file"""
+    path = os.path.abspath(os.path.join(f["root"], f["fn"]))
+    st = os.stat(path)
+    return path, st.st_size, st.st_mtime_ns
+
+
+def get(group, f):
+    """
+    Return a tuple of the previous parse result for this file and whether one
+    was found. Also keeps the result so that it is saved for the next run.
+    """
+    try:
+        path, size, mtime = file_key(f)
+    except OSError:
+        return None, False
+    entry = previous.get(group, {}).get(path)
+    if entry is None or entry["size"] != size or entry["mtime"] != mtime:
+        return None, False
+    report.parsed_files.setdefault(group, {})[path] = entry
+    # Modules can change the result, so don't return the copy that is saved
+    return copy.deepcopy(entry["result"]), True
+
+
+def add(group, f, result):
+    """
+    Remember the result of parsing a file. Returns the result as read back from
+    JSON, so that it is the same as when it is loaded in the next run.
+    """
+    try:
+        path, size, mtime = file_key(f)
+    except OSError:
+        return result
+    result_json = json.dumps(result)
+    report.parsed_files.setdefault(group, {})[path] = {"size": size, "mtime": mtime, "result": json.loads(result_json)}
+    return json.loads(result_json)
+
+
+def save():
+    """Write parse results from this run to the data directory"""
+    if not config.incremental or config.data_dir is None:
+        return
+    cache = {"version": config.version, "results": report.parsed_files}
+    with io.open(os.path.join(config.data_dir, CACHE_FN), "w", encoding="utf-8") as fh:
+        json.dump(cache, fh)
@@ -5,22 +5,29 @@ module. Is available to subsequent modules. Contains
 helper functions to generate markup for report. """
 
 
+import base64
+import bisect
+import concurrent.futures
 import fnmatch
 import inspect
 import io
+import itertools
 import json
+import math
 import mimetypes
 import os
 import re
 import time
+import zlib
 from collections import OrderedDict, defaultdict
+from collections.abc import Mapping
 
 import lzstring
 import rich
 import rich.progress
 import yaml
 
-from . import config
+from . import config, sample_names, search_cache
 
 logger = config.logger
 
@@ -53,6 +60,9 @@ def init():
     global plot_data
     plot_data = dict()
 
+    global table_data
+    table_data = dict()
+
     global html_ids
     html_ids = list()
 
@@ -65,18 +75,30 @@ def init():
     global num_mpl_plots
     num_mpl_plots = 0
 
+    global flat_plots
+    flat_plots = list()
+
     global saved_raw_data
     saved_raw_data = dict()
 
     global last_found_file
     last_found_file = None
 
+    # Compiled sample name cleaning and ignore rules, created when first used
+    sample_names.reset()
+
+    # Sample names removed by each sample_names_ignore / sample_names_ignore_re rule
+    global ignored_samples
+    ignored_samples = defaultdict(set)
+
     global runtimes
     runtimes = {
         "total": 0,
         "total_sp": 0,
         "total_mods": 0,
         "total_compression": 0,
+        "total_flat_plots": 0,
+        "total_render": 0,
         "sp": defaultdict(),
         "mods": defaultdict(),
     }
@@ -104,6 +126,10 @@ def init():
     global software_versions
     software_versions = defaultdict(lambda: defaultdict(list))
 
+    # Results of parsing log files in this run, saved for --incremental
+    global parsed_files
+    parsed_files = dict()
+
 
 def get_filelist(run_module_names):
     """
@@ -172,66 +198,103 @@ def get_filelist(run_module_names):
         logger.info("Skipping {} file search patterns".format(len(skipped_patterns)))
         logger.debug("Skipping search patterns: {}".format(", ".join(skipped_patterns)))
 
+    matcher = SearchPatternMatcher(spatterns)
+
     def add_file(fn, root):
         """
         Function applied to each file found when walking the analysis
-        directories. Runs through all search patterns and returns True
-        if a match is found.
+        directories. Runs through all search patterns and returns a dict
+        describing the outcome. Nothing global is modified here, so that
+        this can be run from several threads at once - the results are
+        merged back in order by record_file().
         """
         f = {"fn": fn, "root": root}
+        result = {"f": f, "matched": False, "files": [], "stats": defaultdict(int), "runtimes": defaultdict(float)}
 
         # Check that this is a file and not a pipe or anything weird
         if not os.path.isfile(os.path.join(root, fn)):
-            file_search_stats["skipped_not_a_file"] += 1
-            return False
+            result["stats"]["skipped_not_a_file"] += 1
+            return result
 
         # Check that we don't want to ignore this file
         i_matches = [n for n in config.fn_ignore_files if fnmatch.fnmatch(fn, n)]
         if len(i_matches) > 0:
-            file_search_stats["skipped_ignore_pattern"] += 1
-            return False
+            result["stats"]["skipped_ignore_pattern"] += 1
+            return result
 
         # Limit search to small files, to avoid 30GB FastQ files etc.
+        mtime = None
         try:
-            f["filesize"] = os.path.getsize(os.path.join(root, fn))
+            stat = os.stat(os.path.join(root, fn))
+            f["filesize"] = stat.st_size
+            mtime = stat.st_mtime_ns
         except (IOError, OSError, ValueError, UnicodeDecodeError):
             logger.debug("Couldn't read file when checking filesize: {}".format(fn))
         else:
             if f["filesize"] > config.log_filesize_limit:
-                file_search_stats["skipped_filesize_limit"] += 1
-                return False
+                result["stats"]["skipped_filesize_limit"] += 1
+                return result
 
         # Use mimetypes to exclude binary files where possible
         if not re.match(r".+_mqc\.(png|jpg|jpeg)", f["fn"]) and config.ignore_images:
             (ftype, encoding) = mimetypes.guess_type(os.path.join(f["root"], f["fn"]))
             if encoding is not None:
-                return False
+                return result
             if ftype is not None and ftype.startswith("image"):
-                return False
+                return result
+
+        # Use the result from a previous run if the file hasn't changed
+        if cache is not None and mtime is not None:
+            result["cache_key"] = (os.path.abspath(os.path.join(root, fn)), f["filesize"], mtime)
+            cached = cache.get(*result["cache_key"])
+            if cached is not None:
+                result.update(cached)
+                result["cached"] = True
+                return result
 
         # Test file for each search pattern
-        file_matched = False
-        for patterns in spatterns:
-            for key, sps in patterns.items():
+        file_search = FileSearch(matcher, f, result["stats"])
+        for patterns in matcher.spatterns:
+            for key, cps in patterns:
                 start = time.time()
-                for sp in sps:
-                    if search_file(sp, f, key):
+                for cp in cps:
+                    if file_search.matches(cp):
+                        sp = cp["sp"]
                         # Check that we shouldn't exclude this file
                         if not exclude_file(sp, f):
                             # Looks good! Remember this file
-                            files[key].append(f)
-                            file_search_stats[key] = file_search_stats.get(key, 0) + 1
-                            file_matched = True
+                            result["files"].append(key)
+                            result["matched"] = True
                         # Don't keep searching this file for other modules
                         if not sp.get("shared", False):
-                            runtimes["sp"][key] = runtimes["sp"].get(key, 0) + (time.time() - start)
-                            return True
+                            result["runtimes"][key] += time.time() - start
+                            result["matched"] = True
+                            return result
                         # Don't look at other patterns for this module
                         else:
                             break
-                runtimes["sp"][key] = runtimes["sp"].get(key, 0) + (time.time() - start)
+                result["runtimes"][key] += time.time() - start
+
+        return result
 
-        return file_matched
+    def record_file(result):
+        """
+        Merge the outcome of add_file() into the global search results.
+        Always called in the order of searchfiles, so the final report.files
+        lists are the same whether or not the search ran in parallel.
+        """
+        for key in result["files"]:
+            files[key].append(result["f"])
+            file_search_stats[key] = file_search_stats.get(key, 0) + 1
+        for key, count in result["stats"].items():
+            file_search_stats[key] = file_search_stats.get(key, 0) + count
+        for key, runtime in result["runtimes"].items():
+            runtimes["sp"][key] = runtimes["sp"].get(key, 0) + runtime
+        if not result["matched"]:
+            file_search_stats["skipped_no_match"] += 1
+        if "cache_key" in result and not result.get("cached"):
+            cached = {k: result[k] for k in ["matched", "files", "stats"]}
+            cache.add(*result["cache_key"], cached)
 
     # Go through the analysis directories and get file list
     multiqc_installation_dir_files = [
@@ -246,6 +309,9 @@ def get_filelist(run_module_names):
         ".gitignore",
     ]
     total_sp_starttime = time.time()
+    cache = None
+    if config.filesearch_cache:
+        cache = search_cache.SearchCache(spatterns)
     for path in config.analysis_dir:
         if os.path.islink(path) and config.ignore_symlinks:
             file_search_stats["skipped_symlinks"] += 1
@@ -318,12 +384,24 @@ def get_filelist(run_module_names):
     )
     with progress_obj as progress:
         mqc_task = progress.add_task("searching", total=len(searchfiles), s_fn="")
-        for sf in searchfiles:
-            progress.update(mqc_task, advance=1, s_fn=os.path.join(sf[1], sf[0])[-50:])
-            if not add_file(sf[0], sf[1]):
-                file_search_stats["skipped_no_match"] += 1
+        if config.filesearch_workers > 1:
+            # Files are searched in a pool of threads, as the work is dominated by
+            # I/O (stat calls and reading file heads). Results are consumed in order.
+            logger.debug(f"Searching files using {config.filesearch_workers} threads")
+            with concurrent.futures.ThreadPoolExecutor(max_workers=config.filesearch_workers) as executor:
+                results = executor.map(lambda sf: add_file(sf[0], sf[1]), searchfiles)
+                for sf, result in zip(searchfiles, results):
+                    progress.update(mqc_task, advance=1, s_fn=os.path.join(sf[1], sf[0])[-50:])
+                    record_file(result)
+        else:
+            for sf in searchfiles:
+                progress.update(mqc_task, advance=1, s_fn=os.path.join(sf[1], sf[0])[-50:])
+                record_file(add_file(sf[0], sf[1]))
         progress.update(mqc_task, s_fn="")
 
+    if cache is not None:
+        cache.save()
+
     runtimes["total_sp"] = time.time() - total_sp_starttime
     if config.profile_runtime:
         logger.info(f"Profile-runtime: Searching files took {runtimes['total_sp']:.2f}s")
@@ -336,19 +414,22 @@ def get_filelist(run_module_names):
     logger.debug(f"Summary of files that were skipped by the search: [{'] // ['.join(summaries)}]")
 
 
-def search_file(pattern, f, module_key):
+def search_file(pattern, f, module_key, stats=None):
     """
     Function to searach a single file for a single search pattern.
+    Skipped file counts are added to `stats` if given, otherwise
+    to the global file_search_stats.
     """
 
-    global file_search_stats
+    if stats is None:
+        stats = file_search_stats
     fn_matched = False
     contents_matched = False
 
     # Search pattern specific filesize limit
     if pattern.get("max_filesize") is not None and "filesize" in f:
         if f["filesize"] > pattern.get("max_filesize"):
-            file_search_stats["skipped_module_specific_max_filesize"] += 1
+            stats["skipped_module_specific_max_filesize"] += 1
             return False
 
     # Search by file name (glob)
@@ -386,7 +467,7 @@ def search_file(pattern, f, module_key):
             except (IOError, OSError, ValueError, UnicodeDecodeError) as e:
                 if config.report_readerrors:
                     logger.debug(f"Couldn't read file when looking for output: {file_path}, {e}")
-                file_search_stats["skipped_file_contents_search_errors"] += 1
+                stats["skipped_file_contents_search_errors"] += 1
                 return False
 
         # Go through the parsed file contents
@@ -413,6 +494,170 @@ def search_file(pattern, f, module_key):
     return fn_matched and contents_matched
 
 
+class SearchPatternMatcher:
+    """
+    All search patterns for a run, compiled once. Filename globs and regexes
+    are also combined into a single regex, to quickly rule out files that no
+    filename pattern can match. Gives the same results as calling
+    search_file() for each pattern in turn.
+    """
+
+    def __init__(self, spatterns):
+        self.spatterns = []
+        fn_regexes = []
+        num_contents_patterns = 0
+        for patterns in spatterns:
+            compiled = []
+            for key, sps in patterns.items():
+                cps = []
+                for sp in sps:
+                    cp = self._compile(sp)
+                    if cp["fn"] is not None:
+                        fn_regexes.append(cp["fn"].pattern)
+                    if cp["fn_re"] is not None:
+                        fn_regexes.append(cp["fn_re"].pattern)
+                    if cp["contents"] is not None or cp["contents_re"] is not None:
+                        cp["idx"] = num_contents_patterns
+                        num_contents_patterns += 1
+                    cps.append(cp)
+                compiled.append((key, cps))
+            self.spatterns.append(compiled)
+
+        # One regex to match any filename pattern. Not possible if any use inline flags.
+        try:
+            self.fn_prefilter = re.compile("|".join("(?:{})".format(r) for r in fn_regexes))
+        except re.error:
+            self.fn_prefilter = None
+
+    @staticmethod
+    def _compile(sp):
+        """Precompile a single search pattern"""
+        cp = {
+            "sp": sp,
+            "fn": None,
+            "fn_re": None,
+            "contents": sp.get("contents"),
+            "contents_re": None,
+            "contents_re_text": None,
+            "num_lines": sp.get("num_lines"),
+            "max_filesize": sp.get("max_filesize"),
+        }
+        if sp.get("fn") is not None:
+            cp["fn"] = re.compile(fnmatch.translate(sp["fn"]))
+        if sp.get("fn_re") is not None:
+            cp["fn_re"] = re.compile(sp["fn_re"])
+        if cp["contents"] is None and sp.get("contents_re") is not None:
+            cp["contents_re"] = re.compile(sp["contents_re"])
+            # Multi-line version to search the whole file at once. Patterns that look
+            # behind or use start / end of string anchors must be searched line by line.
+            if not any(x in sp["contents_re"] for x in ["(?<", "\\A", "\\Z"]):
+                try:
+                    cp["contents_re_text"] = re.compile(sp["contents_re"], re.MULTILINE)
+                except re.error:
+                    pass
+        return cp
+
+
+class FileSearch:
+    """
+    Search state for a single file. The start of the file is read once and
+    kept as a single string, so that each contents string can be found with
+    one str.find() instead of checking line by line. The first matching line
+    for each contents pattern is remembered.
+    """
+
+    def __init__(self, matcher, f, stats):
+        self.f = f
+        self.stats = stats
+        self.text = None
+        self.line_starts = None
+        self.first_hits = dict()
+        if matcher.fn_prefilter is not None and not matcher.fn_prefilter.match(f["fn"]):
+            self.fn_possible = False
+        else:
+            self.fn_possible = True
+
+    def matches(self, cp):
+        """Does this file match a compiled search pattern? Same logic as search_file()"""
+        # Search pattern specific filesize limit
+        if cp["max_filesize"] is not None and "filesize" in self.f:
+            if self.f["filesize"] > cp["max_filesize"]:
+                self.stats["skipped_module_specific_max_filesize"] += 1
+                return False
+
+        has_contents = cp["contents"] is not None or cp["contents_re"] is not None
+
+        # Search by file name (glob, then regex)
+        for fn_pattern in (cp["fn"], cp["fn_re"]):
+            if fn_pattern is not None:
+                if not self.fn_possible or not fn_pattern.match(self.f["fn"]):
+                    return False
+                if not has_contents:
+                    return True
+
+        # Search by file contents
+        if has_contents:
+            if not self._read_lines(cp["num_lines"]):
+                return False
+            num_lines = cp["num_lines"] or len(self.f["contents_lines"])
+            if cp["idx"] not in self.first_hits:
+                self.first_hits[cp["idx"]] = self._find_first_hit(cp)
+            hit = self.first_hits[cp["idx"]]
+            return hit is not None and hit < num_lines
+
+        return False
+
+    def _read_lines(self, num_lines):
+        """Read the start of the file, if not already done. Returns False if the file can't be read."""
+        f = self.f
+        if "contents_lines" in f and (not num_lines or len(f["contents_lines"]) >= num_lines):
+            return True
+        f["contents_lines"] = []
+        self.text = None
+        self.first_hits = dict()
+        file_path = os.path.join(f["root"], f["fn"])
+        try:
+            with io.open(file_path, "r", encoding="utf-8") as fh:
+                for i, line in enumerate(fh):
+                    f["contents_lines"].append(line)
+                    if i >= config.filesearch_lines_limit and i >= (num_lines or 0):
+                        break
+        # Can't open file - usually because it's a binary file, and we're reading as utf-8
+        except (IOError, OSError, ValueError, UnicodeDecodeError) as e:
+            if config.report_readerrors:
+                logger.debug(f"Couldn't read file when looking for output: {file_path}, {e}")
+            self.stats["skipped_file_contents_search_errors"] += 1
+            return False
+        return True
+
+    def _find_first_hit(self, cp):
+        """Index of the first line matching a contents pattern, or None"""
+        lines = self.f["contents_lines"]
+        start = 0
+        if (cp["contents"] is not None and "\n" not in cp["contents"]) or cp["contents_re_text"] is not None:
+            if self.text is None:
+                self.text = "".join(lines)
+                self.line_starts = [0] + list(itertools.accumulate(len(line) for line in lines))
+            if cp["contents"] is not None:
+                pos = self.text.find(cp["contents"])
+                if pos == -1:
+                    return None
+                return bisect.bisect_right(self.line_starts, pos) - 1
+            # A regex match in the whole text could span several lines, so
+            # check line by line from the line where the match starts
+            match = cp["contents_re_text"].search(self.text)
+            if match is None:
+                return None
+            start = bisect.bisect_right(self.line_starts, match.start()) - 1
+        for i in range(start, len(lines)):
+            if cp["contents"] is not None:
+                if cp["contents"] in lines[i]:
+                    return i
+            elif cp["contents_re"].search(lines[i]):
+                return i
+        return None
+
+
 def exclude_file(sp, f):
     """
     Exclude discovered files if they match the special exclude_
@@ -547,24 +792,86 @@ def save_htmlid(html_id, skiplint=False):
 
 
 def compress_json(data):
-    """Take a Python data object. Convert to JSON and compress using lzstring"""
-    json_string = json.dumps(data).encode("utf-8", "ignore").decode("utf-8")
-    json_string = sanitise_json(json_string)
+    """
+    Take a Python data object. Convert to JSON and compress using lzstring,
+    or zlib if set in config.plot_data_compression (much faster for large reports)
+    """
+    json_string = dump_json(data)
+    if config.plot_data_compression == "zlib":
+        return base64.b64encode(zlib.compress(json_string.encode("utf-8"), 6)).decode("ascii")
     x = lzstring.LZString()
     return x.compressToBase64(json_string)
 
 
-def sanitise_json(json_string):
+class CompressedPlotData(Mapping):
+    """
+    Compressed JSON data for each plot, keyed by plot ID. Plots are only compressed
+    when read by the report template, so that only one compressed plot needs to
+    be held in memory at a time while the report is written.
+    """
+
+    def __init__(self, plot_data):
+        self.plot_data = plot_data
+
+    def __getitem__(self, pid):
+        start = time.time()
+        try:
+            return compress_json(self.plot_data[pid])
+        finally:
+            runtimes["total_compression"] += time.time() - start
+
+    def __iter__(self):
+        return iter(self.plot_data)
+
+    def __len__(self):
+        return len(self.plot_data)
+
+
+class CompressedPlotJson:
+    """
+    All of the plot data as one lzstring-compressed JSON string, for templates that
+    use report.plot_compressed_json from before plots were compressed separately.
+    Only compressed if the template uses it, when it is first converted to a string.
+    """
+
+    def __init__(self, plot_data):
+        self.plot_data = plot_data
+        self.compressed = None
+
+    def __str__(self):
+        if self.compressed is None:
+            logger.warning(
+                "The report template uses 'report.plot_compressed_json', which is deprecated. "
+                "Use 'report.plot_compressed_chunks' to compress each plot separately."
+            )
+            start = time.time()
+            self.compressed = lzstring.LZString().compressToBase64(dump_json(self.plot_data))
+            runtimes["total_compression"] += time.time() - start
+        return self.compressed
+
+    __html__ = __str__
+
+
+def dump_json(data):
     """
-    The Python json module uses a bunch of values which are valid JavaScript
-    but invalid JSON. These crash the browser when parsing the JSON.
-    Nothing in the MultiQC front-end uses these values, so instead we just
-    do a find-and-replace for them and switch them with `null`, which works fine.
-
-    Side effect: Any string values that include the word "Infinity"
-    (case-sensitive) will have it switched for "null". Hopefully that doesn't happen
-    a lot, otherwise we'll have to do this in a more complicated manner.
+    Convert a Python data object to JSON for the report. The Python json module
+    writes NaN and Infinity as in JavaScript, which is invalid JSON and crashes the
+    browser when parsing. These are rare, so first try to write JSON without them
+    and only replace them with null (None) if that fails.
     """
-    json_string = re.sub(r"\bNaN\b", "null", json_string)
-    json_string = re.sub(r"\b-?Infinity\b", "null", json_string)
-    return json_string
+    try:
+        json_string = json.dumps(data, allow_nan=False)
+    except ValueError:
+        json_string = json.dumps(_replace_nan(data), allow_nan=False)
+    return json_string.encode("utf-8", "ignore").decode("utf-8")
+
+
+def _replace_nan(data):
+    """Return a copy of nested dicts and lists with NaN and infinite floats replaced with None"""
+    if isinstance(data, float):
+        return data if math.isfinite(data) else None
+    if isinstance(data, dict):
+        return {k: _replace_nan(v) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [_replace_nan(v) for v in data]
+    return data
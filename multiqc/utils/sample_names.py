@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+""" MultiQC sample name cleaning and filtering. The config options for cleaning
+and ignoring sample names are compiled once, and the results remembered, as these
+are checked for every file and often for every sample. """
+
+
+import fnmatch
+import functools
+import os
+import re
+
+from . import config
+
+logger = config.logger
+
+# Number of sample names to remember the results for
+CACHE_SIZE = 65536
+
+# Cleaners for each module anchor, and the ignore matcher, created when first used.
+# Kept here rather than on the module objects, so that these can still be pickled.
+_cleaners = dict()
+_ignore_matcher = None
+
+
+def reset():
+    """Forget the compiled rules and remembered results, as the config may have changed"""
+    global _ignore_matcher
+    _cleaners.clear()
+    _ignore_matcher = None
+    clean.cache_clear()
+    ignore_rule.cache_clear()
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def clean(anchor, s_name_original, s_name, root):
+    """Clean a sample name with the rules for a module, see BaseMultiqcModule.clean_s_name()"""
+    if anchor not in _cleaners:
+        _cleaners[anchor] = SampleNameCleaner(anchor)
+    return _cleaners[anchor].clean(s_name_original, s_name, root)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def ignore_rule(s_name):
+    """Label of the first sample_names_ignore rule that matches a sample name, or None"""
+    global _ignore_matcher
+    if _ignore_matcher is None:
+        _ignore_matcher = SampleIgnoreMatcher(config.sample_names_ignore, config.sample_names_ignore_re)
+    return _ignore_matcher.match(s_name)
+
+
+class SampleNameCleaner:
+    """
+    Cleans sample names following config.fn_clean_exts, config.fn_clean_trim,
+    config.prepend_dirs and config.sample_names_replace. Rules limited to other
+    modules are dropped, regexes compiled and runs of truncate patterns checked
+    with a single regex. The config is read when the cleaner is created.
+    """
+
+    def __init__(self, anchor):
+        self.anchor = anchor
+        self.clean_exts = self._compile_clean_exts() if config.fn_clean_sample_names else []
+        self.clean_trim = list(config.fn_clean_trim) if config.fn_clean_sample_names else []
+        self.replace_exact = dict()
+        self.replace_rules = []
+        if config.sample_names_replace:
+            self._compile_replace()
+
+    def _compile_clean_exts(self):
+        """
+        List of (type, pattern) to apply in order. Consecutive truncate patterns are
+        grouped as ("truncate", (patterns, regex)): the regex finds whether any of them
+        are in the name before they are applied one by one.
+        """
+        rules = []
+        for ext in config.fn_clean_exts:
+            if type(ext) is str:
+                ext = {"type": "truncate", "pattern": ext}
+            # Check if this config is limited to a module
+            if "module" in ext:
+                modules = [ext["module"]] if type(ext["module"]) is str else ext["module"]
+                if not any([m == self.anchor for m in modules]):
+                    continue
+
+            # Go through different filter types
+            if ext.get("type") == "truncate":
+                if len(rules) > 0 and rules[-1][0] == "truncate":
+                    rules[-1][1].append(ext["pattern"])
+                else:
+                    rules.append(("truncate", [ext["pattern"]]))
+            elif ext.get("type") in ("remove", "replace"):
+                if ext["type"] == "replace":
+                    logger.warning(
+                        "use 'config.fn_clean_sample_names.remove' instead "
+                        "of 'config.fn_clean_sample_names.replace' [deprecated]"
+                    )
+                rules.append(("remove", ext["pattern"]))
+            elif ext.get("type") == "regex":
+                rules.append(("regex", re.compile(ext["pattern"])))
+            elif ext.get("type") == "regex_keep":
+                rules.append(("regex_keep", re.compile(ext["pattern"])))
+            elif ext.get("type") is None:
+                logger.error('config.fn_clean_exts config was missing "type" key: {}'.format(ext))
+            else:
+                logger.error("Unrecognised config.fn_clean_exts type: {}".format(ext.get("type")))
+
+        for i, (rule_type, patterns) in enumerate(rules):
+            if rule_type == "truncate":
+                regex = re.compile("|".join(re.escape(p) for p in patterns))
+                rules[i] = ("truncate", (patterns, regex))
+        return rules
+
+    def _compile_replace(self):
+        """Prepare the --replace-names rules, compiling regexes"""
+        for s_name_search, s_name_replace in config.sample_names_replace.items():
+            if config.sample_names_replace_regex:
+                try:
+                    self.replace_rules.append((re.compile(s_name_search), s_name_replace))
+                except re.error as e:
+                    logger.error("Error with sample name replacement regex: {}".format(e))
+            elif config.sample_names_replace_exact:
+                # Position is kept, as a replaced name can match a later rule
+                self.replace_exact[s_name_search] = (len(self.replace_exact), s_name_replace)
+            else:
+                self.replace_rules.append((s_name_search, s_name_replace))
+
+    def clean(self, s_name_original, s_name, root):
+        """Clean a sample name, see BaseMultiqcModule.clean_s_name()"""
+        # if s_name comes from file contents, it may have a file path
+        # For consistency with other modules, we keep just the basename
+        s_name = os.path.basename(s_name)
+
+        # Prepend sample name with directory
+        if config.prepend_dirs:
+            sep = config.prepend_dirs_sep
+            root = root.lstrip(".{}".format(os.sep))
+            dirs = [d.strip() for d in root.split(os.sep) if d.strip() != ""]
+            if config.prepend_dirs_depth != 0:
+                d_idx = config.prepend_dirs_depth * -1
+                if config.prepend_dirs_depth > 0:
+                    dirs = dirs[d_idx:]
+                else:
+                    dirs = dirs[:d_idx]
+            if len(dirs) > 0:
+                s_name = "{}{}{}".format(sep.join(dirs), sep, s_name)
+
+        for rule_type, pattern in self.clean_exts:
+            if rule_type == "truncate":
+                # Split then take first section to remove everything after these matches
+                patterns, regex = pattern
+                if regex.search(s_name):
+                    for p in patterns:
+                        s_name = s_name.split(p, 1)[0]
+            elif rule_type == "remove":
+                s_name = s_name.replace(pattern, "")
+            elif rule_type == "regex":
+                s_name = pattern.sub("", s_name)
+            elif rule_type == "regex_keep":
+                match = pattern.search(s_name)
+                s_name = match.group() if match else s_name
+        # Trim off characters at the end of names
+        for chrs in self.clean_trim:
+            if s_name.endswith(chrs):
+                s_name = s_name[: -len(chrs)]
+            if s_name.startswith(chrs):
+                s_name = s_name[len(chrs) :]
+
+        # Remove trailing whitespace
+        s_name = s_name.strip()
+
+        # If we cleaned back to an empty string, just use the original value
+        if s_name == "":
+            s_name = s_name_original
+
+        # Do any hard replacements that are set with --replace-names
+        # Exact string matches: follow on to any later rule matching the new name
+        last_rule = -1
+        while s_name in self.replace_exact and self.replace_exact[s_name][0] > last_rule:
+            last_rule, s_name = self.replace_exact[s_name]
+        for s_name_search, s_name_replace in self.replace_rules:
+            try:
+                # Replace - regex
+                if config.sample_names_replace_regex:
+                    # Skip if we're looking for exact matches only
+                    if config.sample_names_replace_exact and not s_name_search.fullmatch(s_name):
+                        continue
+                    s_name = s_name_search.sub(s_name_replace, s_name)
+                # Replace - simple string
+                else:
+                    # Complete name swap
+                    if config.sample_names_replace_complete:
+                        if s_name_search in s_name:
+                            s_name = s_name_replace
+                    # Partial substring replace
+                    else:
+                        s_name = s_name.replace(s_name_search, s_name_replace)
+            except re.error as e:
+                logger.error("Error with sample name replacement regex: {}".format(e))
+
+        return s_name
+
+
+class SampleIgnoreMatcher:
+    """
+    Matches sample names against config.sample_names_ignore globs and
+    config.sample_names_ignore_re regexes. Globs without wildcards are looked
+    up in a dict, other globs are combined into one regex, as are regexes
+    without groups or inline flags (others are checked one by one).
+    match() gives the first rule that matches a sample name.
+    """
+
+    def __init__(self, ignore_globs, ignore_regexes):
+        self.num_rules = len(ignore_globs) + len(ignore_regexes)
+        self.literal_globs = dict()
+        wildcard_globs = []
+        for i, pattern in enumerate(ignore_globs):
+            label = "sample_names_ignore: {}".format(pattern)
+            if any(c in pattern for c in "*?["):
+                wildcard_globs.append((i, label, fnmatch.translate(os.path.normcase(pattern))))
+            else:
+                self.literal_globs.setdefault(os.path.normcase(pattern), (i, label))
+        self.glob_regex, self.glob_labels = self._combine(wildcard_globs)
+
+        simple_regexes = []
+        self.other_regexes = []
+        for i, pattern in enumerate(ignore_regexes):
+            label = "sample_names_ignore_re: {}".format(pattern)
+            compiled = re.compile(pattern)
+            if compiled.groups == 0 and compiled.flags == re.compile("").flags:
+                simple_regexes.append((i, label, pattern))
+            else:
+                self.other_regexes.append((label, compiled))
+        self.regex, self.regex_labels = self._combine(simple_regexes)
+
+    @staticmethod
+    def _combine(patterns):
+        """
+        Combine (position, label, regex) into one regex with a named group
+        around each. Returns the regex and a dict of group name to (position, label)
+        """
+        if len(patterns) == 0:
+            return None, dict()
+        labels = {"r{}".format(n): (i, label) for n, (i, label, _) in enumerate(patterns)}
+        regex = "|".join("(?P<r{}>{})".format(n, pattern) for n, (_, _, pattern) in enumerate(patterns))
+        return re.compile(regex), labels
+
+    def match(self, s_name):
+        """Label of the first rule that matches a sample name, or None"""
+        if self.num_rules == 0:
+            return None
+        # Globs
+        if self.literal_globs or self.glob_regex is not None:
+            matches = []
+            name = os.path.normcase(s_name)
+            if name in self.literal_globs:
+                matches.append(self.literal_globs[name])
+            if self.glob_regex is not None:
+                m = self.glob_regex.match(name)
+                if m:
+                    matches.append(self.glob_labels[m.lastgroup])
+            if len(matches) > 0:
+                return min(matches)[1]
+        # Regexes
+        if self.regex is not None:
+            m = self.regex.match(s_name)
+            if m:
+                return self.regex_labels[m.lastgroup][1]
+        for label, compiled in self.other_regexes:
+            if compiled.match(s_name):
+                return label
+        return None
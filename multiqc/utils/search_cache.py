@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+""" MultiQC file search cache. Remembers which search patterns matched
+each file in previous runs, so that unchanged files don't need to be
+searched again. """
+
+
+import hashlib
+import json
+import os
+import sqlite3
+
+from . import config
+
+logger = config.logger
+
+
+def cache_path():
+    """Location of the search cache database"""
+    cache_dir = config.filesearch_cache_dir
+    if cache_dir is None:
+        cache_dir = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "multiqc")
+    return os.path.join(cache_dir, "search_cache.sqlite")
+
+
+def patterns_hash(spatterns):
+    """
+    Hash everything that can change the outcome of searching a single file:
+    the search patterns in use, the settings used to skip files and the
+    MultiQC version. Any change to these invalidates all cached results.
+    """
+    settings = {
+        "version": config.version,
+        "spatterns": spatterns,
+        "fn_ignore_files": config.fn_ignore_files,
+        "log_filesize_limit": config.log_filesize_limit,
+        "filesearch_lines_limit": config.filesearch_lines_limit,
+        "ignore_images": config.ignore_images,
+    }
+    settings_json = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha1(settings_json.encode("utf-8")).hexdigest()
+
+
+class SearchCache:
+    """
+    File search results, keyed on the absolute file path, file size and
+    modification time. Cached results for the current search patterns are
+    read into memory when created so that lookups are safe from several
+    threads. New results are collected and written back with save().
+    """
+
+    def __init__(self, spatterns, path=None):
+        self.path = path if path is not None else cache_path()
+        self.sp_hash = patterns_hash(spatterns)
+        self.entries = dict()
+        self.new_entries = list()
+        self.hits = 0
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with sqlite3.connect(self.path) as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS search_results "
+                    "(path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, sp_hash TEXT, result TEXT)"
+                )
+                rows = conn.execute(
+                    "SELECT path, size, mtime, result FROM search_results WHERE sp_hash = ?", (self.sp_hash,)
+                )
+                for path, size, mtime, result in rows:
+                    self.entries[path] = (size, mtime, result)
+            conn.close()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Could not load file search cache '{self.path}': {e}")
+            self.path = None
+        else:
+            logger.debug(f"Loaded {len(self.entries)} cached file search results from '{self.path}'")
+
+    def get(self, path, size, mtime):
+        """Return the cached search result for this file, or None if not found / out of date"""
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != size or entry[1] != mtime:
+            return None
+        self.hits += 1
+        return json.loads(entry[2])
+
+    def add(self, path, size, mtime, result):
+        """Remember a search result, to be written to disk with save()"""
+        self.new_entries.append((path, size, mtime, self.sp_hash, json.dumps(result)))
+
+    def save(self):
+        """Write new search results to the cache database"""
+        logger.debug(f"File search cache: {self.hits} hits, {len(self.new_entries)} new entries")
+        if self.path is None or len(self.new_entries) == 0:
+            return
+        try:
+            with sqlite3.connect(self.path) as conn:
+                conn.executemany("INSERT OR REPLACE INTO search_results VALUES (?, ?, ?, ?, ?)", self.new_entries)
+            conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not save file search cache '{self.path}': {e}")
+        self.new_entries = list()
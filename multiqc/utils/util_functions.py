@@ -3,12 +3,15 @@
 """ MultiQC Utility functions, used in a variety of places. """
 
 
+import functools
 import io
 import json
+import numbers
 import os
 import shutil
 import sys
 import time
+import zipfile
 
 import yaml
 
@@ -39,75 +42,165 @@ def robust_rmtree(path, logger=None, max_retries=10):
     shutil.rmtree(path)
 
 
+def copy_tree(src, dst):
+    """Copy the contents of a directory into another, overwriting existing files.
+    Replaces distutils.dir_util.copy_tree(), as distutils is slow to import.
+    """
+    for root, _, filenames in os.walk(src):
+        dest_dir = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(dest_dir, exist_ok=True)
+        for fn in filenames:
+            shutil.copyfile(os.path.join(root, fn), os.path.join(dest_dir, fn))
+
+
 def write_data_file(data, fn, sort_cols=False, data_format=None):
     """Write a data file to the report directory. Will not do anything
-    if config.data_dir is not set.
+    if config.data_dir is not set. The file is written as it is generated,
+    without building the whole output in memory first.
     :param: data - a 2D dict, first key sample name (row header),
             second key field (column header).
     :param: fn - Desired filename. Directory will be prepended automatically.
     :param: sort_cols - Sort columns alphabetically
     :param: data_format - Output format. Defaults to config.data_format (usually tsv)
-    :return: None"""
-
-    if config.data_dir is not None:
-        # Get data format from config
-        if data_format is None:
-            data_format = config.data_format
-
-        # JSON encoder class to handle lambda functions
-        class MQCJSONEncoder(json.JSONEncoder):
-            def default(self, obj):
-                if callable(obj):
-                    try:
-                        return obj(1)
-                    except:
-                        return None
-                return json.JSONEncoder.default(self, obj)
-
-        # Some metrics can't be coerced to tab-separated output, test and handle exceptions
-        if data_format not in ["json", "yaml"]:
-            # attempt to reshape data to tsv
+    :return: Number of bytes written, or None if no file was written"""
+
+    if config.data_dir is None:
+        return None
+
+    # Get data format from config
+    if data_format is None:
+        data_format = config.data_format
+
+    # JSON encoder class to handle lambda functions
+    class MQCJSONEncoder(json.JSONEncoder):
+        def default(self, obj):
+            if callable(obj):
+                try:
+                    return obj(1)
+                except:
+                    return None
+            return json.JSONEncoder.default(self, obj)
+
+    # Some metrics can't be coerced to tab-separated output, test and handle exceptions
+    str_data = None
+    cols = None
+    if data_format not in ["json", "yaml"] or config.data_columnar_format:
+        try:
+            # Convert keys to strings
+            str_data = {str(k): v for k, v in data.items()}
+            cols = data_file_columns(str_data)
+        except:
+            pass
+    if data_format not in ["json", "yaml"]:
+        if str_data is not None:
+            data = str_data
+        if cols is None:
+            data_format = "yaml"
+            config.logger.debug(f"{fn} could not be saved as tsv/csv. Falling back to YAML.")
+
+    # Add relevant file extension to filename, save file.
+    path = os.path.join(config.data_dir, "{}.{}".format(fn, config.data_format_extensions[data_format]))
+    table_error = False
+    with io.open(path, "w", encoding="utf-8", errors="ignore", buffering=1024 * 1024) as f:
+        if data_format == "json":
+            json.dump(data, f, indent=4, cls=MQCJSONEncoder, ensure_ascii=False)
+            f.write("\n")
+        elif data_format == "yaml":
+            yaml.dump(data, f, default_flow_style=False)
+        else:
+            # Default - tab separated output
+            h = ["Sample"] + cols
+            if sort_cols:
+                h = sorted(h)
             try:
-                # Convert keys to strings
-                data = {str(k): v for k, v in data.items()}
-                # Get all headers from the data, except if data is a dictionary (i.e. has >1 dimensions)
-                h = set()
-                for values in data.values():
-                    first_sub_value = next(iter(values))
-                    if isinstance(first_sub_value, dict):
-                        continue
-                    h |= values.keys()
-                h = [str(item) for item in h]
-
-                # Add Sample header in to first element
-                h.insert(0, "Sample")
-                if sort_cols:
-                    h = sorted(h)
-
-                # Get the rows
-                rows = ["\t".join(h)]
+                f.write("\t".join(h))
                 for sn in sorted(data.keys()):
                     # Make a list starting with the sample name, then each field in order of the header cols
-                    l = [str(sn)] + [str(data[sn].get(k, "")) for k in h[1:]]
-                    rows.append("\t".join(l))
-
-                body = "\n".join(rows)
-
+                    f.write("\n" + "\t".join([str(sn)] + [str(data[sn].get(k, "")) for k in h[1:]]))
+                f.write("\n")
             except:
-                data_format = "yaml"
-                config.logger.debug(f"{fn} could not be saved as tsv/csv. Falling back to YAML.")
-
-        # Add relevant file extension to filename, save file.
-        fn = "{}.{}".format(fn, config.data_format_extensions[data_format])
-        with io.open(os.path.join(config.data_dir, fn), "w", encoding="utf-8") as f:
-            if data_format == "json":
-                jsonstr = json.dumps(data, indent=4, cls=MQCJSONEncoder, ensure_ascii=False)
-                print(jsonstr.encode("utf-8", "ignore").decode("utf-8"), file=f)
-            elif data_format == "yaml":
-                yaml.dump(data, f, default_flow_style=False)
-            else:
-                # Default - tab separated output
-                print(body.encode("utf-8", "ignore").decode("utf-8"), file=f)
+                table_error = True
+    if table_error:
+        # Some rows can't be written as a table, write the whole file again as YAML
+        os.remove(path)
+        config.logger.debug(f"{fn} could not be saved as tsv/csv. Falling back to YAML.")
+        return write_data_file(data, fn, sort_cols, "yaml")
+    num_bytes = os.path.getsize(path)
+    config.logger.debug(f"Wrote data file '{os.path.basename(path)}' ({num_bytes:,} bytes)")
+
+    # Optional copy of tables in a columnar format for downstream pipelines
+    if config.data_columnar_format and cols is not None and len(cols) > 0:
+        try:
+            write_columnar_data_file(str_data, cols, fn, config.data_columnar_format)
+        except Exception as e:
+            config.logger.debug(f"{fn} could not be saved as {config.data_columnar_format}: {e}")
+    return num_bytes
+
+
+def data_file_columns(data):
+    """Column headers for writing a 2D dict as a table, not including the sample name.
+    Raises an exception if the data can't be written as a table"""
+    # Get all headers from the data, except if data is a dictionary (i.e. has >1 dimensions)
+    h = set()
+    for values in data.values():
+        first_sub_value = next(iter(values))
+        if isinstance(first_sub_value, dict):
+            continue
+        h |= values.keys()
+    return [str(item) for item in h]
+
+
+@functools.lru_cache()
+def _pyarrow():
+    """Import pyarrow, which is an optional dependency. Returns None if not installed"""
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError:
+        config.logger.warning("pyarrow is not installed, saving columnar data files in NumPy .npz format instead")
+        return None
+    return pyarrow
+
+
+def write_columnar_data_file(data, cols, fn, columnar_format):
+    """Write a table to the report directory in a columnar binary format: Parquet or
+    Arrow IPC (requires pyarrow), or NumPy .npz. Columns where all values are numbers
+    are saved as floats, others as strings. Missing values are null (NaN or an empty
+    string in .npz files). Returns the number of bytes written"""
+    import numpy as np
+
+    if columnar_format in ["parquet", "arrow"] and _pyarrow() is None:
+        columnar_format = "npz"
+    samples = sorted(data.keys())
+    columns = {"Sample": samples}
+    for col in cols:
+        values = [data[sn].get(col) for sn in samples]
+        if all(isinstance(v, numbers.Real) and not isinstance(v, bool) for v in values if v is not None):
+            columns[col] = [None if v is None else float(v) for v in values]
+        else:
+            columns[col] = [None if v is None else str(v) for v in values]
+
+    path = os.path.join(config.data_dir, "{}.{}".format(fn, columnar_format))
+    if columnar_format == "npz":
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for col, values in columns.items():
+                if all(isinstance(v, float) for v in values if v is not None):
+                    arr = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+                else:
+                    arr = np.array(["" if v is None else v for v in values], dtype=str)
+                with zf.open(col + ".npy", "w", force_zip64=True) as fh:
+                    np.lib.format.write_array(fh, arr, allow_pickle=False)
+    else:
+        pa = _pyarrow()
+        table = pa.table(columns)
+        if columnar_format == "parquet":
+            pa.parquet.write_table(table, path)
+        else:
+            pa.feather.write_feather(table, path, compression="uncompressed")
+    num_bytes = os.path.getsize(path)
+    config.logger.debug(f"Wrote data file '{os.path.basename(path)}' ({num_bytes:,} bytes)")
+    return num_bytes
 
 
 def view_all_tags(ctx, param, value):
@@ -140,3 +233,23 @@ def force_term_colors():
     if os.getenv("GITHUB_ACTIONS") or os.getenv("FORCE_COLOR") or os.getenv("PY_COLORS"):
         return True
     return None
+
+
+def iter_lines(fh):
+    """
+    Iterate over the lines of a file opened in binary mode, without reading
+    the whole file into memory. Lines end with \\n, \\r\\n or \\r, as when reading a
+    file in text mode, and the line endings are removed.
+    Lines are decoded as UTF-8, falling back to latin-1 for any that are not valid UTF-8.
+    """
+    for line in fh:
+        if line.endswith(b"\n"):
+            line = line[:-1]
+        if line.endswith(b"\r"):
+            line = line[:-1]
+        # Lines ending with \r only (old Mac files) all come in one piece
+        for part in line.split(b"\r") if b"\r" in line else [line]:
+            try:
+                yield part.decode("utf-8")
+            except UnicodeDecodeError:
+                yield part.decode("latin-1")
@@ -0,0 +1,514 @@
+#!/usr/bin/env python
+
+"""
+MultiQC benchmark. Generates a synthetic project with log files for a number
+of common tools, runs MultiQC on it and records how long each phase of the
+run took, plus peak memory usage. Results are written as JSON so that they
+can be compared between MultiQC versions to catch performance regressions.
+
+Usage:
+    python test/benchmark.py --samples 500 --repeats 3 --output benchmark.json
+
+Any arguments after -- are passed on to MultiQC, for example:
+    python test/benchmark.py --samples 500 -- --module-workers 4
+
+The time taken to import MultiQC and to run `multiqc --version` is also
+recorded. To only check these, failing if importing takes too long:
+    python test/benchmark.py --startup-only --max-import-time 0.5
+"""
+
+
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+TOOLS = ["fastqc", "picard", "samtools", "mosdepth", "kraken"]
+
+FASTQC_READ_LENGTH = 150
+KRAKEN_TAXA = [
+    ("D", "2", "Bacteria"),
+    ("P", "1224", "Proteobacteria"),
+    ("C", "1236", "Gammaproteobacteria"),
+    ("O", "91347", "Enterobacterales"),
+    ("F", "543", "Enterobacteriaceae"),
+    ("G", "561", "Escherichia"),
+    ("S", "562", "Escherichia coli"),
+    ("G", "590", "Salmonella"),
+    ("S", "28901", "Salmonella enterica"),
+    ("P", "1239", "Firmicutes"),
+    ("C", "91061", "Bacilli"),
+    ("O", "1385", "Bacillales"),
+    ("F", "186817", "Bacillaceae"),
+    ("G", "1386", "Bacillus"),
+    ("S", "1423", "Bacillus subtilis"),
+    ("D", "2759", "Eukaryota"),
+    ("K", "33208", "Metazoa"),
+    ("P", "7711", "Chordata"),
+    ("C", "40674", "Mammalia"),
+    ("O", "9443", "Primates"),
+    ("F", "9604", "Hominidae"),
+    ("G", "9605", "Homo"),
+    ("S", "9606", "Homo sapiens"),
+]
+
+
+def fastqc_data(s_name, rng):
+    """Contents of a fastqc_data.txt file"""
+    total = rng.randint(1000000, 50000000)
+    gc = rng.randint(38, 52)
+    lines = [
+        "##FastQC\t0.11.9",
+        ">>Basic Statistics\tpass",
+        "#Measure\tValue",
+        f"Filename\t{s_name}.fastq.gz",
+        "File type\tConventional base calls",
+        "Encoding\tSanger / Illumina 1.9",
+        f"Total Sequences\t{total}",
+        "Sequences flagged as poor quality\t0",
+        f"Sequence length\t{FASTQC_READ_LENGTH}",
+        f"%GC\t{gc}",
+        ">>END_MODULE",
+        ">>Per base sequence quality\tpass",
+        "#Base\tMean\tMedian\tLower Quartile\tUpper Quartile\t10th Percentile\t90th Percentile",
+    ]
+    for base in range(1, FASTQC_READ_LENGTH + 1):
+        mean = 36 - 6 * base / FASTQC_READ_LENGTH + rng.random()
+        lines.append(f"{base}\t{mean:.2f}\t{int(mean)}.0\t{int(mean) - 3}.0\t{int(mean) + 1}.0\t{int(mean) - 8}.0\t38.0")
+    lines += [">>END_MODULE", ">>Per sequence quality scores\tpass", "#Quality\tCount"]
+    for qual in range(2, 41):
+        lines.append(f"{qual}\t{total * (qual ** 3) / 700000:.1f}")
+    lines += [
+        ">>END_MODULE",
+        ">>Per base sequence content\twarn",
+        "#Base\tG\tA\tT\tC",
+    ]
+    for base in range(1, FASTQC_READ_LENGTH + 1):
+        g = gc / 2 + rng.uniform(-2, 2)
+        a = (100 - gc) / 2 + rng.uniform(-2, 2)
+        t = (100 - gc) / 2 + rng.uniform(-2, 2)
+        lines.append(f"{base}\t{g:.4f}\t{a:.4f}\t{t:.4f}\t{100 - g - a - t:.4f}")
+    lines += [">>END_MODULE", ">>Per sequence GC content\tpass", "#GC Content\tCount"]
+    for pct in range(0, 101):
+        lines.append(f"{pct}\t{total * 2.71828 ** (-((pct - gc) ** 2) / 100) / 18:.1f}")
+    lines += [">>END_MODULE", ">>Per base N content\tpass", "#Base\tN-Count"]
+    for base in range(1, FASTQC_READ_LENGTH + 1):
+        lines.append(f"{base}\t{rng.random() / 100:.6f}")
+    lines += [
+        ">>END_MODULE",
+        ">>Sequence Length Distribution\tpass",
+        "#Length\tCount",
+        f"{FASTQC_READ_LENGTH}\t{total}.0",
+        ">>END_MODULE",
+        ">>Sequence Duplication Levels\tpass",
+        f"#Total Deduplicated Percentage\t{rng.uniform(40, 95):.4f}",
+        "#Duplication Level\tPercentage of deduplicated\tPercentage of total",
+    ]
+    for level in ["1", "2", "3", "4", "5", "6", "7", "8", "9", ">10", ">50", ">100", ">500", ">1k", ">5k", ">10k+"]:
+        lines.append(f"{level}\t{rng.uniform(0, 10):.4f}\t{rng.uniform(0, 10):.4f}")
+    lines.append(">>END_MODULE")
+    # FastQC only writes a header when there are overrepresented sequences
+    num_overrepresented = rng.randint(0, 10)
+    if num_overrepresented == 0:
+        lines.append(">>Overrepresented sequences\tpass")
+    else:
+        lines += [">>Overrepresented sequences\twarn", "#Sequence\tCount\tPercentage\tPossible Source"]
+    for _ in range(num_overrepresented):
+        seq = "".join(rng.choice("ACGT") for _ in range(50))
+        count = rng.randint(1000, 100000)
+        lines.append(f"{seq}\t{count}\t{100 * count / total:.4f}\tNo Hit")
+    lines += [">>END_MODULE", ">>Adapter Content\tpass"]
+    adapters = ["Illumina Universal Adapter", "Illumina Small RNA 3' Adapter", "Nextera Transposase Sequence"]
+    lines.append("\t".join(["#Position"] + adapters))
+    for base in range(1, FASTQC_READ_LENGTH + 1):
+        lines.append("\t".join([str(base)] + [f"{base * rng.random() / 100:.4f}" for _ in adapters]))
+    lines.append(">>END_MODULE")
+    return "\n".join(lines) + "\n"
+
+
+def picard_markdups(s_name, rng):
+    """Contents of a Picard MarkDuplicates metrics file"""
+    pairs = rng.randint(1000000, 20000000)
+    dups = int(pairs * rng.uniform(0.05, 0.4))
+    lines = [
+        "## htsjdk.samtools.metrics.StringHeader",
+        f"# MarkDuplicates INPUT=[{s_name}.bam] OUTPUT={s_name}.dedup.bam METRICS_FILE={s_name}.markdups.txt",
+        "## htsjdk.samtools.metrics.StringHeader",
+        "# Started on: Mon Jan 01 00:00:00 UTC 2024",
+        "",
+        "## METRICS CLASS\tpicard.sam.DuplicationMetrics",
+        "LIBRARY\tUNPAIRED_READS_EXAMINED\tREAD_PAIRS_EXAMINED\tSECONDARY_OR_SUPPLEMENTARY_RDS\tUNMAPPED_READS\t"
+        "UNPAIRED_READ_DUPLICATES\tREAD_PAIR_DUPLICATES\tREAD_PAIR_OPTICAL_DUPLICATES\tPERCENT_DUPLICATION\t"
+        "ESTIMATED_LIBRARY_SIZE",
+        f"{s_name}\t{rng.randint(0, 10000)}\t{pairs}\t0\t{rng.randint(0, 100000)}\t{rng.randint(0, 5000)}\t"
+        f"{dups}\t{dups // 100}\t{dups / pairs:.6f}\t{pairs * 5}",
+        "",
+        "## HISTOGRAM\tjava.lang.Double",
+        "BIN\tCoverageMult\tall_sets\tnon_optical_sets",
+    ]
+    for i in range(1, 101):
+        lines.append(f"{i}.0\t{i * 0.9:.6f}\t{i * 0.1:.6f}\t{i * 0.1:.6f}")
+    return "\n".join(lines) + "\n"
+
+
+def picard_insertsize(s_name, rng):
+    """Contents of a Picard CollectInsertSizeMetrics file"""
+    median = rng.randint(200, 400)
+    lines = [
+        "## htsjdk.samtools.metrics.StringHeader",
+        f"# CollectInsertSizeMetrics INPUT={s_name}.bam OUTPUT={s_name}.insert_size.txt HISTOGRAM_FILE=hist.pdf",
+        "## htsjdk.samtools.metrics.StringHeader",
+        "# Started on: Mon Jan 01 00:00:00 UTC 2024",
+        "",
+        "## METRICS CLASS\tpicard.analysis.InsertSizeMetrics",
+        "MEDIAN_INSERT_SIZE\tMODE_INSERT_SIZE\tMEDIAN_ABSOLUTE_DEVIATION\tMIN_INSERT_SIZE\tMAX_INSERT_SIZE\t"
+        "MEAN_INSERT_SIZE\tSTANDARD_DEVIATION\tREAD_PAIRS\tPAIR_ORIENTATION\tSAMPLE\tLIBRARY\tREAD_GROUP",
+        f"{median}\t{median - 5}\t40\t20\t1000\t{median + 4.5}\t{rng.uniform(50, 90):.4f}\t"
+        f"{rng.randint(1000000, 20000000)}\tFR\t\t\t",
+        "",
+        "## HISTOGRAM\tjava.lang.Integer",
+        "insert_size\tAll_Reads.fr_count",
+    ]
+    for size in range(20, 1001):
+        lines.append(f"{size}\t{int(100000 * 2.71828 ** (-((size - median) ** 2) / 8000))}")
+    return "\n".join(lines) + "\n"
+
+
+def samtools_stats(s_name, rng):
+    """Contents of a samtools stats file"""
+    total = rng.randint(1000000, 50000000)
+    mapped = int(total * rng.uniform(0.8, 0.99))
+    lines = [
+        "# This file was produced by samtools stats (1.15.1+htslib-1.15.1) and can be plotted using plot-bamstats",
+        f"# The command line was:  stats {s_name}.bam",
+        f"SN\traw total sequences:\t{total}",
+        "SN\tfiltered sequences:\t0",
+        f"SN\tsequences:\t{total}",
+        "SN\tis sorted:\t1",
+        f"SN\t1st fragments:\t{total // 2}",
+        f"SN\tlast fragments:\t{total // 2}",
+        f"SN\treads mapped:\t{mapped}",
+        f"SN\treads mapped and paired:\t{mapped - 1000}",
+        f"SN\treads unmapped:\t{total - mapped}",
+        f"SN\treads properly paired:\t{mapped - 5000}",
+        f"SN\treads paired:\t{total}",
+        f"SN\treads duplicated:\t{int(total * rng.uniform(0.05, 0.3))}",
+        f"SN\treads MQ0:\t{rng.randint(0, 100000)}",
+        "SN\treads QC failed:\t0",
+        "SN\tnon-primary alignments:\t0",
+        f"SN\ttotal length:\t{total * 150}",
+        f"SN\tbases mapped:\t{mapped * 150}",
+        f"SN\tbases mapped (cigar):\t{mapped * 148}",
+        f"SN\tmismatches:\t{mapped // 10}",
+        f"SN\terror rate:\t{rng.uniform(0.001, 0.01):.6e}",
+        "SN\taverage length:\t150",
+        "SN\tmaximum length:\t150",
+        "SN\taverage quality:\t36.0",
+        f"SN\tinsert size average:\t{rng.uniform(250, 350):.1f}",
+        f"SN\tinsert size standard deviation:\t{rng.uniform(50, 90):.1f}",
+        "SN\tinward oriented pairs:\t100000",
+        "SN\toutward oriented pairs:\t1000",
+        "SN\tpairs with other orientation:\t100",
+        "SN\tpairs on different chromosomes:\t1000",
+    ]
+    # Other sections, not parsed but make the file a realistic size to search
+    for cov in range(1, 1001):
+        lines.append(f"COV\t[{cov}-{cov}]\t{cov}\t{rng.randint(0, 100000)}")
+    for gc in range(0, 101):
+        lines.append(f"GCD\t{gc}.0\t{gc / 100:.3f}\t1.0\t1.0\t1.0\t1.0\t1.0")
+    return "\n".join(lines) + "\n"
+
+
+def mosdepth_files(s_name, rng):
+    """Contents of mosdepth global distribution and summary files"""
+    contigs = [f"chr{c}" for c in list(range(1, 23)) + ["X", "Y"]]
+    mean_cov = rng.uniform(10, 60)
+    dist_lines = []
+    summary_lines = ["chrom\tlength\tbases\tmean\tmin\tmax"]
+    for contig in contigs + ["total"]:
+        max_cov = int(mean_cov * 3)
+        for cov in range(max_cov, -1, -1):
+            frac = min(1.0, 1.0 / (1 + 2.71828 ** ((cov - mean_cov) / 4)))
+            dist_lines.append(f"{contig}\t{cov}\t{frac:.2f}")
+        length = rng.randint(50000000, 250000000)
+        summary_lines.append(f"{contig}\t{length}\t{int(length * mean_cov)}\t{mean_cov:.2f}\t0\t{max_cov}")
+    return "\n".join(dist_lines) + "\n", "\n".join(summary_lines) + "\n"
+
+
+def kraken_report(s_name, rng):
+    """Contents of a Kraken report"""
+    total = rng.randint(100000, 10000000)
+    unclassified = int(total * rng.uniform(0.01, 0.3))
+    lines = [f"{100 * unclassified / total:6.2f}\t{unclassified}\t{unclassified}\tU\t0\tunclassified"]
+    classified = total - unclassified
+    lines.append(f"{100 * classified / total:6.2f}\t{classified}\t0\tR\t1\troot")
+    remaining = classified
+    for depth, (rank, taxid, name) in enumerate(KRAKEN_TAXA):
+        count = int(remaining * rng.uniform(0.1, 0.6))
+        indent = "  " * (depth % 8 + 1)
+        lines.append(f"{100 * count / total:6.2f}\t{count}\t{count // 2}\t{rank}\t{taxid}\t{indent}{name}")
+    return "\n".join(lines) + "\n"
+
+
+def write_project(project_dir, num_samples, tools, seed):
+    """Write synthetic log files for every sample. Returns the number of files written."""
+    rng = random.Random(seed)
+    num_files = 0
+    for i in range(1, num_samples + 1):
+        s_name = f"sample_{i:05d}"
+        sample_dir = os.path.join(project_dir, s_name)
+        os.makedirs(sample_dir)
+        outputs = dict()
+        if "picard" in tools:
+            outputs[f"{s_name}.markdups.txt"] = picard_markdups(s_name, rng)
+            outputs[f"{s_name}.insert_size.txt"] = picard_insertsize(s_name, rng)
+        if "samtools" in tools:
+            outputs[f"{s_name}.stats"] = samtools_stats(s_name, rng)
+        if "mosdepth" in tools:
+            dist, summary = mosdepth_files(s_name, rng)
+            outputs[f"{s_name}.mosdepth.global.dist.txt"] = dist
+            outputs[f"{s_name}.mosdepth.summary.txt"] = summary
+        if "kraken" in tools:
+            outputs[f"{s_name}.kraken2.report.txt"] = kraken_report(s_name, rng)
+        for fn, contents in outputs.items():
+            with io.open(os.path.join(sample_dir, fn), "w") as fh:
+                fh.write(contents)
+        if "fastqc" in tools:
+            for read in ["R1", "R2"]:
+                fq_name = f"{s_name}_{read}"
+                zip_fn = os.path.join(sample_dir, f"{fq_name}_fastqc.zip")
+                with zipfile.ZipFile(zip_fn, "w", zipfile.ZIP_DEFLATED) as zfh:
+                    # MultiQC expects the report directory to be the first entry
+                    zfh.writestr(f"{fq_name}_fastqc/", "")
+                    zfh.writestr(f"{fq_name}_fastqc/fastqc_data.txt", fastqc_data(fq_name, rng))
+                    zfh.writestr(f"{fq_name}_fastqc/summary.txt", f"PASS\tBasic Statistics\t{fq_name}.fastq.gz\n")
+                outputs[zip_fn] = None
+        num_files += len(outputs)
+    return num_files
+
+
+def peak_memory_mb(who="RUSAGE_SELF"):
+    """
+    Peak memory (resident set size) in MB, of this process or with RUSAGE_CHILDREN
+    of the largest child process (such as module workers). None if not available.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(getattr(resource, who)).ru_maxrss
+    # Reported in bytes on macOS, kilobytes elsewhere
+    if sys.platform == "darwin":
+        return maxrss / 1024 / 1024
+    return maxrss / 1024
+
+
+def run_child(project_dir, out_dir, multiqc_args):
+    """Run MultiQC in this process and print the timings as JSON"""
+    start = time.time()
+    from multiqc.multiqc import run_cli
+    from multiqc.utils import report
+
+    import_time = time.time() - start
+    try:
+        run_cli.main(
+            args=[project_dir, "--outdir", out_dir, "--force", "--quiet", "--no-ansi"] + multiqc_args,
+            standalone_mode=False,
+        )
+    except SystemExit as e:
+        if e.code:
+            raise
+    results = {
+        "wall_time": time.time() - start,
+        "import_time": import_time,
+        "peak_memory_mb": peak_memory_mb(),
+        "peak_memory_workers_mb": peak_memory_mb("RUSAGE_CHILDREN"),
+        "num_samples_found": {
+            mod: len({s_name for section in sections.values() for s_name in section})
+            for mod, sections in report.data_sources.items()
+        },
+        "runtimes": report.runtimes,
+    }
+    report_fn = os.path.join(out_dir, "multiqc_report.html")
+    if os.path.exists(report_fn):
+        results["report_size_mb"] = os.path.getsize(report_fn) / 1024 / 1024
+    print(json.dumps(results))
+
+
+def startup_times(repeats):
+    """Time importing MultiQC and running 'multiqc --version', each in a new Python process"""
+    commands = {
+        "import": [sys.executable, "-c", "import multiqc"],
+        "version": [sys.executable, "-m", "multiqc", "--version"],
+    }
+    times = {name: [] for name in commands}
+    for _ in range(repeats):
+        for name, cmd in commands.items():
+            start = time.time()
+            subprocess.run(cmd, stdout=subprocess.DEVNULL, check=True)
+            times[name].append(time.time() - start)
+    return times
+
+
+def summarise(runs):
+    """Min / mean / max of each timing over all repeats"""
+    values = dict()
+
+    def add(key, value):
+        if isinstance(value, (int, float)):
+            values.setdefault(key, []).append(value)
+
+    for run in runs:
+        for key in ["wall_time", "import_time", "peak_memory_mb", "peak_memory_workers_mb", "report_size_mb"]:
+            add(key, run.get(key))
+        for key, value in run["runtimes"].items():
+            if isinstance(value, dict):
+                for subkey, subvalue in value.items():
+                    add(f"{key}/{subkey}", subvalue)
+            else:
+                add(key, value)
+    return {
+        key: {"min": min(vals), "mean": sum(vals) / len(vals), "max": max(vals)} for key, vals in values.items()
+    }
+
+
+def git_hash():
+    try:
+        repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=repo_dir, stderr=subprocess.DEVNULL, universal_newlines=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=100, help="Number of samples to generate (default: 100)")
+    parser.add_argument(
+        "--tools",
+        default=",".join(TOOLS),
+        help="Comma-separated tools to generate logs for (default: {})".format(",".join(TOOLS)),
+    )
+    parser.add_argument("--repeats", type=int, default=1, help="Number of times to run MultiQC (default: 1)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the synthetic data (default: 1)")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--data-dir", help="Generate the project here and keep it, or reuse it if it exists")
+    parser.add_argument("--startup-only", action="store_true", help="Only time importing MultiQC and --version")
+    parser.add_argument(
+        "--max-import-time",
+        type=float,
+        help="Exit with an error if importing MultiQC takes longer than this many seconds (fastest repeat)",
+    )
+    parser.add_argument("--child", nargs=2, metavar=("PROJECT_DIR", "OUT_DIR"), help=argparse.SUPPRESS)
+    parser.add_argument("multiqc_args", nargs="*", help="Extra arguments for MultiQC, after --")
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.multiqc_args)
+        return
+
+    tools = [t.strip() for t in args.tools.split(",") if t.strip()]
+    unknown = set(tools) - set(TOOLS)
+    if unknown:
+        parser.error("Unknown tools: {}".format(", ".join(sorted(unknown))))
+
+    startup = startup_times(max(args.repeats, 3))
+    print(
+        "Startup: {:.2f}s import, {:.2f}s --version (fastest of {})".format(
+            min(startup["import"]), min(startup["version"]), len(startup["import"])
+        ),
+        file=sys.stderr,
+    )
+
+    runs = []
+    num_files = None
+    if not args.startup_only:
+        tmp_dir = tempfile.mkdtemp(prefix="multiqc_benchmark_")
+        try:
+            project_dir = args.data_dir or os.path.join(tmp_dir, "project")
+            if os.path.isdir(project_dir):
+                print(f"Using existing project in {project_dir}", file=sys.stderr)
+                num_files = sum(len(fns) for _, _, fns in os.walk(project_dir))
+            else:
+                print(f"Generating {args.samples} samples in {project_dir}", file=sys.stderr)
+                start = time.time()
+                num_files = write_project(project_dir, args.samples, tools, args.seed)
+                print(f"Wrote {num_files} files in {time.time() - start:.1f}s", file=sys.stderr)
+
+            for i in range(args.repeats):
+                out_dir = os.path.join(tmp_dir, f"output_{i}")
+                # Run in a new process so that every repeat has a cold start and its own peak memory
+                cmd = [sys.executable, os.path.abspath(__file__), "--child", project_dir, out_dir, "--"]
+                proc = subprocess.run(cmd + args.multiqc_args, stdout=subprocess.PIPE, universal_newlines=True)
+                if proc.returncode != 0:
+                    sys.exit(f"MultiQC failed with exit code {proc.returncode}")
+                run = json.loads(proc.stdout.strip().splitlines()[-1])
+                runs.append(run)
+                shutil.rmtree(out_dir, ignore_errors=True)
+                print(
+                    "Run {}: {:.2f}s total, {:.2f}s search, {:.2f}s modules, {:.2f}s compression, {:.2f}s render, "
+                    "{} MB peak memory".format(
+                        i + 1,
+                        run["runtimes"]["total"],
+                        run["runtimes"]["total_sp"],
+                        run["runtimes"]["total_mods"],
+                        run["runtimes"]["total_compression"],
+                        run["runtimes"]["total_render"],
+                        "?" if run["peak_memory_mb"] is None else round(run["peak_memory_mb"]),
+                    ),
+                    file=sys.stderr,
+                )
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    import multiqc
+
+    results = {
+        "meta": {
+            "multiqc_version": multiqc.__version__,
+            "git_hash": git_hash(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "date": datetime.datetime.now().isoformat(),
+        },
+        "params": {
+            "samples": args.samples,
+            "tools": tools,
+            "seed": args.seed,
+            "num_files": num_files,
+            "multiqc_args": args.multiqc_args,
+        },
+        "startup": {
+            name: {"min": min(vals), "mean": sum(vals) / len(vals), "max": max(vals)} for name, vals in startup.items()
+        },
+        "summary": summarise(runs),
+        "runs": runs,
+    }
+    if args.output:
+        with io.open(args.output, "w") as fh:
+            json.dump(results, fh, indent=4)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(results, indent=4))
+
+    if args.max_import_time is not None and min(startup["import"]) > args.max_import_time:
+        sys.exit(
+            "Importing MultiQC took {:.2f}s, more than the limit of {:.2f}s".format(
+                min(startup["import"]), args.max_import_time
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()